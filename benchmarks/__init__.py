@@ -0,0 +1 @@
+"""End-to-end benchmarks of the target against an in-process HubSpot stand-in."""
@@ -0,0 +1,162 @@
+"""Faults the HubSpot stand-in injects: rate limiting, error bursts, connection resets and latency."""
+
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+# fault profiles by name, see FaultInjector for the options
+PRESETS = {
+    "none": {},
+    # the limits of a private app on a Professional portal
+    "rate_limited": {"rate_limit": {"max": 190, "interval_ms": 10000, "secondly": 19}},
+    "throttle_bursts": {"throttle_bursts": {"every_s": 10, "duration_s": 2, "retry_after_s": 1}},
+    "flaky": {"errors": {"status": 502, "rate": 0.05}, "resets": {"rate": 0.01}},
+    "outage": {"error_bursts": {"status": 503, "start_s": 2, "duration_s": 15}},
+    "slow": {"latency": {"distribution": "lognormal", "median_ms": 80, "sigma": 1.0}, "slow": {"rate": 0.01, "ms": 5000}},
+    "mixed": {
+        "rate_limit": {"max": 190, "interval_ms": 10000, "secondly": 19},
+        "errors": {"status": 502, "rate": 0.02},
+        "error_bursts": {"status": 503, "start_s": 5, "every_s": 30, "duration_s": 3},
+        "resets": {"rate": 0.005},
+        "latency": {"distribution": "lognormal", "median_ms": 40, "sigma": 0.5},
+    },
+}
+
+
+def load_profile(value):
+    """A fault profile from a preset name, a JSON file or a JSON string."""
+    if value in PRESETS:
+        return PRESETS[value]
+    if os.path.exists(value):
+        with open(value) as infile:
+            return json.load(infile)
+    return json.loads(value)
+
+
+class FaultInjector:
+    """
+    Decides the fate of each request sent to the stand-in, from a profile of:
+
+    - `rate_limit`: `max` requests per `interval_ms` and `secondly` requests per
+      second (`search_secondly` for the search API), enforced in fixed windows.
+      Responses carry the `X-HubSpot-RateLimit-*` headers and requests over a
+      limit get a 429.
+    - `throttle_bursts`: every `every_s` seconds, `duration_s` seconds of 429s
+      with a `Retry-After` of `retry_after_s`.
+    - `errors`: a `status` (default 502) returned at random to `rate` of the requests.
+    - `error_bursts`: `duration_s` seconds of `status` (default 503) from `start_s`
+      seconds into the run, repeated every `every_s` seconds when given.
+    - `resets`: `rate` of the connections reset without a response.
+    - `latency`: `constant` (`ms`), `uniform` (`min_ms`, `max_ms`) or `lognormal`
+      (`median_ms`, `sigma`) response times.
+    - `slow`: `rate` of the responses delayed by `ms` more.
+
+    Times are counted from the first request. Faults are counted by kind in `injected`.
+    """
+
+    def __init__(self, profile, seed=None) -> None:
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.injected = Counter()
+        self.started_at = None
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        now = time.monotonic()
+        if self.started_at is None:
+            self.started_at = now
+        return now - self.started_at
+
+    def latency(self):
+        """Seconds to wait before answering a request."""
+        latency = self.profile.get("latency") or {}
+        distribution = latency.get("distribution", "constant")
+        with self._lock:
+            if distribution == "uniform":
+                seconds = self.random.uniform(latency.get("min_ms", 0), latency.get("max_ms", 0)) / 1000
+            elif distribution == "lognormal":
+                seconds = self.random.lognormvariate(math.log(latency.get("median_ms", 1)), latency.get("sigma", 0.5)) / 1000
+            else:
+                seconds = latency.get("ms", 0) / 1000
+            slow = self.profile.get("slow")
+            if slow and self.random.random() < slow.get("rate", 0):
+                self.injected["slow"] += 1
+                seconds += slow.get("ms", 0) / 1000
+        return seconds
+
+    def fault(self, path):
+        """
+        Rate limit headers of the response, plus the fault to answer with instead of
+        handling the request: `(status, body)`, `"reset"`, or None for no fault.
+        """
+        with self._lock:
+            elapsed = self.elapsed()
+            headers = {}
+            fault = None
+
+            bursts = self.profile.get("throttle_bursts")
+            if bursts and elapsed % bursts["every_s"] < bursts["duration_s"]:
+                headers["Retry-After"] = str(bursts.get("retry_after_s", 1))
+                fault = (429, {"status": "error", "message": "You have reached your ten secondly limit.", "errorType": "RATE_LIMIT", "policyName": "TEN_SECONDLY_ROLLING"})
+
+            limits = self.profile.get("rate_limit")
+            if limits and fault is None:
+                fault = self._rate_limit(limits, path, elapsed, headers)
+
+            outage = self.profile.get("error_bursts")
+            if outage and fault is None:
+                since_start = elapsed - outage.get("start_s", 0)
+                if since_start >= 0 and (since_start % outage["every_s"] if outage.get("every_s") else since_start) < outage["duration_s"]:
+                    fault = self._error(outage.get("status", 503))
+
+            errors = self.profile.get("errors")
+            if errors and fault is None and self.random.random() < errors.get("rate", 0):
+                fault = self._error(errors.get("status", 502))
+
+            resets = self.profile.get("resets")
+            if resets and fault is None and self.random.random() < resets.get("rate", 0):
+                fault = "reset"
+
+            if fault is not None:
+                self.injected["reset" if fault == "reset" else str(fault[0])] += 1
+            return headers, fault
+
+    def _error(self, status):
+        return status, {"status": "error", "message": f"Injected {status}", "category": "INTERNAL_ERROR"}
+
+    def _rate_limit(self, limits, path, elapsed, headers):
+        if path.endswith("/search"):
+            # the search API is limited per second and sends no headers
+            if not self._take("search", 1.0, limits.get("search_secondly", 5)):
+                return 429, {"status": "error", "message": "You have reached your secondly limit.", "errorType": "RATE_LIMIT", "policyName": "SECONDLY"}
+            return None
+
+        interval = limits.get("interval_ms", 10000)
+        maximum, secondly = limits.get("max"), limits.get("secondly")
+        fault = None
+        if maximum and not self._take("interval", interval / 1000, maximum):
+            fault = 429, {"status": "error", "message": "You have reached your ten secondly limit.", "errorType": "RATE_LIMIT", "policyName": "TEN_SECONDLY_ROLLING"}
+        if secondly and not self._take("secondly", 1.0, secondly) and fault is None:
+            fault = 429, {"status": "error", "message": "You have reached your secondly limit.", "errorType": "RATE_LIMIT", "policyName": "SECONDLY"}
+        if maximum:
+            headers["X-HubSpot-RateLimit-Max"] = str(maximum)
+            headers["X-HubSpot-RateLimit-Interval-Milliseconds"] = str(interval)
+            headers["X-HubSpot-RateLimit-Remaining"] = str(max(0, maximum - self._windows["interval"][1]))
+        if secondly:
+            headers["X-HubSpot-RateLimit-Secondly"] = str(secondly)
+            headers["X-HubSpot-RateLimit-Secondly-Remaining"] = str(max(0, secondly - self._windows["secondly"][1]))
+        return fault
+
+    def _take(self, name, seconds, limit):
+        """Count a request in the current window of `name`, False when it is over `limit`."""
+        window = int(self.elapsed() // seconds)
+        start, count = self._windows.get(name, (window, 0))
+        if start != window:
+            count = 0
+        self._windows[name] = (window, count + 1)
+        return count < limit
@@ -0,0 +1,247 @@
+"""
+End-to-end throughput benchmarks of the target against the HubSpot stand-in.
+
+Each scenario writes generated records through `TargetHubspotv4` in a child
+process, so its peak RSS is the target's own, while the stand-in answers in this
+process and counts the API calls. Reports records/sec, API calls per record and
+peak RSS, and fails when the calls per record exceed those of a baseline.
+
+With `--faults` the stand-in injects rate limiting, error bursts, connection
+resets or slow responses (see `benchmarks.faults`), and the results count the
+requests wasted on injected faults and the retries and retry sleep of the target.
+`--replay` writes Singer files, e.g. from `sample_payloads`, instead of generated
+streams.
+
+    python -m benchmarks.run --records 1000,10000 --latency-ms 20
+    python -m benchmarks.run --scenarios contacts_batch --output results.json
+    python -m benchmarks.run --baseline results.json
+    python -m benchmarks.run --scenarios contacts_batch --records 200000 --faults rate_limited
+    python -m benchmarks.run --replay sample_payloads/fallback/contacts.singer --faults flaky
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from requests.adapters import HTTPAdapter
+
+from benchmarks.faults import PRESETS, FaultInjector, load_profile
+from benchmarks.scenarios import SCENARIOS, ReplayScenario
+from benchmarks.stub import HubSpotStub
+
+API_URL = "https://api.hubapi.com"
+# the stand-in is not rate limited, only the target's own overhead is measured
+BENCHMARK_CONFIG = {
+    "hapikey": "benchmark",
+    "rate_limits": {"crm": 100000, "search": 100000, "associations": 100000},
+}
+# tolerated increase of the calls per record over the baseline
+DEFAULT_TOLERANCE = 0.05
+
+
+class RedirectAdapter(HTTPAdapter):
+    """Sends the requests to the HubSpot API to the stand-in instead."""
+
+    def __init__(self, base_url, **kwargs) -> None:
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        request.url = self.base_url + request.url[len(API_URL):]
+        return super().send(request, **kwargs)
+
+
+def run_target(base_url, config_path, input_path, state_path, result_path):
+    """Run the target on the input file in this process, writing the timing and peak RSS."""
+    from target_hubspot_v4.target import TargetHubspotv4
+    from target_hubspot_v4.transport import TRANSPORT
+
+    target = TargetHubspotv4(config=[config_path])
+    TRANSPORT.mount(API_URL, RedirectAdapter(base_url, pool_connections=TRANSPORT.pool_size, pool_maxsize=TRANSPORT.pool_size))
+    started_at = time.perf_counter()
+    error = None
+    try:
+        with open(input_path) as input_file, open(state_path, "w") as state_file, redirect_stdout(state_file):
+            target.listen(input_file)
+    except Exception as exc:
+        # a run given up on, e.g. during an injected outage, still has a time to completion
+        error = repr(exc)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started_at
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        peak_rss = max_rss if sys.platform == "darwin" else max_rss * 1024
+        with open(result_path, "w") as outfile:
+            json.dump({"seconds": elapsed, "peak_rss": peak_rss, "error": error}, outfile)
+
+
+def run_scenario(stub, base_url, scenario, records, existing, config, directory, verbose=False, faults=None, seed=None):
+    """
+    Write `records` records of the scenario through the target, with the faults of
+    the `faults` profile injected, and measure the run. Replayed files are written
+    whole, the records are counted from their messages.
+    """
+    stub.reset()
+    if scenario.seed:
+        scenario.seed(stub, records, existing)
+    seeded_calls = sum(stub.calls.values())
+    # a fresh injector per run, so every run meets the same faults for a seed
+    stub.faults = FaultInjector(faults, seed) if faults else None
+
+    paths = {
+        name: os.path.join(directory, f"{scenario.name}-{records or 'replay'}.{name}")
+        for name in ("config", "input", "state", "result", "log", "metrics")
+    }
+    with open(paths["config"], "w") as outfile:
+        json.dump(dict(BENCHMARK_CONFIG, **scenario.config, **config, metrics_path=paths["metrics"]), outfile)
+    written = 0
+    with open(paths["input"], "w") as outfile:
+        for message in scenario.messages(records):
+            written += message.get("type") == "RECORD"
+            outfile.write(json.dumps(message) + "\n")
+
+    command = [
+        sys.executable, "-m", "benchmarks.run", "--child", base_url,
+        paths["config"], paths["input"], paths["state"], paths["result"],
+    ]
+    with open(paths["log"], "w") as log_file:
+        process = subprocess.run(command, stderr=None if verbose else log_file, cwd=os.getcwd())
+    if process.returncode and not (faults and os.path.exists(paths["result"])):
+        raise RuntimeError(f"Scenario {scenario.name} with {written} records failed, see {paths['log']}")
+
+    with open(paths["result"]) as infile:
+        result = json.load(infile)
+    with open(paths["state"]) as infile:
+        lines = [line for line in infile.read().splitlines() if line.strip()]
+    summary = json.loads(lines[-1]).get("summary", {}) if lines and lines[-1].startswith("{") else {}
+    metrics = {}
+    if os.path.exists(paths["metrics"]):
+        with open(paths["metrics"]) as infile:
+            metrics = json.load(infile)
+    calls = sum(stub.calls.values()) - seeded_calls
+    injected = stub.faults.injected if stub.faults else {}
+    return {
+        "scenario": scenario.name,
+        "records": written,
+        "seconds": round(result["seconds"], 3),
+        "records_per_second": round(written / result["seconds"], 1),
+        "calls": calls,
+        "calls_per_record": round(calls / written, 4) if written else 0,
+        "peak_rss_mb": round(result["peak_rss"] / 2**20, 1),
+        "failed": sum(stream.get("fail", 0) for stream in summary.values()),
+        # requests answered with an injected fault instead of being handled, slow ones were handled
+        "wasted": sum(count for kind, count in injected.items() if kind != "slow"),
+        "retries": metrics.get("retries", 0),
+        "retry_sleep_s": metrics.get("retry_sleep_seconds", 0),
+        "error": result.get("error"),
+        "faults": dict(injected),
+        "endpoints": dict(stub.calls.most_common()),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Results whose calls per record went up by more than `tolerance` since the baseline."""
+    previous = {(result["scenario"], result["records"]): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["scenario"], result["records"]))
+        if before and result["calls_per_record"] > before["calls_per_record"] * (1 + tolerance):
+            regressions.append((result, before))
+    return regressions
+
+
+def print_table(results):
+    columns = [
+        "scenario", "records", "seconds", "records_per_second", "calls", "calls_per_record", "peak_rss_mb", "failed",
+        "wasted", "retries", "retry_sleep_s",
+    ]
+    rows = [columns] + [[str(result[column]) for column in columns] for result in results]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--records", default="1000", help="comma separated record counts, e.g. 1000,10000,100000")
+    parser.add_argument("--latency-ms", type=float, default=0, help="latency of each stand-in response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random latency added to each response, up to this")
+    parser.add_argument("--existing", type=float, default=0.5, help="share of the records that update an existing object")
+    parser.add_argument("--config", default="{}", help="JSON config merged into the config of every scenario")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare the calls per record with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--replay", help="comma separated Singer files to write, instead of the scenarios")
+    parser.add_argument(
+        "--faults", help=f"faults the stand-in injects: one of {', '.join(PRESETS)}, or a JSON profile or file"
+    )
+    parser.add_argument("--seed", type=int, help="random seed of the injected faults")
+    parser.add_argument("--verbose", action="store_true", help="show the logs of the target")
+    parser.add_argument("--child", nargs=5, metavar="ARG", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return run_target(*args.child)
+
+    unknown = [name for name in args.scenarios.split(",") if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios {unknown}")
+    config = json.loads(args.config)
+    faults = load_profile(args.faults) if args.faults else None
+    if args.replay:
+        # a replayed file is written once, whatever the record counts
+        runs = [(ReplayScenario(path), None) for path in args.replay.split(",")]
+    else:
+        runs = [
+            (SCENARIOS[name], int(records))
+            for name in args.scenarios.split(",")
+            for records in args.records.split(",")
+        ]
+
+    stub = HubSpotStub(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    base_url = stub.start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for scenario, records in runs:
+                results.append(run_scenario(
+                    stub, base_url, scenario, records, args.existing, config, directory, args.verbose,
+                    faults=faults, seed=args.seed,
+                ))
+                result = results[-1]
+                print(
+                    f"{scenario.name} x {result['records']}: {result['records_per_second']} records/s, "
+                    f"{result['calls_per_record']} calls/record, {result['wasted']} wasted requests",
+                    file=sys.stderr,
+                    flush=True,
+                )
+    finally:
+        stub.stop()
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as outfile:
+            json.dump(results, outfile, indent=2)
+    if args.baseline:
+        with open(args.baseline) as infile:
+            regressions = compare(results, json.load(infile), args.tolerance)
+        for result, before in regressions:
+            print(
+                f"Regression: {result['scenario']} with {result['records']} records makes "
+                f"{result['calls_per_record']} calls per record, {before['calls_per_record']} before"
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Generated Singer streams the benchmarks drive the target with."""
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+from benchmarks.stub import FIRST_OBJECT_ID
+
+
+@dataclass
+class Scenario:
+    """
+    A stream of `records` generated records, written with `config` on top of the
+    benchmark config. `seed` creates the objects the records update or refer to
+    in the stand-in before the run.
+    """
+
+    name: str
+    stream: str
+    properties: List[str]
+    record: Callable[[int, int], dict]
+    config: Dict = field(default_factory=dict)
+    seed: Callable = None
+
+    def messages(self, records):
+        schema = {
+            "type": ["object", "null"],
+            "properties": {name: {"type": ["string", "number", "array", "object", "null"]} for name in self.properties},
+        }
+        yield {"type": "SCHEMA", "stream": self.stream, "schema": schema, "key_properties": []}
+        for index in range(records):
+            yield {"type": "RECORD", "stream": self.stream, "record": self.record(index, records)}
+
+
+@dataclass
+class ReplayScenario:
+    """The messages of a Singer file, e.g. from `sample_payloads`, replayed as they are."""
+
+    path: str
+    config: Dict = field(default_factory=dict)
+    seed: Callable = None
+
+    @property
+    def name(self):
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    def messages(self, records):
+        with open(self.path) as infile:
+            for line in infile:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def email(index):
+    return f"contact{index}@example.com"
+
+
+def seed_contacts(stub, records, existing):
+    """Contacts for the first `existing` share of the records, which are updated instead of created."""
+    return stub.seed("contacts", [
+        {"email": email(index), "firstname": "Old", "lastname": f"Contact {index}"}
+        for index in range(int(records * existing))
+    ])
+
+
+def seed_companies(stub, records, existing):
+    return stub.seed("companies", [
+        {"name": f"Company {index}", "domain": f"company{index}.example.com"}
+        for index in range(int(records * existing))
+    ])
+
+
+def seed_note_targets(stub, records, existing):
+    stub.seed("companies", [{"name": f"Company {index}"} for index in range(100)])
+    stub.seed("deals", [{"dealname": f"Deal {index}"} for index in range(100)])
+
+
+def seed_deal_contacts(stub, records, existing):
+    stub.seed("contacts", [{"email": email(index)} for index in range(100)])
+
+
+def seed_call_contacts(stub, records, existing):
+    # seeded first, so the contacts have the first 100 ids
+    contact_ids = stub.seed("contacts", [{"email": email(index)} for index in range(100)])
+    deal_ids = stub.seed("deals", [{"dealname": f"Deal {index}"} for index in range(100)])
+    # half of the contacts have a deal the calls are associated with too
+    with stub._lock:
+        for contact_id, deal_id in list(zip(contact_ids, deal_ids))[::2]:
+            stub._associate("contacts", contact_id, "deals", deal_id)
+
+
+def contact(index, records):
+    return {"email": email(index), "firstname": "First", "lastname": f"Contact {index}", "jobtitle": "Engineer"}
+
+
+def company(index, records):
+    return {"name": f"Company {index}", "domain": f"company{index}.example.com", "industry": "COMPUTER_SOFTWARE"}
+
+
+def unsubscribe(index, records):
+    return {"inputs": [email(index)]}
+
+
+def unified_contact(index, records):
+    record = {
+        "email": email(index),
+        "first_name": "First",
+        "last_name": f"Contact {index}",
+        "company_name": f"Company {index % 100}",
+        "phone_numbers": [{"number": f"+1555{index:07d}", "type": "work"}],
+        "addresses": [{"line1": f"{index} Main St", "city": "Boston", "state": "MA", "country": "US", "postal_code": "02110"}],
+    }
+    if index % 10 == 0:
+        record["lists"] = ["Benchmark"]
+    return record
+
+
+def unified_deal(index, records):
+    return {
+        "title": f"Deal {index}",
+        "monetary_amount": 1000 + index,
+        "status": "closedwon",
+        "contact_email": email(index % 100),
+    }
+
+
+def unified_note(index, records):
+    return {
+        "content": f"Note {index}",
+        "created_at": "2024-01-01T00:00:00Z",
+        "company_name": f"Company {index % 100}",
+        "deal_name": f"Deal {index % 100}",
+    }
+
+
+def unified_call(index, records):
+    return {
+        "type": "call",
+        "title": f"Call {index}",
+        "duration_seconds": 60,
+        "activity_datetime": "2024-01-01T00:00:00Z",
+        "contact_id": str(FIRST_OBJECT_ID + index % 100),
+    }
+
+
+def unified(config=None):
+    return dict({"unified_api_schema": True}, **(config or {}))
+
+
+BASE_SCENARIOS = [
+    Scenario("contacts", "contacts", ["email", "firstname", "lastname", "jobtitle"], contact, seed=seed_contacts),
+    Scenario(
+        "companies", "companies", ["name", "domain", "industry"], company,
+        config={"lookup_fields": {"companies": "domain"}}, seed=seed_companies,
+    ),
+    Scenario("full_path", "/communication-preferences/v4/statuses/batch/unsubscribe-all?channel=EMAIL", ["inputs"], unsubscribe),
+    Scenario(
+        "unified_contacts", "contacts",
+        ["email", "first_name", "last_name", "company_name", "phone_numbers", "addresses", "lists"],
+        unified_contact, config=unified(), seed=seed_contacts,
+    ),
+    Scenario(
+        "unified_deals", "deals", ["title", "monetary_amount", "status", "contact_email"],
+        unified_deal, config=unified(), seed=seed_deal_contacts,
+    ),
+    Scenario(
+        "unified_notes", "notes", ["content", "created_at", "company_name", "deal_name"],
+        unified_note, config=unified(), seed=seed_note_targets,
+    ),
+    Scenario(
+        "unified_calls", "activities", ["type", "title", "duration_seconds", "activity_datetime", "contact_id"],
+        unified_call, config=unified(), seed=seed_call_contacts,
+    ),
+]
+# streams writing through the batch endpoints when `batch_upsert` is set
+BATCH_SCENARIOS = ["contacts", "companies", "unified_contacts", "unified_notes", "unified_calls"]
+# streams writing through the Imports API when `import_streams` is set
+IMPORT_SCENARIOS = ["contacts", "companies"]
+
+SCENARIOS = {scenario.name: scenario for scenario in BASE_SCENARIOS}
+for scenario in BASE_SCENARIOS:
+    if scenario.name in BATCH_SCENARIOS:
+        SCENARIOS[f"{scenario.name}_batch"] = Scenario(
+            f"{scenario.name}_batch",
+            scenario.stream,
+            scenario.properties,
+            scenario.record,
+            config=dict(scenario.config, batch_upsert=True),
+            seed=scenario.seed,
+        )
+    if scenario.name in IMPORT_SCENARIOS:
+        SCENARIOS[f"{scenario.name}_import"] = Scenario(
+            f"{scenario.name}_import",
+            scenario.stream,
+            scenario.properties,
+            scenario.record,
+            config=dict(scenario.config, import_streams=True, import_poll_interval=0.1),
+            seed=scenario.seed,
+        )
@@ -0,0 +1,621 @@
+"""In-process HTTP stand-in of the HubSpot endpoints the target uses."""
+
+import csv
+import io
+import itertools
+import json
+import random
+import re
+import socket
+import struct
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from target_hubspot_v4.imports import OBJECT_TYPE_IDS
+from target_hubspot_v4.metrics import endpoint_template
+
+# the search API returns at most this many results for a query
+SEARCH_RESULTS_CAP = 10000
+# ids of the objects are counted from here after each reset
+FIRST_OBJECT_ID = 1001
+MAX_PAGE_SIZE = 200
+SINGULAR_OBJECT_NAMES = {
+    "contact": "contacts",
+    "company": "companies",
+    "deal": "deals",
+    "call": "calls",
+    "note": "notes",
+    "task": "tasks",
+    "ticket": "tickets",
+}
+# association type ids returned by the labels endpoint, 1 for other pairs
+ASSOCIATION_TYPE_IDS = {
+    ("deals", "contacts"): 3,
+    ("notes", "companies"): 190,
+    ("notes", "deals"): 214,
+    ("calls", "contacts"): 194,
+    ("calls", "deals"): 206,
+}
+DEFAULT_PROPERTIES = {
+    "contacts": ["email", "firstname", "lastname", "phone", "company", "jobtitle", "address", "city", "state", "country", "zip"],
+    "companies": ["name", "domain", "industry"],
+    "deals": ["dealname", "amount", "dealstage", "pipeline", "closedate"],
+}
+
+
+def normalize(value):
+    return str(value).strip().lower()
+
+
+def object_type(name):
+    name = unquote(name).lower()
+    return SINGULAR_OBJECT_NAMES.get(name, name)
+
+
+def parse_multipart(raw_body, content_type):
+    """Fields of a multipart form, files as bytes and other fields as text."""
+    message = BytesParser(policy=policy.HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + raw_body)
+    fields = {}
+    for part in message.iter_parts():
+        payload = part.get_payload(decode=True)
+        fields[part.get_param("name", header="content-disposition")] = payload if part.get_filename() else payload.decode()
+    return fields
+
+
+def error(status, message, category="VALIDATION_ERROR", **context):
+    return status, {"status": "error", "category": category, "message": message, "context": context}
+
+
+class HubSpotStub:
+    """
+    Keeps CRM objects, associations, lists and property definitions in memory and
+    answers the CRM, search, batch, associations, lists, properties, subscription
+    status and OAuth endpoints over HTTP, after `latency_ms` (plus up to `jitter_ms`)
+    per request. Every request is counted by endpoint template in `calls`. `faults`,
+    a `FaultInjector`, makes requests fail or slow down. Imports are processed when
+    they are submitted and reported as processing on the first poll.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, faults=None) -> None:
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.faults = faults
+        self._lock = threading.RLock()
+        self._server = None
+        self._thread = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget every object and call count."""
+        with self._lock:
+            self.calls = Counter()
+            self.objects = defaultdict(dict)
+            self.values = defaultdict(lambda: defaultdict(set))
+            self.associations = defaultdict(lambda: defaultdict(dict))
+            self.properties = defaultdict(set)
+            for object_name, names in DEFAULT_PROPERTIES.items():
+                self.properties[object_name].update(names)
+            self.lists = {}
+            self.list_members = defaultdict(set)
+            self.imports = {}
+            self._ids = itertools.count(FIRST_OBJECT_ID)
+
+    def start(self) -> str:
+        """Serve on a free local port and return the base URL."""
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="hubspot-stub", daemon=True)
+        self._thread.start()
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    # objects
+
+    def seed(self, object_name, rows):
+        """Create an object per properties dict in `rows` and return their ids."""
+        with self._lock:
+            return [self._create(object_name, dict(properties))["id"] for properties in rows]
+
+    def _create(self, object_name, properties):
+        id = str(next(self._ids))
+        now = datetime.now(timezone.utc)
+        obj = {
+            "id": id,
+            "properties": {},
+            "createdAt": now.isoformat(),
+            "updatedAt": now.isoformat(),
+            "archived": False,
+            "_created": int(now.timestamp() * 1000),
+        }
+        self.objects[object_name][id] = obj
+        self._update(object_name, obj, dict(properties, hs_object_id=id))
+        return obj
+
+    def _update(self, object_name, obj, properties):
+        index = self.values[object_name]
+        for name, value in properties.items():
+            old = obj["properties"].get(name)
+            if old not in (None, ""):
+                index[(name, normalize(old))].discard(obj["id"])
+            obj["properties"][name] = value
+            if value not in (None, ""):
+                index[(name, normalize(value))].add(obj["id"])
+            self.properties[object_name].add(name)
+        obj["updatedAt"] = datetime.now(timezone.utc).isoformat()
+
+    def _find(self, object_name, property_name, value):
+        if property_name in (None, "id", "hs_object_id"):
+            obj = self.objects[object_name].get(str(value))
+            return [obj] if obj else []
+        ids = self.values[object_name].get((property_name, normalize(value)), ())
+        return [self.objects[object_name][id] for id in sorted(ids, key=int)]
+
+    def _view(self, obj, properties=None):
+        """The object as returned by the API, with the requested properties."""
+        names = list(properties or []) + ["createdate", "hs_object_id", "lastmodifieddate"]
+        values = dict(obj["properties"])
+        values["createdate"] = datetime.fromtimestamp(obj["_created"] / 1000, timezone.utc).isoformat().replace("+00:00", "Z")
+        values["lastmodifieddate"] = obj["updatedAt"]
+        view = {key: value for key, value in obj.items() if not key.startswith("_")}
+        view["properties"] = {name: values.get(name) for name in names}
+        return view
+
+    def _conflict(self, object_name, properties):
+        """Id of the contact already holding the email of a new contact, if any."""
+        if object_name == "contacts" and properties.get("email"):
+            existing = self._find("contacts", "email", properties["email"])
+            if existing:
+                return existing[0]["id"]
+        return None
+
+    # HTTP
+
+    def dispatch(self, method, raw_path, raw_body, content_type):
+        """Answer a request with `(status, body, headers)`, status None resetting the connection."""
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        url = urlsplit(raw_path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        body = None
+        if raw_body:
+            if "json" in (content_type or ""):
+                body = json.loads(raw_body)
+            elif "multipart/form-data" in (content_type or ""):
+                body = parse_multipart(raw_body, content_type)
+            else:
+                body = {name: values[-1] for name, values in parse_qs(raw_body.decode()).items()}
+        with self._lock:
+            self.calls[endpoint_template(method, url.path)] += 1
+        headers = {}
+        if self.faults is not None:
+            time.sleep(self.faults.latency())
+            headers, fault = self.faults.fault(url.path)
+            if fault == "reset":
+                return None, None, headers
+            if fault is not None:
+                return fault + (headers,)
+        for route_method, pattern, handler in ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if match and method == route_method:
+                with self._lock:
+                    return handler(self, query, body, *match.groups()) + (headers,)
+        return error(404, f"No route for {method} {url.path}", category="OBJECT_NOT_FOUND") + (headers,)
+
+    def oauth_token(self, query, body):
+        return 200, {"access_token": "benchmark", "refresh_token": "benchmark", "expires_in": 1800}
+
+    def get_properties(self, query, body, object_name):
+        names = sorted(self.properties[object_type(object_name)])
+        return 200, {"results": [{"name": name, "type": "string", "fieldType": "text"} for name in names]}
+
+    def create_properties(self, query, body, object_name):
+        object_name = object_type(object_name)
+        for definition in body["inputs"]:
+            self.properties[object_name].add(definition["name"])
+        return 201, {"status": "COMPLETE", "results": body["inputs"]}
+
+    def list_objects(self, query, body, object_name):
+        objects = list(self.objects[object_type(object_name)].values())
+        after = int(query.get("after", 0))
+        limit = min(int(query.get("limit", 10)), MAX_PAGE_SIZE)
+        properties = [name for name in query.get("properties", "").split(",") if name]
+        response = {"results": [self._view(obj, properties) for obj in objects[after:after + limit]]}
+        if after + limit < len(objects):
+            response["paging"] = {"next": {"after": str(after + limit)}}
+        return 200, response
+
+    def create_object(self, query, body, object_name):
+        object_name = object_type(object_name)
+        properties = body.get("properties") or {}
+        existing_id = self._conflict(object_name, properties)
+        if existing_id:
+            return error(409, f"Contact already exists. Existing ID: {existing_id}", category="CONFLICT")
+        obj = self._create(object_name, properties)
+        for association in body.get("associations") or []:
+            self._associate(object_name, obj["id"], association.get("to", {}).get("objectType"), association["to"]["id"])
+        return 201, self._view(obj, properties)
+
+    def get_object(self, query, body, object_name, id):
+        object_name = object_type(object_name)
+        found = self._find(object_name, query.get("idProperty"), unquote(id))
+        if not found:
+            return error(404, f"Object {id} not found", category="OBJECT_NOT_FOUND")
+        properties = [name for name in query.get("properties", "").split(",") if name]
+        return 200, self._view(found[0], properties)
+
+    def update_object(self, query, body, object_name, id):
+        object_name = object_type(object_name)
+        found = self._find(object_name, query.get("idProperty"), unquote(id))
+        if not found:
+            return error(404, f"Object {id} not found", category="OBJECT_NOT_FOUND")
+        properties = body.get("properties") or {}
+        self._update(object_name, found[0], properties)
+        return 200, self._view(found[0], properties)
+
+    def search(self, query, body, object_name):
+        object_name = object_type(object_name)
+        after = int(body.get("after") or 0)
+        limit = min(int(body.get("limit") or 10), MAX_PAGE_SIZE)
+        if after + limit > SEARCH_RESULTS_CAP:
+            return error(400, f"Search results are capped at {SEARCH_RESULTS_CAP}")
+        groups = body.get("filterGroups") or []
+        if groups:
+            ids = set()
+            for group in groups:
+                ids |= self._search_group(object_name, group.get("filters") or [])
+            objects = [self.objects[object_name][id] for id in sorted(ids, key=int)]
+        else:
+            objects = list(self.objects[object_name].values())
+        for sort in reversed(body.get("sorts") or []):
+            name = sort["propertyName"]
+            objects.sort(
+                key=(lambda obj: obj["_created"]) if name == "createdate" else (lambda obj: str(obj["properties"].get(name) or "")),
+                reverse=sort.get("direction") == "DESCENDING",
+            )
+        page = objects[after:after + limit]
+        response = {"total": len(objects), "results": [self._view(obj, body.get("properties")) for obj in page]}
+        if after + limit < len(objects):
+            response["paging"] = {"next": {"after": str(after + limit)}}
+        return 200, response
+
+    def _search_group(self, object_name, filters):
+        candidates = None
+        for search_filter in filters:
+            name, operator = search_filter["propertyName"], search_filter["operator"]
+            if operator not in ("EQ", "IN"):
+                continue
+            values = search_filter.get("values") if operator == "IN" else [search_filter.get("value")]
+            ids = set()
+            for value in values:
+                if operator == "IN" and str(value) != normalize(value):
+                    # HubSpot only matches IN values sent in lowercase
+                    continue
+                ids.update(obj["id"] for obj in self._find(object_name, name, value))
+            candidates = ids if candidates is None else candidates & ids
+        if candidates is None:
+            candidates = set(self.objects[object_name])
+        return {id for id in candidates if all(self._matches(self.objects[object_name][id], search_filter) for search_filter in filters)}
+
+    @staticmethod
+    def _matches(obj, search_filter):
+        name, operator = search_filter["propertyName"], search_filter["operator"]
+        if operator in ("EQ", "IN"):
+            return True
+        value = obj["_created"] if name == "createdate" else obj["properties"].get(name)
+        if operator == "HAS_PROPERTY":
+            return value not in (None, "")
+        if operator == "NOT_HAS_PROPERTY":
+            return value in (None, "")
+        if value in (None, ""):
+            return False
+        expected = search_filter.get("value")
+        if name == "createdate":
+            expected = int(expected)
+        else:
+            value, expected = normalize(value), normalize(expected)
+        return {
+            "NEQ": lambda: value != expected,
+            "GT": lambda: value > expected,
+            "GTE": lambda: value >= expected,
+            "LT": lambda: value < expected,
+            "LTE": lambda: value <= expected,
+        }[operator]()
+
+    def batch(self, query, body, object_name, action):
+        object_name = object_type(object_name)
+        results, errors = [], []
+        properties = body.get("properties")
+        for item in body.get("inputs") or []:
+            trace_id = item.get("objectWriteTraceId")
+            context = {"ids": [str(item.get("id"))]}
+            if trace_id is not None:
+                context["objectWriteTraceId"] = [trace_id]
+            item_properties = item.get("properties") or {}
+            if action == "read":
+                found = self._find(object_name, body.get("idProperty"), item["id"])
+                if found:
+                    results.append(self._view(found[0], properties))
+                else:
+                    errors.append(error(404, f"Object {item['id']} not found", "OBJECT_NOT_FOUND", **context)[1])
+                continue
+            if action == "create":
+                existing_id = self._conflict(object_name, item_properties)
+                if existing_id:
+                    errors.append(error(409, f"Contact already exists. Existing ID: {existing_id}", "CONFLICT", **context)[1])
+                    continue
+                obj = self._create(object_name, item_properties)
+                for association in item.get("associations") or []:
+                    self._associate(object_name, obj["id"], None, association["to"]["id"])
+            else:
+                found = self._find(object_name, item.get("idProperty"), item["id"])
+                if found:
+                    obj = found[0]
+                    self._update(object_name, obj, item_properties)
+                elif action == "upsert":
+                    obj = self._create(object_name, dict(item_properties, **{item["idProperty"]: item["id"]}))
+                else:
+                    errors.append(error(404, f"Object {item['id']} not found", "OBJECT_NOT_FOUND", **context)[1])
+                    continue
+            result = self._view(obj, item_properties)
+            if trace_id is not None:
+                result["objectWriteTraceId"] = trace_id
+            results.append(result)
+        response = {"status": "COMPLETE", "results": results}
+        if errors:
+            response.update(errors=errors, numErrors=len(errors))
+            return 207, response
+        return (201 if action == "create" else 200), response
+
+    # associations
+
+    def _associate(self, from_object_name, from_id, to_object_name, to_id):
+        to_object_name = object_type(to_object_name) if to_object_name else None
+        if to_object_name is None:
+            # inline associations only carry the id of the object they point to
+            to_object_name = next((name for name, objects in self.objects.items() if str(to_id) in objects), None)
+            if to_object_name is None:
+                return
+        self.associations[(from_object_name, to_object_name)][str(from_id)][str(to_id)] = True
+        self.associations[(to_object_name, from_object_name)][str(to_id)][str(from_id)] = True
+
+    def association_labels(self, query, body, from_object_name, to_object_name):
+        key = (object_type(from_object_name), object_type(to_object_name))
+        type_id = ASSOCIATION_TYPE_IDS.get(key, 1)
+        return 200, {"results": [{"category": "HUBSPOT_DEFINED", "typeId": type_id, "label": None}]}
+
+    def create_associations(self, query, body, from_object_name, to_object_name):
+        from_object_name, to_object_name = object_type(from_object_name), object_type(to_object_name)
+        results, errors = [], []
+        for item in body.get("inputs") or []:
+            from_id, to_id = str(item["from"]["id"]), str(item["to"]["id"])
+            if from_id not in self.objects[from_object_name] or to_id not in self.objects[to_object_name]:
+                errors.append(error(400, f"{from_object_name} {from_id} or {to_object_name} {to_id} does not exist")[1])
+                continue
+            self._associate(from_object_name, from_id, to_object_name, to_id)
+            results.append({"fromObjectId": int(from_id), "toObjectId": int(to_id), "labels": []})
+        response = {"status": "COMPLETE", "results": results}
+        if errors:
+            response.update(errors=errors, numErrors=len(errors))
+            return 207, response
+        return 201, response
+
+    def read_associations(self, query, body, from_object_name, to_object_name):
+        associated = self.associations[(object_type(from_object_name), object_type(to_object_name))]
+        results, errors = [], []
+        for item in body.get("inputs") or []:
+            to_ids = associated.get(str(item["id"]))
+            if to_ids:
+                results.append({
+                    "from": {"id": str(item["id"])},
+                    "to": [{"toObjectId": int(to_id), "associationTypes": []} for to_id in to_ids],
+                })
+            else:
+                errors.append(error(404, f"No associations found for {item['id']}", "OBJECT_NOT_FOUND", ids=[str(item["id"])])[1])
+        response = {"status": "COMPLETE", "results": results}
+        if errors:
+            response.update(errors=errors, numErrors=len(errors))
+            return 207, response
+        return 200, response
+
+    def list_associations(self, query, body, from_object_name, id, to_object_name):
+        to_ids = list(self.associations[(object_type(from_object_name), object_type(to_object_name))].get(id, {}))
+        after = int(query.get("after", 0))
+        limit = int(query.get("limit", 500))
+        response = {"results": [{"toObjectId": int(to_id), "associationTypes": []} for to_id in to_ids[after:after + limit]]}
+        if after + limit < len(to_ids):
+            response["paging"] = {"next": {"after": str(after + limit)}}
+        return 200, response
+
+    def put_association(self, query, body, from_object_name, id, to_object_name, to_id, *label):
+        from_object_name, to_object_name = object_type(from_object_name), object_type(to_object_name)
+        if id not in self.objects[from_object_name] or to_id not in self.objects[to_object_name]:
+            return error(404, f"{from_object_name} {id} or {to_object_name} {to_id} does not exist", category="OBJECT_NOT_FOUND")
+        self._associate(from_object_name, id, to_object_name, to_id)
+        return 200, {"fromObjectId": int(id), "toObjectId": int(to_id), "labels": []}
+
+    # lists
+
+    def get_list(self, query, body, name):
+        list_id = self.lists.get(unquote(name))
+        if list_id is None:
+            return error(404, f"List {name} does not exist", category="OBJECT_NOT_FOUND")
+        return 200, {"list": {"listId": list_id, "name": unquote(name)}}
+
+    def create_list(self, query, body):
+        list_id = self.lists.setdefault(body["name"], str(next(self._ids)))
+        return 200, {"list": {"listId": list_id, "name": body["name"], "processingType": body.get("processingType")}}
+
+    def update_list_memberships(self, query, body, list_id):
+        members = self.list_members[list_id]
+        added = [str(id) for id in body.get("recordIdsToAdd") or [] if str(id) not in members]
+        removed = [str(id) for id in body.get("recordIdsToRemove") or [] if str(id) in members]
+        members.update(added)
+        members.difference_update(removed)
+        return 200, {"recordIdsAdded": added, "recordIdsRemoved": removed, "recordsIdsMissing": []}
+
+    # communication preferences
+
+    def unsubscribe_subscriber(self, query, body, subscriber):
+        return 200, {"subscriberIdString": unquote(subscriber), "statuses": [], "channel": query.get("channel", "EMAIL")}
+
+    def unsubscribe_all(self, query, body):
+        results = [
+            {"subscriberIdString": subscriber, "statuses": [], "channel": query.get("channel", "EMAIL")}
+            for subscriber in body.get("inputs") or []
+        ]
+        return 200, {"status": "COMPLETE", "results": results}
+
+    # imports
+
+    def create_import(self, query, body):
+        import_request = json.loads(body["importRequest"])
+        file_page = import_request["files"][0]["fileImportPage"]
+        type_ids = {type_id: object_name for object_name, type_id in OBJECT_TYPE_IDS.items()}
+        type_id = next(iter(import_request["importOperations"]))
+        object_name = type_ids.get(type_id, type_id)
+        counters, errors = Counter(), []
+        reader = csv.reader(io.StringIO(body["files"].decode()))
+        # the header, columns being mapped in order
+        next(reader)
+        for line_number, row in enumerate(reader, start=2):
+            counters["TOTAL_ROWS"] += 1
+            properties, id, alternate_id = {}, None, None
+            for mapping, value in zip(file_page["columnMappings"], row):
+                if value == "":
+                    continue
+                if mapping.get("columnType") == "HUBSPOT_OBJECT_ID":
+                    id = value
+                elif mapping.get("columnType") == "HUBSPOT_ALTERNATE_ID":
+                    alternate_id = (mapping["propertyName"], value)
+                properties[mapping["propertyName"]] = value
+            properties.pop("hs_object_id", None)
+
+            def row_error(error_type, invalid_value):
+                counters["ERRORS"] += 1
+                errors.append({
+                    "id": str(len(errors)),
+                    "errorType": error_type,
+                    "invalidValue": invalid_value,
+                    "objectType": object_name.upper(),
+                    "sourceData": {"rowData": row, "lineNumber": line_number},
+                })
+
+            if object_name == "contacts" and properties.get("email") and "@" not in properties["email"]:
+                row_error("INVALID_EMAIL", properties["email"])
+                continue
+            found = self._find(object_name, None, id) if id else self._find(object_name, *alternate_id) if alternate_id else []
+            if found:
+                self._update(object_name, found[0], properties)
+                counters["UPDATED_OBJECTS"] += 1
+            elif id:
+                row_error("UNKNOWN_OBJECT_ID", id)
+            else:
+                self._create(object_name, properties)
+                counters["CREATED_OBJECTS"] += 1
+
+        import_id = str(len(self.imports) + 1)
+        self.imports[import_id] = {
+            "id": import_id,
+            "state": "DONE",
+            "polls": 0,
+            "metadata": {"counters": dict(counters)},
+            "errors": errors,
+            "importRequestJson": import_request,
+        }
+        return 200, {"id": import_id, "state": "STARTED", "metadata": {"counters": {}}}
+
+    def get_import(self, query, body, import_id):
+        hubspot_import = self.imports.get(import_id)
+        if hubspot_import is None:
+            return error(404, f"Import {import_id} not found", "OBJECT_NOT_FOUND")
+        hubspot_import["polls"] += 1
+        state = "PROCESSING" if hubspot_import["polls"] == 1 else hubspot_import["state"]
+        return 200, {"id": import_id, "state": state, "metadata": hubspot_import["metadata"]}
+
+    def import_errors(self, query, body, import_id):
+        hubspot_import = self.imports.get(import_id)
+        if hubspot_import is None:
+            return error(404, f"Import {import_id} not found", "OBJECT_NOT_FOUND")
+        start = int(query.get("after") or 0)
+        end = start + min(int(query.get("limit") or MAX_PAGE_SIZE), MAX_PAGE_SIZE)
+        response = {"results": hubspot_import["errors"][start:end]}
+        if end < len(hubspot_import["errors"]):
+            response["paging"] = {"next": {"after": str(end)}}
+        return 200, response
+
+
+ROUTES = [
+    ("POST", r"/oauth/v1/token", HubSpotStub.oauth_token),
+    ("GET", r"/crm/v3/properties/([^/]+)", HubSpotStub.get_properties),
+    ("POST", r"/crm/v3/properties/([^/]+)/batch/create", HubSpotStub.create_properties),
+    ("POST", r"/crm/v3/objects/([^/]+)/search", HubSpotStub.search),
+    ("POST", r"/crm/v3/objects/([^/]+)/batch/(read|create|update|upsert)", HubSpotStub.batch),
+    ("PUT", r"/crm/v3/objects/([^/]+)/([^/]+)/associations/([^/]+)/([^/]+)/([^/]+)", HubSpotStub.put_association),
+    ("GET", r"/crm/v3/objects/([^/]+)", HubSpotStub.list_objects),
+    ("POST", r"/crm/v3/objects/([^/]+)", HubSpotStub.create_object),
+    ("GET", r"/crm/v3/objects/([^/]+)/([^/]+)", HubSpotStub.get_object),
+    ("PATCH", r"/crm/v3/objects/([^/]+)/([^/]+)", HubSpotStub.update_object),
+    ("GET", r"/crm/v4/associations/([^/]+)/([^/]+)/labels", HubSpotStub.association_labels),
+    ("POST", r"/crm/v4/associations/([^/]+)/([^/]+)/batch/create", HubSpotStub.create_associations),
+    ("POST", r"/crm/v4/associations/([^/]+)/([^/]+)/batch/read", HubSpotStub.read_associations),
+    ("GET", r"/crm/v4/objects/([^/]+)/([^/]+)/associations/([^/]+)", HubSpotStub.list_associations),
+    ("PUT", r"/crm/v4/objects/([^/]+)/([^/]+)/associations/([^/]+)/([^/]+)", HubSpotStub.put_association),
+    ("GET", r"/crm/v3/lists/object-type-id/[^/]+/name/([^/]+)", HubSpotStub.get_list),
+    ("POST", r"/crm/v3/lists", HubSpotStub.create_list),
+    ("PUT", r"/crm/v3/lists/([^/]+)/memberships/add-and-remove", HubSpotStub.update_list_memberships),
+    ("POST", r"/crm/v3/imports", HubSpotStub.create_import),
+    ("GET", r"/crm/v3/imports/([^/]+)/errors", HubSpotStub.import_errors),
+    ("GET", r"/crm/v3/imports/([^/]+)", HubSpotStub.get_import),
+    ("POST", r"/communication-preferences/v4/statuses/batch/unsubscribe-all", HubSpotStub.unsubscribe_all),
+    ("POST", r"/communication-preferences/v4/statuses/([^/]+)/unsubscribe-all", HubSpotStub.unsubscribe_subscriber),
+]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, which Nagle's algorithm would delay
+    disable_nagle_algorithm = True
+
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        try:
+            status, payload, headers = self.server.stub.dispatch(
+                self.command, self.path, raw_body, self.headers.get("Content-Type")
+            )
+        except Exception as e:
+            (status, payload), headers = error(500, f"Stub error: {e!r}", category="INTERNAL_ERROR"), {}
+        if status is None:
+            # closed with a RST instead of a FIN
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.close_connection = True
+            return
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+    def log_message(self, format, *args):
+        pass
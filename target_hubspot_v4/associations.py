@@ -0,0 +1,128 @@
+"""Association types and associated objects, loaded once per run."""
+
+import threading
+
+from target_hubspot_v4.utils import MAX_BATCH_INPUTS, chunk_unique, logger, request, request_push
+
+
+class AssociationTypeRegistry:
+    """
+    Caches the association labels HubSpot defines between two object types, so
+    associations can be written by label name, or with the default type, without
+    hard-coding type ids or fetching the labels for every record.
+    """
+
+    def __init__(self) -> None:
+        self._labels = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def labels(self, config, from_object_name, to_object_name):
+        """Label definitions ({"category", "typeId", "label"}) from one object type to another."""
+        key = (from_object_name.lower(), to_object_name.lower())
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        # one request per pair even when several workers need it at once
+        with lock:
+            if key not in self._labels:
+                url = f"https://api.hubapi.com/crm/v4/associations/{key[0]}/{key[1]}/labels"
+                self._labels[key] = request(config, url).json().get("results", [])
+                logger.info(f"Loaded {len(self._labels[key])} association types from {key[0]} to {key[1]}")
+            return self._labels[key]
+
+    def resolve(self, config, from_object_name, to_object_name, label=None):
+        """
+        Return the {"associationCategory", "associationTypeId"} of the association labelled
+        `label` (case insensitive), or of the default unlabelled association when no label is given.
+        """
+        labels = self.labels(config, from_object_name, to_object_name)
+        if label:
+            matches = [
+                definition for definition in labels
+                if str(definition.get("label") or "").lower() == str(label).lower()
+            ]
+        else:
+            matches = [
+                definition for definition in labels
+                if not definition.get("label") and definition.get("category") == "HUBSPOT_DEFINED"
+            ] or labels[:1]
+        if not matches:
+            available = [definition.get("label") for definition in labels if definition.get("label")]
+            raise Exception(
+                f"Association label {label} not found from {from_object_name} to {to_object_name}, available labels: {available}"
+            )
+        return {"associationCategory": matches[0]["category"], "associationTypeId": matches[0]["typeId"]}
+
+    def resolve_types(self, config, from_object_name, to_object_name, types):
+        """Fill in the category and type id of association types given by `label` only."""
+        return [
+            association_type if association_type.get("associationTypeId") else
+            self.resolve(config, from_object_name, to_object_name, association_type.get("label"))
+            for association_type in types
+        ]
+
+
+class AssociatedIdsCache:
+    """
+    Caches the ids of the objects associated with each object, e.g. the deals of each
+    contact, for the whole run. Missing objects are read 100 at a time through the v4
+    batch read endpoint, and associations this run creates are added as they are written.
+    """
+
+    def __init__(self) -> None:
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, config, from_object_name, to_object_name, ids):
+        """Ids of the `to_object_name` objects associated with each of `ids`, by id."""
+        key = (from_object_name.lower(), to_object_name.lower())
+        ids = [str(id) for id in ids if id]
+        with self._lock:
+            cached = self._ids.setdefault(key, {})
+            missing = [id for id in dict.fromkeys(ids) if id not in cached]
+
+        for chunk in chunk_unique(missing, MAX_BATCH_INPUTS):
+            url = f"https://api.hubapi.com/crm/v4/associations/{key[0]}/{key[1]}/batch/read"
+            response = request_push(config, url, {"inputs": [{"id": id} for id in chunk]})
+            # objects without associations come back in "errors"
+            found = {id: [] for id in chunk}
+            for result in response.json().get("results", []):
+                from_id = str(result["from"]["id"])
+                if (result.get("paging") or {}).get("next"):
+                    found[from_id] = self._read_all(config, key, from_id)
+                else:
+                    found[from_id] = [str(to["toObjectId"]) for to in result.get("to", [])]
+            with self._lock:
+                cached.update(found)
+            logger.info(f"Loaded {key[1]} associated with {len(chunk)} {key[0]}")
+
+        with self._lock:
+            return {id: list(cached[id]) for id in ids}
+
+    def _read_all(self, config, key, from_id):
+        """Page through the associations of a single object with more than one page of them."""
+        url = f"https://api.hubapi.com/crm/v4/objects/{key[0]}/{from_id}/associations/{key[1]}"
+        to_ids = []
+        params = {"limit": 500}
+        while True:
+            response_json = request(config, url, dict(params)).json()
+            to_ids.extend(str(to["toObjectId"]) for to in response_json.get("results", []))
+            after = ((response_json.get("paging") or {}).get("next") or {}).get("after")
+            if not after:
+                return to_ids
+            params["after"] = after
+
+    def add(self, from_object_name, to_object_name, from_id, to_id):
+        """Record an association written by this run, in both directions."""
+        with self._lock:
+            for key, id, associated_id in (
+                ((from_object_name.lower(), to_object_name.lower()), str(from_id), str(to_id)),
+                ((to_object_name.lower(), from_object_name.lower()), str(to_id), str(from_id)),
+            ):
+                associated_ids = self._ids.get(key, {}).get(id)
+                if associated_ids is not None and associated_id not in associated_ids:
+                    associated_ids.append(associated_id)
+
+
+ASSOCIATION_TYPES = AssociationTypeRegistry()
+ASSOCIATED_IDS = AssociatedIdsCache()
@@ -1,16 +1,121 @@
 import json
+import os
+import tempfile
+import threading
 from datetime import datetime
 from hotglue_etl_exceptions import InvalidCredentialsError
 from typing import Any, Dict, Optional
 
 import logging
-import requests
 import backoff
 
+from target_hubspot_v4.transport import TRANSPORT
+
+logger = logging.getLogger("target-hubspot-v4")
+
+TOKEN_URL = "https://api.hubapi.com/oauth/v1/token"
+# the access token is refreshed when it expires within this many seconds
+TOKEN_REFRESH_MARGIN = 120
+
+
+class TokenManager:
+    """
+    OAuth access token shared by every request path of the process. The token is
+    refreshed by a single thread, under a lock, shortly before it expires, and the
+    rotated refresh token is written back to the config file atomically, once per refresh.
+    """
+
+    def __init__(self) -> None:
+        self._config = None
+        self._config_file = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.last_error_response = None
+
+    def configure(self, config, config_file=None):
+        """Keep the token in `config` (the target's config) and persist it to `config_file`."""
+        with self._lock:
+            self._config = config
+            self._config_file = config_file
+
+    def access_token(self, config=None):
+        """A valid access token, refreshed first when missing or about to expire."""
+        with self._lock:
+            if self._config is None:
+                # helpers used without a target keep the token in the config they were given
+                self._config = config
+            if not self.is_token_valid():
+                self.refresh()
+            return self._config["access_token"]
+
+    def is_token_valid(self) -> bool:
+        access_token = self._config.get("access_token")
+        now = round(datetime.utcnow().timestamp())
+        expires_in = self._config.get("expires_in")
+        if expires_in is not None:
+            expires_in = int(expires_in)
+        if not access_token:
+            return False
+        if not expires_in:
+            return False
+        return not ((expires_in - now) < TOKEN_REFRESH_MARGIN)
+
+    @property
+    def oauth_request_body(self) -> dict:
+        """Define the OAuth request body for the hubspot API."""
+        return {
+            "grant_type": "refresh_token",
+            "redirect_uri": self._config.get("redirect_uri"),
+            "refresh_token": self._config.get("refresh_token"),
+            "client_id": self._config.get("client_id"),
+            "client_secret": self._config.get("client_secret"),
+        }
+
+    @backoff.on_exception(
+        backoff.expo, Exception, max_tries=3, giveup=lambda e: isinstance(e, InvalidCredentialsError)
+    )
+    def refresh(self) -> None:
+        logger.info(f"Oauth request - endpoint: {TOKEN_URL}")
+        token_response = TRANSPORT.request("POST", TOKEN_URL, data=self.oauth_request_body)
+        if 400 <= token_response.status_code < 500:
+            self.last_error_response = token_response.text
+            try:
+                error_message = token_response.json()["message"]
+            except Exception:
+                error_message = token_response.text
+            raise InvalidCredentialsError(f"Failed OAuth login, response was '{error_message}'")
+        token_response.raise_for_status()
+
+        token_json = token_response.json()
+        now = round(datetime.utcnow().timestamp())
+        self._config["access_token"] = token_json["access_token"]
+        self._config["refresh_token"] = token_json["refresh_token"]
+        self._config["expires_in"] = now + token_json["expires_in"]
+        self.refreshes += 1
+        logger.info(f"OAuth token refreshed, expires at {datetime.utcfromtimestamp(self._config['expires_in'])}")
+        self.persist()
+
+    def persist(self) -> None:
+        """Write the config, with the rotated refresh token, next to the file and swap it in."""
+        if not self._config_file:
+            return
+        directory = os.path.dirname(os.path.abspath(self._config_file))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".config-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as outfile:
+                json.dump(self._config, outfile, indent=4)
+            os.replace(temp_path, self._config_file)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+TOKEN_MANAGER = TokenManager()
 
 
 class HubspotAuthenticator:
-    """API Authenticator for OAuth 2.0 flows."""
+    """API Authenticator for OAuth 2.0 flows, backed by the shared token manager."""
 
     def __init__(
         self,
@@ -25,70 +130,22 @@ class HubspotAuthenticator:
         """
         self.target_name: str = target.name
         self._config: Dict[str, Any] = target._config
-        self._auth_headers: Dict[str, Any] = {}
-        self._auth_params: Dict[str, Any] = {}
         self.logger: logging.Logger = target.logger
         self._auth_endpoint = auth_endpoint
-        self._config_file = target.config_file
         self._target = target
         self.state = state
 
     @property
     def auth_headers(self) -> dict:
-        if not self.is_token_valid():
-            self.update_access_token()
+        try:
+            access_token = TOKEN_MANAGER.access_token(self._config)
+        except InvalidCredentialsError:
+            if TOKEN_MANAGER.last_error_response:
+                self.state.update({"auth_error_response": TOKEN_MANAGER.last_error_response})
+            raise
         result = {}
-        result["Authorization"] = f"Bearer {self._config.get('access_token')}"
+        result["Authorization"] = f"Bearer {access_token}"
         return result
 
-    @property
-    def oauth_request_body(self) -> dict:
-        """Define the OAuth request body for the hubspot API."""
-        return {
-        "grant_type": "refresh_token",
-        "redirect_uri": self._config.get("redirect_uri"),
-        "refresh_token": self._config.get("refresh_token"),
-        "client_id": self._config.get("client_id"),
-        "client_secret": self._config.get("client_secret"),
-    }
-
-    def is_token_valid(self) -> bool:
-        access_token = self._config.get("access_token")
-        now = round(datetime.utcnow().timestamp())
-        expires_in = self._config.get("expires_in")
-        if  expires_in is not None:
-            expires_in = int(expires_in)
-        if not access_token:
-            return False
-        if not expires_in:
-            return False
-        return not ((expires_in - now) < 120)
-
-    @backoff.on_exception(backoff.expo, Exception, max_tries=3)
-    def update_access_token(self) -> None:
-        self.logger.info(f"Oauth request - endpoint: {self._auth_endpoint}, body: {self.oauth_request_body}")
-        token_response = requests.post(
-            self._auth_endpoint, data=self.oauth_request_body
-        )
-        try:
-            token_response.raise_for_status()
-            self.logger.info("OAuth authorization attempt was successful.")
-        except Exception as ex:
-            self.state.update({"auth_error_response": token_response.text})
-            raise InvalidCredentialsError(
-                f"Failed OAuth login, response was '{token_response.text}'. {ex}"
-            )
-        token_json = token_response.json()
-        #Log the refresh_token
-        self.logger.info(f"Latest refresh token: {token_json['refresh_token']}")
-        self.access_token = token_json["access_token"]
-        self._config["access_token"] = token_json["access_token"]
-        self._config["refresh_token"] = token_json["refresh_token"]
-        now = round(datetime.utcnow().timestamp())
-        self._config["expires_in"] = now + token_json["expires_in"]
-
-        with open(self._target.config_file, "w") as outfile:
-            json.dump(self._config, outfile, indent=4)
-
 class HubspotApiKeyAuthenticator:
-    auth_headers = {}
\ No newline at end of file
+    auth_headers = {}
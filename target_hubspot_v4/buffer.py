@@ -0,0 +1,115 @@
+"""Record buffering shared by sinks that write records when they are drained."""
+
+from abc import ABC, abstractmethod
+
+from target_hubspot_v4.metrics import METRICS
+from target_hubspot_v4.profiling import PROFILER
+
+
+class _Buffered:
+    """Outcome of a buffered record, falsy so the SDK does not log it as processed."""
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "BUFFERED"
+
+
+BUFFERED = _Buffered()
+
+
+class BufferedSinkMixin(ABC):
+    """
+    Buffers records instead of upserting them one by one when `buffer_records` is on.
+    The SDK's `process_record` runs as usual: `upsert_record` queues the record and the
+    state update the SDK then makes for it only completes the queued entry. The sink
+    writes single records in `write_record` and `self._pending_records` in `flush_buffer`,
+    setting `id` and `error` (and optionally `success` and `state_updates`) on every entry,
+    and updates the state with `update_batch_entry_state` in input order.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._pending_records = []
+        super().__init__(*args, **kwargs)
+
+    @property
+    def buffer_records(self):
+        return False
+
+    @property
+    def current_size(self) -> int:
+        return len(self._pending_records)
+
+    def process_batch(self, context: dict) -> None:
+        # sinks are drained outside of any record message, attribute the flush to the stream here
+        with METRICS.stream(self.stream_name), PROFILER.stream(self.stream_name):
+            self.flush_buffer(context)
+
+    @abstractmethod
+    def flush_buffer(self, context: dict) -> None:
+        """Write the buffered records."""
+
+    @abstractmethod
+    def write_record(self, record: dict, context: dict):
+        """Write a single record, returning (id, success, state_updates) like the SDK's `upsert_record`."""
+
+    def upsert_record(self, record: dict, context: dict):
+        if not self.buffer_records:
+            return self.write_record(record, context)
+        self._pending_records.append({
+            "record": record,
+            "hash": None,
+            "external_id": None,
+            "snapshot_field_values": None,
+            "id": None,
+            "error": None,
+        })
+        return None, BUFFERED, {}
+
+    def update_state(self, state: dict, is_duplicate: bool = False, record: dict = None, snapshot_field_values: dict = None) -> None:
+        if state.get("success") is BUFFERED:
+            # the record was queued by upsert_record, its state is updated once it is written
+            self._pending_records[-1].update(
+                hash=state["hash"],
+                external_id=state.get("externalId"),
+                snapshot_field_values=snapshot_field_values,
+            )
+            return
+        super().update_state(
+            state, is_duplicate=is_duplicate, record=record, snapshot_field_values=snapshot_field_values
+        )
+
+    def update_batch_entry_state(self, entry):
+        record = entry["record"]
+        if entry["error"] is not None:
+            self.logger.error(f"Upsert record error {str(entry['error'])}")
+            self.update_state(
+                self._build_record_error_state(
+                    entry["error"],
+                    record=record,
+                    external_id=entry["external_id"],
+                    record_hash=entry["hash"],
+                ),
+                record=record,
+            )
+            return
+
+        success = entry.get("success", True)
+        if success:
+            self.logger.info(f"{self.name} processed id: {entry['id']}")
+        state = {"success": success, "hash": entry["hash"]}
+        if entry["id"]:
+            state["id"] = entry["id"]
+        if entry["external_id"]:
+            state["externalId"] = entry["external_id"]
+
+        state_updates = dict(entry.get("state_updates") or {})
+        is_duplicate = bool(state_updates.pop("existing", False))
+        state.update(state_updates)
+        self.update_state(
+            state,
+            is_duplicate=is_duplicate,
+            record=record,
+            snapshot_field_values=entry["snapshot_field_values"],
+        )
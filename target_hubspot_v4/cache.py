@@ -0,0 +1,142 @@
+"""In-run caches shared by the sinks and the request helpers."""
+
+import copy
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("target-hubspot-v4")
+
+
+def normalize_lookup_value(value):
+    """Normalize a lookup value the way HubSpot compares it (case-insensitive, trimmed)."""
+    if value is None:
+        return None
+    return str(value).strip().lower()
+
+
+class LookupCache:
+    """
+    Bounded LRU cache of object lookups keyed by (object type, properties, normalized values).
+    Empty results are cached too, so repeated lookups of a missing object cost nothing.
+    Entries are dropped when this process writes an object they refer to or one of the
+    looked up values, see `invalidate`.
+    """
+
+    def __init__(self, max_size: int = 10000) -> None:
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._keys_by_value = {}
+        self._keys_by_id = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(object_name, lookup: dict, properties=None):
+        property_names = tuple(sorted(lookup))
+        return (
+            object_name,
+            property_names,
+            tuple(normalize_lookup_value(lookup[name]) for name in property_names),
+            tuple(sorted(properties)) if properties else None,
+        )
+
+    def get(self, object_name, lookup: dict, properties=None):
+        """Return (True, cached result) on a hit and (False, None) on a miss."""
+        if not self.max_size:
+            return False, None
+        key = self.make_key(object_name, lookup, properties)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, copy.deepcopy(self._entries[key])
+            self.misses += 1
+            return False, None
+
+    def set(self, object_name, lookup: dict, result, properties=None) -> None:
+        if not self.max_size:
+            return
+        key = self.make_key(object_name, lookup, properties)
+        with self._lock:
+            if key in self._entries:
+                self._unindex(key)
+            self._entries[key] = copy.deepcopy(result)
+            self._entries.move_to_end(key)
+            self._index(key, result)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, object_name, id=None, properties: dict = None) -> None:
+        """
+        Bring the cache in line with object `id` having been written with `properties`.
+        Entries about that object whose looked up values changed are dropped, and lookups
+        that the object now matches (including cached "not found" results) get it added.
+        """
+        written = {name: normalize_lookup_value(value) for name, value in (properties or {}).items()}
+        id = str(id) if id else None
+        with self._lock:
+            for key in list(self._keys_by_id.get((object_name, id), ())):
+                _, property_names, values, extra = key
+                changed = any(name in written and written[name] != value for name, value in zip(property_names, values))
+                if extra is not None or changed:
+                    self._drop(key)
+
+            for name, value in written.items():
+                for key in list(self._keys_by_value.get((object_name, name, value), ())):
+                    result = self._entries[key]
+                    if id and id in [str(obj["id"]) for obj in self._result_objects(result)]:
+                        continue
+                    _, property_names, values, extra = key
+                    matches = all(written.get(name) == value for name, value in zip(property_names, values))
+                    if id and extra is None and isinstance(result, list) and matches:
+                        obj = {"id": id, "properties": {name: properties[name] for name in property_names}}
+                        self._unindex(key)
+                        self._entries[key] = result + [obj]
+                        self._index(key, self._entries[key])
+                    else:
+                        self._drop(key)
+
+    def _drop(self, key) -> None:
+        self._unindex(key)
+        del self._entries[key]
+
+    def _index(self, key, result) -> None:
+        object_name, property_names, values, _ = key
+        for name, value in zip(property_names, values):
+            self._keys_by_value.setdefault((object_name, name, value), set()).add(key)
+        for obj in self._result_objects(result):
+            self._keys_by_id.setdefault((object_name, str(obj["id"])), set()).add(key)
+
+    def _unindex(self, key) -> None:
+        object_name, property_names, values, _ = key
+        index_keys = [(self._keys_by_value, (object_name, name, value)) for name, value in zip(property_names, values)]
+        index_keys += [(self._keys_by_id, (object_name, str(obj["id"]))) for obj in self._result_objects(self._entries[key])]
+        for index, index_key in index_keys:
+            keys = index.get(index_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[index_key]
+
+    @staticmethod
+    def _result_objects(result):
+        if isinstance(result, dict):
+            result = [result]
+        return [obj for obj in result or [] if isinstance(obj, dict) and obj.get("id")]
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def log_stats(self) -> None:
+        if self.hits or self.misses:
+            logger.info(
+                f"Lookup cache: {self.hits} hits, {self.misses} misses, "
+                f"hit rate {self.hit_rate:.1%}, {len(self._entries)} entries"
+            )
+
+
+LOOKUP_CACHE = LookupCache()
@@ -1,12 +1,15 @@
 from hotglue_singer_sdk.target_sdk.client import HotglueSink
 from hotglue_singer_sdk.plugin_base import PluginBase
 from typing import Dict, List, Optional, Any
-from target_hubspot_v4.auth import HubspotAuthenticator, HubspotApiKeyAuthenticator
+from target_hubspot_v4.auth import TOKEN_URL, HubspotAuthenticator, HubspotApiKeyAuthenticator
 import ast
 import json
-import backoff
 import requests
 from target_hubspot_v4 import utils
+from target_hubspot_v4.rate_limit import RATE_LIMITER
+from target_hubspot_v4.retry import RETRY_POLICY
+from target_hubspot_v4.transport import TRANSPORT
+from hotglue_singer_sdk.target_sdk.common import HGJSONEncoder
 
 class HubspotSink(HotglueSink):
 
@@ -35,6 +38,7 @@ class HubspotSink(HotglueSink):
         return "https://api.hubapi.com/crm/v3/objects"
 
     api_key = None
+    _authenticator = None
     
     @property
     def authenticator(self):
@@ -42,11 +46,12 @@ class HubspotSink(HotglueSink):
         if self.config.get("hapikey"):
             self.api_key = self.config.get("hapikey")
             return HubspotApiKeyAuthenticator()
-        # auth with acces token
-        url = "https://api.hubapi.com/oauth/v1/token"
-        return HubspotAuthenticator(
-            self._target, self.auth_state, url
-        )
+        # auth with acces token, the token itself is shared by every sink
+        if self._authenticator is None:
+            self._authenticator = HubspotAuthenticator(
+                self._target, self.auth_state, TOKEN_URL
+            )
+        return self._authenticator
 
     @property
     def params(
@@ -68,6 +73,27 @@ class HubspotSink(HotglueSink):
             return [stream_lookup_field]
         return stream_lookup_field
 
+    @property
+    def unique_fields(self):
+        """Properties with unique values that HubSpot accepts as `idProperty`."""
+        unique_field_configuration = self.config.get("unique_lookup_fields", {})
+        unique_fields = unique_field_configuration.get(self.name.lower())
+
+        if not unique_fields and self.name == 'contacts':
+            return ['email']
+
+        if isinstance(unique_fields, str):
+            return [unique_fields]
+        return unique_fields or []
+
+    @property
+    def unique_lookup_field(self):
+        """Lookup field HubSpot accepts as `idProperty`, when it is the only lookup field."""
+        lookup_fields = self.lookup_fields or []
+        if len(lookup_fields) == 1 and lookup_fields[0] in self.unique_fields:
+            return lookup_fields[0]
+        return None
+
     @property
     def lookup_method(self):
         return self.config.get("lookup_method", "all")
@@ -92,18 +118,32 @@ class HubspotSink(HotglueSink):
             obj = json.dumps(obj)
         return obj
 
+    def _request(
+        self, http_method, endpoint, params={}, request_data=None, headers={}, verify=True
+    ):
+        # same as the SDK, through the shared transport instead of a new connection per request
+        url = self.url(endpoint)
+        headers = dict(headers)
+        headers.update(self.default_headers)
+        headers.update({"Content-Type": "application/json"})
+        params = dict(params)
+        params.update(self.params)
+        data = json.dumps(request_data, cls=HGJSONEncoder) if request_data else None
+
+        RATE_LIMITER.acquire(url)
+        response = TRANSPORT.request(http_method, url, params=params, headers=headers, data=data, verify=verify)
+        self.validate_response(response)
+        return response
+
     def validate_response(self, response: requests.Response) -> None:
+        RATE_LIMITER.observe(response.url, response)
         utils.raise_etl_exceptions(response)
         return super().validate_response(response)
 
-    @backoff.on_exception(
-        backoff.constant,
-    (requests.exceptions.RequestException, requests.exceptions.HTTPError),
-    max_tries=5,
-    jitter=None,
-    giveup=utils.giveup,
-    on_giveup=utils.on_giveup,
-    interval=10,
-    )
+    def request_decorator(self, func):
+        # retries are handled by request_api with the shared retry policy
+        return func
+
+    @RETRY_POLICY.retry(giveup=utils.giveup, on_giveup=utils.on_giveup)
     def request_api(self, method, endpoint, request_data=None):
         return super().request_api(method, endpoint=endpoint, request_data=request_data)
@@ -0,0 +1,145 @@
+"""Small asyncio engine running the dependent requests of a record as a graph."""
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class Workflow:
+    """
+    Dependency graph of the steps writing one record. A step is a coroutine function
+    receiving the results of the steps run so far, keyed by step name, and starts as
+    soon as the steps it comes after are done. Steps can only come after steps that
+    were added before them, so a workflow cannot have cycles.
+    """
+
+    def __init__(self) -> None:
+        self.steps = {}
+
+    def add(self, name, func, after=()):
+        missing = [step for step in after if step not in self.steps]
+        if missing:
+            raise ValueError(f"Step {name} comes after unknown steps {missing}")
+        self.steps[name] = (func, tuple(after))
+        return name
+
+    async def run(self):
+        """Run every step, failing with the first error raised. Steps still running are cancelled."""
+        results = {}
+        tasks = {}
+
+        async def run_step(name, func, after):
+            if after:
+                await asyncio.gather(*(tasks[step] for step in after))
+            results[name] = await func(results)
+
+        for name, (func, after) in self.steps.items():
+            tasks[name] = asyncio.ensure_future(run_step(name, func, after))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return results
+
+    def run_inline(self):
+        """
+        Run every step in the order they were added, without an event loop, for steps
+        only awaiting `call` and `gather` of a runner running inline.
+        """
+        results = {}
+        for name, (func, _) in self.steps.items():
+            coroutine = func(results)
+            try:
+                coroutine.send(None)
+            except StopIteration as stop:
+                results[name] = stop.value
+                continue
+            coroutine.close()
+            raise RuntimeError(f"Step {name} awaited something else than WorkflowRunner.call or gather")
+        return results
+
+
+class WorkflowRunner:
+    """
+    Runs workflows on an asyncio loop. The requests of their steps are blocking and
+    go through `call`, on a pool of `max_workers` threads kept for the life of the
+    runner, which bounds the number of requests in flight. With a single worker no
+    two requests overlap, so workflows run inline, one step after another, without
+    an event loop or thread pool.
+    """
+
+    def __init__(self, max_workers=1) -> None:
+        self.max_workers = max_workers
+        self._executor = None
+
+    @property
+    def inline(self):
+        return self.max_workers <= 1
+
+    async def call(self, func, *args, **kwargs):
+        """Run a blocking function, usually a request helper, off the event loop, in the current context."""
+        if self.inline:
+            return func(*args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(contextvars.copy_context().run, func, *args, **kwargs)
+        )
+
+    async def gather(self, *coroutines):
+        """Await coroutines of `call` concurrently, or one after another when running inline."""
+        if self.inline:
+            return [await coroutine for coroutine in coroutines]
+        return await asyncio.gather(*coroutines)
+
+    def run(self, workflow):
+        """Run a single workflow and return the results of its steps."""
+        return self.run_all([[lambda: workflow]], raise_errors=True)[0][0]
+
+    def run_all(self, chains, raise_errors=False):
+        """
+        Run chains of workflows concurrently, the workflows of a chain one after another.
+        Chains are lists of callables building a workflow. Returns, for every chain, the
+        results of each workflow or the exception that failed it.
+        """
+
+        if self.inline:
+            return [self._run_chain_inline(chain, raise_errors) for chain in chains]
+
+        async def run_chain(chain):
+            outcomes = []
+            for build_workflow in chain:
+                try:
+                    outcomes.append(await build_workflow().run())
+                except Exception as e:
+                    if raise_errors:
+                        raise
+                    outcomes.append(e)
+            return outcomes
+
+        async def run_chains():
+            return await asyncio.gather(*(run_chain(chain) for chain in chains))
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return asyncio.run(run_chains())
+
+    @staticmethod
+    def _run_chain_inline(chain, raise_errors):
+        outcomes = []
+        for build_workflow in chain:
+            try:
+                outcomes.append(build_workflow().run_inline())
+            except Exception as e:
+                if raise_errors:
+                    raise
+                outcomes.append(e)
+        return outcomes
+
+    def close(self) -> None:
+        """Stop the worker threads, a later run starts new ones."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,153 @@
+"""Hashes of the properties last written to each object, kept across runs to skip unchanged updates."""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from target_hubspot_v4.cache import normalize_lookup_value
+from target_hubspot_v4.metrics import METRICS
+
+logger = logging.getLogger("target-hubspot-v4")
+
+DEFAULT_TTL_HOURS = 168
+# hashes written to the store at once
+FLUSH_SIZE = 1000
+
+
+def normalize_property_value(value):
+    """A property value the way HubSpot stores it, so equal values hash the same whatever their type."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return str(value).strip()
+
+
+def properties_hash(properties):
+    payload = json.dumps(
+        {name: normalize_property_value(value) for name, value in (properties or {}).items()}, sort_keys=True
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class WriteHashStore:
+    """
+    SQLite store of the hash of the properties last written to each object, by object id
+    and by unique lookup value, when `change_detection_path` is set. An update whose
+    properties hash the same as the last write is skipped. Hashes older than
+    `change_detection_ttl_hours` are ignored, so edits made in HubSpot are overwritten
+    eventually, and `change_detection_refresh` writes every record and stores new hashes.
+    """
+
+    def __init__(self) -> None:
+        self.path = None
+        self.ttl = None
+        self.refresh = False
+        self.skipped = Counter()
+        self.recorded = 0
+        self._connection = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._connection is not None
+
+    def configure(self, config) -> None:
+        self.close()
+        self.path = config.get("change_detection_path") or None
+        ttl_hours = config.get("change_detection_ttl_hours", DEFAULT_TTL_HOURS)
+        self.ttl = float(ttl_hours) * 3600 if ttl_hours else None
+        self.refresh = bool(config.get("change_detection_refresh", False))
+        if self.path:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS write_hashes ("
+                "object TEXT NOT NULL, key TEXT NOT NULL, id TEXT NOT NULL, hash TEXT NOT NULL, "
+                "written_at REAL NOT NULL, PRIMARY KEY (object, key)) WITHOUT ROWID"
+            )
+            self._connection.commit()
+
+    @staticmethod
+    def keys(id=None, lookup=None):
+        keys = [f"id:{id}"] if id else []
+        for name, value in (lookup or {}).items():
+            value = normalize_lookup_value(value)
+            if value:
+                keys.append(f"{name}:{value}")
+        return keys
+
+    def unchanged(self, object_name, properties, id=None, lookup=None):
+        """
+        The id of the object when `properties` are the same as last written to it, found by
+        `id` or else by the `lookup` property values, or None when the write is needed.
+        """
+        if not self.enabled or self.refresh:
+            return None
+        properties_digest = properties_hash(properties)
+        oldest = time.time() - self.ttl if self.ttl else None
+        with self._lock:
+            for key in self.keys(id, lookup):
+                row = self._pending.get((object_name, key))
+                if row is None:
+                    row = self._connection.execute(
+                        "SELECT id, hash, written_at FROM write_hashes WHERE object = ? AND key = ?", (object_name, key)
+                    ).fetchone()
+                if row is None:
+                    continue
+                stored_id, digest, written_at = row
+                if digest != properties_digest or (oldest is not None and written_at < oldest):
+                    return None
+                if id and stored_id != str(id):
+                    return None
+                self.skipped[object_name] += 1
+                METRICS.count_skipped_write()
+                return stored_id
+        return None
+
+    def record(self, object_name, id, properties, lookup=None) -> None:
+        """Remember the properties written to object `id`."""
+        if not self.enabled or not id:
+            return
+        row = (str(id), properties_hash(properties), time.time())
+        with self._lock:
+            for key in self.keys(id, lookup):
+                self._pending[(object_name, key)] = row
+            self.recorded += 1
+            if len(self._pending) >= FLUSH_SIZE:
+                self._flush()
+
+    def _flush(self) -> None:
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO write_hashes (object, key, id, hash, written_at) VALUES (?, ?, ?, ?, ?)",
+            [(object_name, key, *row) for (object_name, key), row in self._pending.items()],
+        )
+        self._connection.commit()
+        self._pending = {}
+
+    def close(self) -> None:
+        """Write the pending hashes and close the store."""
+        with self._lock:
+            if self._connection is None:
+                return
+            self._flush()
+            self._connection.close()
+            self._connection = None
+
+    def log_stats(self) -> None:
+        if self.enabled:
+            logger.info(
+                f"Change detection: skipped {sum(self.skipped.values())} unchanged writes "
+                f"{dict(self.skipped)}, stored {self.recorded} hashes"
+            )
+
+
+WRITE_HASHES = WriteHashStore()
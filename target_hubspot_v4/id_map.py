@@ -0,0 +1,129 @@
+"""Ids of the objects matching each lookup value, carried from run to run in the Singer state."""
+
+import base64
+import json
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+
+from target_hubspot_v4.cache import normalize_lookup_value
+
+logger = logging.getLogger("target-hubspot-v4")
+
+STATE_KEY = "lookup_ids"
+DEFAULT_MAX_IDS = 100000
+
+
+class IdMap:
+    """
+    Ids of the objects found or written for each combination of lookup values, when
+    `lookup_state` is set. The map is read from the state the target is started with
+    and written to the state it emits, so the next run only searches for the values it
+    has not seen. Each object keeps the `lookup_state_max_ids` most recently used ids,
+    and the map is stored zlib compressed with `lookup_state_compress`.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.max_ids = DEFAULT_MAX_IDS
+        self.compress = False
+        self.hits = 0
+        self.misses = 0
+        self._fields = {}
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def configure(self, config, state=None) -> None:
+        self.enabled = bool(config.get("lookup_state", False))
+        self.max_ids = int(config.get("lookup_state_max_ids", DEFAULT_MAX_IDS))
+        self.compress = bool(config.get("lookup_state_compress", False))
+        self._fields = {}
+        self._ids = {}
+        if self.enabled and state:
+            self.load(state)
+
+    def load(self, state) -> None:
+        mappings = state.get(STATE_KEY) or (state.get("target") or {}).get(STATE_KEY)
+        if isinstance(mappings, str):
+            mappings = json.loads(zlib.decompress(base64.b64decode(mappings)))
+        for object_name, mapping in (mappings or {}).items():
+            self._fields[object_name] = tuple(mapping["fields"])
+            self._ids[object_name] = OrderedDict(mapping["ids"])
+        if mappings:
+            logger.info(f"Loaded {sum(len(ids) for ids in self._ids.values())} known ids from the state")
+
+    @staticmethod
+    def _key(lookup):
+        fields = tuple(sorted(lookup))
+        values = [normalize_lookup_value(lookup[field]) for field in fields]
+        if not all(values):
+            return fields, None
+        return fields, "\t".join(values)
+
+    def get(self, object_name, lookup):
+        """Id of the `object_name` matching every value of `lookup` in a previous run or this one, if known."""
+        if not self.enabled or not lookup:
+            return None
+        fields, key = self._key(lookup)
+        if key is None:
+            return None
+        with self._lock:
+            ids = self._ids.get(object_name) if self._fields.get(object_name) == fields else None
+            id = ids.get(key) if ids else None
+            if id is None:
+                self.misses += 1
+                return None
+            ids.move_to_end(key)
+            self.hits += 1
+            return id
+
+    def set(self, object_name, lookup, id) -> None:
+        if not self.enabled or not lookup or not id:
+            return
+        fields, key = self._key(lookup)
+        if key is None:
+            return
+        with self._lock:
+            if self._fields.get(object_name) != fields:
+                # the lookup fields changed since the ids were stored
+                self._fields[object_name] = fields
+                self._ids[object_name] = OrderedDict()
+            ids = self._ids[object_name]
+            ids[key] = str(id)
+            ids.move_to_end(key)
+            while len(ids) > self.max_ids:
+                ids.popitem(last=False)
+
+    def discard(self, object_name, lookup) -> None:
+        """Forget an id that turned out to be stale, e.g. of an object deleted in HubSpot."""
+        if not self.enabled or not lookup:
+            return
+        fields, key = self._key(lookup)
+        with self._lock:
+            if self._fields.get(object_name) == fields:
+                self._ids[object_name].pop(key, None)
+
+    def write_state(self, state) -> None:
+        """Add the map to the state the target emits."""
+        if not self.enabled:
+            return
+        with self._lock:
+            mappings = {
+                object_name: {"fields": list(self._fields[object_name]), "ids": dict(ids)}
+                for object_name, ids in self._ids.items()
+            }
+        if self.compress:
+            payload = json.dumps(mappings, separators=(",", ":")).encode()
+            mappings = base64.b64encode(zlib.compress(payload, 9)).decode()
+        state[STATE_KEY] = mappings
+
+    def log_stats(self) -> None:
+        if self.enabled:
+            logger.info(
+                f"Known ids: {self.hits} lookups skipped, {self.misses} searched, "
+                f"{sum(len(ids) for ids in self._ids.values())} ids kept in the state"
+            )
+
+
+ID_MAP = IdMap()
@@ -0,0 +1,252 @@
+"""Bulk writes of large streams through the HubSpot Imports API, from records spooled to disk."""
+
+import csv
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import requests
+from hotglue_singer_sdk.target_sdk.common import HGJSONEncoder
+
+from target_hubspot_v4.hashes import normalize_property_value
+from target_hubspot_v4.retry import RETRY_POLICY
+from target_hubspot_v4.utils import (
+    get_params_and_headers,
+    giveup,
+    logger,
+    raise_etl_exceptions,
+    raise_for_status,
+    request,
+    send_request,
+)
+
+IMPORTS_URL = "https://api.hubapi.com/crm/v3/imports"
+# HubSpot accepts at most 1,048,576 rows per imported file
+DEFAULT_MAX_ROWS = 1000000
+DEFAULT_POLL_INTERVAL = 10
+DEFAULT_TIMEOUT_MINUTES = 720
+FINAL_STATES = ["DONE", "FAILED", "CANCELED"]
+# the import error line numbers count the header as line 1
+FIRST_LINE_NUMBER = 2
+# object type ids the column mappings and import operations are keyed by
+OBJECT_TYPE_IDS = {
+    "contacts": "0-1",
+    "companies": "0-2",
+    "deals": "0-3",
+    "tickets": "0-5",
+    "products": "0-7",
+    "line_items": "0-8",
+    "tasks": "0-27",
+    "notes": "0-46",
+    "meetings": "0-47",
+    "calls": "0-48",
+    "emails": "0-49",
+}
+CHUNK_SIZE = 1024 * 1024
+
+
+def object_type_id(object_name):
+    """Type id of a standard object, custom objects being named by their type id, e.g. `2-1234`."""
+    return OBJECT_TYPE_IDS.get(object_name.lower(), object_name)
+
+
+class ImportSpool:
+    """
+    Buffered records of a stream appended to a JSON lines file as they are flushed, so
+    streams of millions of records are imported without holding them in memory. The
+    properties seen are kept in order of appearance for the columns of the import.
+    """
+
+    def __init__(self, directory, name) -> None:
+        self.path = os.path.join(directory, f"{name}.{uuid.uuid4().hex}.jsonl")
+        self.rows = 0
+        self.columns = {}
+
+    def append(self, entries) -> None:
+        with open(self.path, "a") as outfile:
+            for entry in entries:
+                self.columns.update(dict.fromkeys(entry["record"].get("properties") or {}))
+                spooled = {key: entry[key] for key in ("record", "hash", "external_id", "snapshot_field_values")}
+                outfile.write(json.dumps(spooled, cls=HGJSONEncoder) + "\n")
+                self.rows += 1
+
+    def read(self, size):
+        """Take the spooled records back in lists of at most `size` buffer entries, emptying the spool."""
+        if not self.rows:
+            return
+        with open(self.path) as infile:
+            chunk = []
+            for line in infile:
+                chunk.append(dict(json.loads(line), id=None, error=None))
+                if len(chunk) >= size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        self.remove()
+
+    def remove(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.rows = 0
+
+
+class ImportFile:
+    """
+    CSV file of one import, with the buffer entries of its rows kept in a JSON lines
+    file alongside, in the same order, to map the import errors back to the records.
+    """
+
+    def __init__(self, directory, name, columns) -> None:
+        base = os.path.join(directory, f"{name}.{uuid.uuid4().hex}")
+        self.path = f"{base}.csv"
+        self.entries_path = f"{base}.rows.jsonl"
+        self.file_name = f"{name}.csv"
+        self.columns = list(columns)
+        self.rows = 0
+        self._csv_file = open(self.path, "w", newline="")
+        self._entries_file = open(self.entries_path, "w")
+        self._writer = csv.writer(self._csv_file)
+        self._writer.writerow(self.columns)
+
+    def add(self, entry) -> None:
+        properties = entry["record"].get("properties") or {}
+        row = [normalize_property_value(properties.get(column)) for column in self.columns]
+        self._writer.writerow(["" if value is None else value for value in row])
+        spooled = {key: entry[key] for key in ("record", "hash", "external_id", "snapshot_field_values")}
+        self._entries_file.write(json.dumps(spooled, cls=HGJSONEncoder) + "\n")
+        self.rows += 1
+
+    def close(self) -> None:
+        self._csv_file.close()
+        self._entries_file.close()
+
+    def entries(self):
+        with open(self.entries_path) as infile:
+            for line in infile:
+                yield dict(json.loads(line), id=None, error=None)
+
+    def remove(self) -> None:
+        self.close()
+        for path in (self.path, self.entries_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class MultipartBody:
+    """Multipart form of an import request and its CSV file, read from disk as it is sent."""
+
+    def __init__(self, import_request, path, file_name) -> None:
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.path = path
+        self.head = (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="importRequest"\r\n'
+            "Content-Type: application/json\r\n\r\n"
+            f"{json.dumps(import_request)}\r\n"
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="files"; filename="{file_name}"\r\n'
+            "Content-Type: text/csv\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{boundary}--\r\n".encode()
+
+    def __len__(self):
+        return len(self.head) + os.path.getsize(self.path) + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        with open(self.path, "rb") as infile:
+            while True:
+                chunk = infile.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield self.tail
+
+
+def build_import_request(name, object_name, file_name, columns, id_column=None, unique_column=None):
+    """
+    Import request of a CSV file whose columns are named after the properties they hold.
+    The id column is mapped as the record id and the unique column as the alternate id
+    records are matched by, the import updating existing objects when either is present.
+    """
+    type_id = object_type_id(object_name)
+    column_mappings = []
+    for column in columns:
+        mapping = {"columnObjectTypeId": type_id, "columnName": column, "propertyName": column}
+        if column == id_column:
+            mapping.update(propertyName="hs_object_id", columnType="HUBSPOT_OBJECT_ID")
+        elif column == unique_column:
+            mapping["columnType"] = "HUBSPOT_ALTERNATE_ID"
+        column_mappings.append(mapping)
+    return {
+        "name": name,
+        "importOperations": {type_id: "UPSERT" if id_column or unique_column else "CREATE"},
+        "dateFormat": "YEAR_MONTH_DAY",
+        "files": [{
+            "fileName": file_name,
+            "fileFormat": "CSV",
+            "fileImportPage": {"hasHeader": True, "columnMappings": column_mappings},
+        }],
+    }
+
+
+@RETRY_POLICY.retry(giveup=giveup)
+def submit_import(config, import_request, path, file_name):
+    """Start an import of the CSV file at `path`, returning the import."""
+    params, headers = get_params_and_headers(config, None)
+    body = MultipartBody(import_request, path, file_name)
+    headers["Content-Type"] = body.content_type
+    req = requests.Request("POST", IMPORTS_URL, data=body, headers=headers, params=params).prepare()
+    logger.info(f"POST {req.url} with {file_name}")
+    resp = send_request(req)
+    raise_etl_exceptions(resp)
+    raise_for_status(resp)
+    return resp.json()
+
+
+def wait_for_import(config, import_id, poll_interval=DEFAULT_POLL_INTERVAL, timeout=None):
+    """Poll an import until it is done, failed or canceled, returning it in its final state."""
+    started_at = time.monotonic()
+    while True:
+        hubspot_import = request(config, f"{IMPORTS_URL}/{import_id}").json()
+        state = hubspot_import.get("state")
+        if state in FINAL_STATES:
+            return hubspot_import
+        if timeout is not None and time.monotonic() - started_at > timeout:
+            raise Exception(f"Import {import_id} is still {state} after {timeout} seconds")
+        logger.info(f"Import {import_id} is {state}, {hubspot_import.get('metadata', {}).get('counters', {})}")
+        time.sleep(poll_interval)
+
+
+def read_import_errors(config, import_id):
+    """Errors of an import by row, counted from 0, and the errors of no row in particular."""
+    errors_by_row, other_errors = {}, []
+    params = {"limit": 500}
+    while True:
+        response = request(config, f"{IMPORTS_URL}/{import_id}/errors", params=dict(params)).json()
+        for error in response.get("results", []):
+            message = error.get("errorType") or "IMPORT_ERROR"
+            if error.get("invalidValue") is not None:
+                message = f"{message}: {error['invalidValue']}"
+            if error.get("message"):
+                message = f"{message} ({error['message']})"
+            line_number = (error.get("sourceData") or {}).get("lineNumber")
+            if line_number is None:
+                other_errors.append(message)
+            else:
+                errors_by_row.setdefault(int(line_number) - FIRST_LINE_NUMBER, []).append(message)
+        after = response.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            return errors_by_row, other_errors
+        params["after"] = after
+
+
+def import_directory(config):
+    """Directory the spooled records and import files are written to."""
+    directory = config.get("import_directory") or os.path.join(tempfile.gettempdir(), "target-hubspot-v4-imports")
+    os.makedirs(directory, exist_ok=True)
+    return directory
@@ -0,0 +1,269 @@
+"""Pre-warmed local indexes of existing HubSpot objects by lookup property."""
+
+import hashlib
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from target_hubspot_v4.cache import normalize_lookup_value
+from target_hubspot_v4.utils import SEARCH_RESULTS_CAP, logger, request, request_push
+
+PAGE_SIZE = 100
+# pairs sorted at once when freezing a compact index, bounding the Python objects alive at a time
+SORT_RUN_SIZE = 1 << 20
+
+
+class ObjectIndex:
+    """
+    In-memory map of lookup values to the ids of the objects holding them.
+
+    One index is kept per lookup key: the tuple of all lookup fields, plus each
+    single field when `sequential` is set. In compact mode keys are stored as
+    64-bit hashes in sorted arrays (about 16 bytes per object and key), which
+    keeps portals with millions of records in memory; a hash collision would
+    surface as a "multiple objects found" error.
+    """
+
+    def __init__(self, object_name, lookup_fields, sequential=False, compact=False) -> None:
+        self.object_name = object_name
+        self.lookup_fields = list(lookup_fields)
+        self.keys = [tuple(self.lookup_fields)]
+        if sequential and len(self.lookup_fields) > 1:
+            self.keys += [(field,) for field in self.lookup_fields]
+        self.compact = compact
+        self._lock = threading.Lock()
+        self._maps = {key: {} for key in self.keys}
+        self._hashes = {key: array("Q") for key in self.keys}
+        self._ids = {key: array("Q") for key in self.keys}
+        # objects written during the run, on top of the warmed up data
+        self._written = {key: {} for key in self.keys}
+        self.size = 0
+
+    @property
+    def properties(self):
+        return self.lookup_fields
+
+    def _values(self, key, properties):
+        values = tuple(normalize_lookup_value(properties.get(field)) for field in key)
+        if any(value in (None, "") for value in values):
+            return None
+        return values
+
+    @staticmethod
+    def _hash(values):
+        digest = hashlib.blake2b("\x1f".join(values).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def add(self, obj) -> None:
+        properties = obj.get("properties") or {}
+        with self._lock:
+            self.size += 1
+            for key in self.keys:
+                values = self._values(key, properties)
+                if values is None:
+                    continue
+                if self.compact:
+                    self._hashes[key].append(self._hash(values))
+                    self._ids[key].append(int(obj["id"]))
+                else:
+                    self._maps[key].setdefault(values, []).append(str(obj["id"]))
+
+    def freeze(self) -> None:
+        """Sort the compact arrays once loading is done so they can be binary searched."""
+        if not self.compact:
+            return
+        for key in self.keys:
+            hashes, ids = self._hashes[key], self._ids[key]
+            # sort the hash/id pairs in runs written back in place, then merge the runs
+            runs = []
+            for start in range(0, len(hashes), SORT_RUN_SIZE):
+                end = min(start + SORT_RUN_SIZE, len(hashes))
+                pairs = sorted(zip(hashes[start:end], ids[start:end]))
+                hashes[start:end] = array("Q", (pair[0] for pair in pairs))
+                ids[start:end] = array("Q", (pair[1] for pair in pairs))
+                runs.append((start, end))
+            if len(runs) < 2:
+                continue
+            sorted_hashes, sorted_ids = array("Q"), array("Q")
+            merged = heapq.merge(*(((hashes[i], ids[i]) for i in range(start, end)) for start, end in runs))
+            for value_hash, id in merged:
+                sorted_hashes.append(value_hash)
+                sorted_ids.append(id)
+            self._hashes[key], self._ids[key] = sorted_hashes, sorted_ids
+
+    def record_write(self, id, properties) -> None:
+        """Make an object created or updated by this run resolvable by its new values."""
+        if not id:
+            return
+        with self._lock:
+            for key in self.keys:
+                values = self._values(key, properties or {})
+                if values is not None:
+                    self._written[key][values] = str(id)
+
+    def get(self, properties, key=None):
+        """Return the objects matching the record's values for `key`, as [{"id": ...}]."""
+        key = key or self.keys[0]
+        values = self._values(key, properties)
+        if values is None:
+            return []
+        if values in self._written[key]:
+            return [{"id": self._written[key][values]}]
+        if self.compact:
+            hashes = self._hashes[key]
+            value_hash = self._hash(values)
+            start, end = bisect_left(hashes, value_hash), bisect_right(hashes, value_hash)
+            ids = [str(id) for id in self._ids[key][start:end]]
+        else:
+            ids = self._maps[key].get(values, [])
+        return [{"id": id} for id in ids]
+
+    def lookup(self, record, lookup_method="all"):
+        """Resolve a record the same way `FallbackSink.perform_object_lookup` does, without requests."""
+        if len(self.keys) > 1 and lookup_method == "sequential":
+            for key in self.keys[1:]:
+                matches = self.get(record, key)
+                if len(matches) == 1:
+                    return matches
+            return []
+        return self.get(record)
+
+
+def parse_createdate(value):
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def list_objects(config, object_name, properties, index):
+    """Page through every object with the list endpoint, one page at a time."""
+    url = f"https://api.hubapi.com/crm/v3/objects/{object_name}"
+    params = {"limit": PAGE_SIZE, "properties": ",".join(properties)}
+    while True:
+        res = request(config, url, dict(params)).json()
+        for obj in res.get("results", []):
+            index.add(obj)
+        after = res.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            return
+        params["after"] = after
+
+
+def search_createdate_bound(config, object_name, direction):
+    url = f"https://api.hubapi.com/crm/v3/objects/{object_name}/search"
+    payload = {
+        "sorts": [{"propertyName": "createdate", "direction": direction}],
+        "properties": ["createdate"],
+        "limit": 1,
+    }
+    results = request_push(config, url, payload).json().get("results", [])
+    if not results or not results[0]["properties"].get("createdate"):
+        return None
+    return parse_createdate(results[0]["properties"]["createdate"])
+
+
+def search_shard(config, object_name, properties, start, end, index):
+    """
+    Load the objects created in [start, end) through the search API. When the
+    search cap is reached the query restarts from the last createdate seen.
+    """
+    url = f"https://api.hubapi.com/crm/v3/objects/{object_name}/search"
+    seen_at_start = set()
+    while True:
+        payload = {
+            "filterGroups": [{"filters": [
+                {"propertyName": "createdate", "operator": "GTE", "value": start},
+                {"propertyName": "createdate", "operator": "LT", "value": end},
+            ]}],
+            "sorts": [{"propertyName": "createdate", "direction": "ASCENDING"}],
+            "properties": properties + ["createdate"],
+            "limit": PAGE_SIZE,
+        }
+        restart_at, seen_at_restart, added = None, set(), 0
+        while True:
+            res = request_push(config, url, payload).json()
+            for obj in res.get("results", []):
+                if obj["id"] in seen_at_start:
+                    continue
+                index.add(obj)
+                added += 1
+                created = parse_createdate(obj["properties"]["createdate"])
+                if created != restart_at:
+                    restart_at, seen_at_restart = created, set()
+                seen_at_restart.add(obj["id"])
+            after = res.get("paging", {}).get("next", {}).get("after")
+            if not after:
+                return
+            if int(after) + PAGE_SIZE > SEARCH_RESULTS_CAP:
+                break
+            payload["after"] = after
+        if not added:
+            raise Exception(f"More than {SEARCH_RESULTS_CAP} {object_name} share createdate {start}, cannot shard further")
+        if restart_at == start:
+            seen_at_start |= seen_at_restart
+        else:
+            seen_at_start = seen_at_restart
+        start = restart_at
+
+
+def build_object_index(config, object_name, lookup_fields, sequential=False, compact=False, parallelism=1):
+    """
+    Load every existing object of `object_name` with only its lookup fields.
+    With parallelism > 1 the createdate range is split into shards fetched concurrently
+    through the search API, otherwise the list endpoint is paged sequentially.
+    """
+    index = ObjectIndex(object_name, lookup_fields, sequential=sequential, compact=compact)
+    started_at = datetime.utcnow()
+    if parallelism > 1:
+        first = search_createdate_bound(config, object_name, "ASCENDING")
+        last = search_createdate_bound(config, object_name, "DESCENDING")
+        if first is not None:
+            last += 1
+            step = max(1, -(-(last - first) // parallelism))
+            shards = [(start, min(start + step, last)) for start in range(first, last, step)]
+            with ThreadPoolExecutor(max_workers=parallelism) as executor:
+                futures = [
+                    executor.submit(search_shard, config, object_name, list(index.properties), start, end, index)
+                    for start, end in shards
+                ]
+                for future in futures:
+                    future.result()
+    else:
+        list_objects(config, object_name, index.properties, index)
+    index.freeze()
+    logger.info(
+        f"Warmed up {object_name} index by {lookup_fields} with {index.size} objects "
+        f"in {(datetime.utcnow() - started_at).total_seconds():.1f}s"
+    )
+    return index
+
+
+OBJECT_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_object_index(config, object_name, lookup_fields, lookup_method="all"):
+    """
+    Return the warmed up index for `object_name` by `lookup_fields`, building it on
+    first use, or None when `warm_up_lookup_index` does not cover this object.
+    """
+    warm_up = config.get("warm_up_lookup_index", False)
+    if isinstance(warm_up, list):
+        warm_up = object_name.lower() in [name.lower() for name in warm_up]
+    if not warm_up or not lookup_fields:
+        return None
+
+    sequential = lookup_method == "sequential"
+    key = (object_name, tuple(lookup_fields), sequential)
+    with _INDEXES_LOCK:
+        if key not in OBJECT_INDEXES:
+            OBJECT_INDEXES[key] = build_object_index(
+                dict(config),
+                object_name,
+                lookup_fields,
+                sequential=sequential,
+                compact=config.get("compact_lookup_index", False),
+                parallelism=int(config.get("warm_up_parallelism", 1)),
+            )
+        return OBJECT_INDEXES[key]
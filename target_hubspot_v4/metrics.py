@@ -0,0 +1,259 @@
+"""Per-endpoint request metrics and the end of run performance report."""
+
+import contextvars
+import json
+import logging
+import random
+import re
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("target-hubspot-v4")
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# latencies kept per endpoint for the percentiles, sampled beyond that
+MAX_LATENCY_SAMPLES = 10000
+
+_current_stream = contextvars.ContextVar("current_stream", default=None)
+
+
+def endpoint_template(method, url):
+    """
+    Method and path of a request with object types, ids and names replaced by
+    placeholders, e.g. `POST /crm/v3/objects/{object}/search`.
+    """
+    parts = urlsplit(url).path.split("/")
+    templated = []
+    for index, part in enumerate(parts):
+        previous = parts[index - 1] if index else ""
+        if re.fullmatch(r"\d+(-\d+)?", part) or "@" in part or "%40" in part:
+            templated.append("{id}")
+        elif previous in ("objects", "properties", "schemas"):
+            templated.append("{object}")
+        elif previous == "associations" and index >= 2 and parts[index - 2] == "v4":
+            templated.append("{from}")
+        elif index >= 2 and parts[index - 2] == "associations" and templated[index - 1] == "{from}":
+            templated.append("{to}")
+        elif previous == "associations":
+            # /objects/{object}/{id}/associations/{object}/...
+            templated.append("{object}")
+        elif previous == "name":
+            templated.append("{name}")
+        else:
+            templated.append(part)
+    return f"{method} {'/'.join(templated)}"
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 4)
+
+
+class EndpointStats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.statuses = Counter()
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.samples = []
+        self.retries = 0
+        self.retry_sleep = 0.0
+
+    def observe(self, latency, status_code, bytes_sent, bytes_received):
+        self.requests += 1
+        if status_code is None:
+            self.errors += 1
+        else:
+            self.statuses[str(status_code)] += 1
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.latency_sum += latency
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        if len(self.samples) < MAX_LATENCY_SAMPLES:
+            self.samples.append(latency)
+        else:
+            # reservoir sampling keeps every latency equally likely to be kept
+            index = random.randrange(self.requests)
+            if index < MAX_LATENCY_SAMPLES:
+                self.samples[index] = latency
+
+    def summary(self):
+        return {
+            "requests": self.requests,
+            "statuses": dict(sorted(self.statuses.items())),
+            "errors": self.errors,
+            "retries": self.retries,
+            "retry_sleep_seconds": round(self.retry_sleep, 3),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "latency_seconds": {
+                "total": round(self.latency_sum, 3),
+                "mean": round(self.latency_sum / self.requests, 4) if self.requests else None,
+                "p50": percentile(self.samples, 0.5),
+                "p95": percentile(self.samples, 0.95),
+                "p99": percentile(self.samples, 0.99),
+                "max": round(max(self.samples), 4) if self.samples else None,
+            },
+        }
+
+
+class Metrics:
+    """
+    Counts every HTTP request the target sends, per endpoint template: status codes,
+    connection errors, bytes, latency histogram, and the retries and backoff sleep of
+    the retry policy. Requests are also attributed to the stream being processed, so
+    the report shows API calls per record for each stream.
+    """
+
+    def __init__(self) -> None:
+        self.endpoints = defaultdict(EndpointStats)
+        self.stream_requests = Counter()
+        self.stream_records = Counter()
+        self.stream_skipped_writes = Counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stream(self, stream_name):
+        """Attribute the requests sent within the block to `stream_name`."""
+        token = _current_stream.set(stream_name)
+        try:
+            yield
+        finally:
+            _current_stream.reset(token)
+
+    def count_record(self, stream_name):
+        with self._lock:
+            self.stream_records[stream_name] += 1
+
+    def count_skipped_write(self):
+        """Count a write of the current stream skipped because nothing changed since the last run."""
+        with self._lock:
+            self.stream_skipped_writes[_current_stream.get()] += 1
+
+    def observe(self, request, response, latency):
+        """Record a request sent, with its response or None when it failed to get one."""
+        endpoint = endpoint_template(request.method, request.url)
+        body = request.body or b""
+        bytes_received = len(response.content or b"") if response is not None else 0
+        with self._lock:
+            self.endpoints[endpoint].observe(
+                latency,
+                response.status_code if response is not None else None,
+                len(body),
+                bytes_received,
+            )
+            self.stream_requests[_current_stream.get()] += 1
+
+    def observe_retry(self, endpoint, wait):
+        with self._lock:
+            self.endpoints[endpoint].retries += 1
+            self.endpoints[endpoint].retry_sleep += wait
+
+    def report(self):
+        with self._lock:
+            endpoints = {endpoint: stats.summary() for endpoint, stats in sorted(self.endpoints.items())}
+            streams = {}
+            for stream_name in sorted(set(self.stream_records) | set(self.stream_requests) | set(self.stream_skipped_writes), key=str):
+                records = self.stream_records.get(stream_name, 0)
+                requests = self.stream_requests.get(stream_name, 0)
+                streams[stream_name or "-"] = {
+                    "records": records,
+                    "requests": requests,
+                    "requests_per_record": round(requests / records, 3) if records else None,
+                }
+                if self.stream_skipped_writes.get(stream_name):
+                    streams[stream_name or "-"]["skipped_writes"] = self.stream_skipped_writes[stream_name]
+        return {
+            "requests": sum(endpoint["requests"] for endpoint in endpoints.values()),
+            "retries": sum(endpoint["retries"] for endpoint in endpoints.values()),
+            "retry_sleep_seconds": round(sum(endpoint["retry_sleep_seconds"] for endpoint in endpoints.values()), 3),
+            "skipped_writes": sum(self.stream_skipped_writes.values()),
+            "endpoints": endpoints,
+            "streams": streams,
+        }
+
+    def openmetrics(self):
+        """The metrics in the OpenMetrics text format."""
+
+        def labels(**values):
+            return ",".join(f'{name}="{str(value)}"' for name, value in values.items())
+
+        lines = [
+            "# TYPE hubspot_requests counter",
+            "# HELP hubspot_requests HTTP requests sent, by endpoint and status code.",
+        ]
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            for endpoint, stats in endpoints:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f"hubspot_requests_total{{{labels(endpoint=endpoint, status=status)}}} {count}")
+                if stats.errors:
+                    lines.append(f"hubspot_requests_total{{{labels(endpoint=endpoint, status='error')}}} {stats.errors}")
+
+            for name, attribute, help_text in (
+                ("hubspot_request_retries", "retries", "Retried requests, by endpoint."),
+                ("hubspot_request_retry_sleep_seconds", "retry_sleep", "Seconds slept before retries, by endpoint."),
+                ("hubspot_request_sent_bytes", "bytes_sent", "Request body bytes sent, by endpoint."),
+                ("hubspot_request_received_bytes", "bytes_received", "Response body bytes received, by endpoint."),
+            ):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"# HELP {name} {help_text}")
+                for endpoint, stats in endpoints:
+                    lines.append(f"{name}_total{{{labels(endpoint=endpoint)}}} {getattr(stats, attribute)}")
+
+            lines.append("# TYPE hubspot_request_duration_seconds histogram")
+            lines.append("# HELP hubspot_request_duration_seconds Latency of HTTP requests, by endpoint.")
+            for endpoint, stats in endpoints:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats.buckets):
+                    cumulative += count
+                    lines.append(
+                        f"hubspot_request_duration_seconds_bucket{{{labels(endpoint=endpoint, le=bound)}}} {cumulative}"
+                    )
+                lines.append(f"hubspot_request_duration_seconds_count{{{labels(endpoint=endpoint)}}} {stats.requests}")
+                lines.append(f"hubspot_request_duration_seconds_sum{{{labels(endpoint=endpoint)}}} {stats.latency_sum}")
+
+            for name, counter, help_text in (
+                ("hubspot_stream_records", self.stream_records, "Records read, by stream."),
+                ("hubspot_stream_requests", self.stream_requests, "HTTP requests sent, by stream."),
+                ("hubspot_stream_skipped_writes", self.stream_skipped_writes, "Unchanged writes skipped, by stream."),
+            ):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"# HELP {name} {help_text}")
+                for stream_name, count in sorted(counter.items(), key=lambda item: str(item[0])):
+                    lines.append(f"{name}_total{{{labels(stream=stream_name or '-')}}} {count}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, config, phases=None) -> None:
+        """
+        Log the report and write it to `metrics_path` and `openmetrics_path` when configured,
+        with the time per phase of the records in the JSON report when given.
+        """
+        report = self.report()
+        logger.info(
+            f"Requests: {report['requests']}, retries: {report['retries']}, "
+            f"retry sleep: {report['retry_sleep_seconds']}s, skipped writes: {report['skipped_writes']}, per stream: {report['streams']}"
+        )
+        if config.get("metrics_path"):
+            with open(config["metrics_path"], "w") as outfile:
+                json.dump(dict(report, phases=phases) if phases else report, outfile, indent=2)
+        if config.get("openmetrics_path"):
+            with open(config["openmetrics_path"], "w") as outfile:
+                outfile.write(self.openmetrics())
+
+
+METRICS = Metrics()
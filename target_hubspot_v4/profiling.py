@@ -0,0 +1,227 @@
+"""Per-record phase timing and optional whole run profilers."""
+
+import contextvars
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+logger = logging.getLogger("target-hubspot-v4")
+
+PHASES = ("parse", "preprocess", "lookup", "write", "associations", "throttle", "retry_sleep")
+PROFILERS = ("cprofile", "tracemalloc", "sampling")
+DEFAULT_PROFILE_PATHS = {"cprofile": "profile.prof", "tracemalloc": "tracemalloc.txt", "sampling": "profile.folded"}
+DEFAULT_SAMPLING_INTERVAL_MS = 5
+
+_current_frame = contextvars.ContextVar("current_phase", default=None)
+_current_stream = contextvars.ContextVar("current_profiled_stream", default=None)
+
+
+class _PhaseFrame:
+    __slots__ = ("parent", "thread", "nested")
+
+    def __init__(self, parent, thread) -> None:
+        self.parent = parent
+        self.thread = thread
+        self.nested = 0.0
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread each `interval` seconds and counts them, written
+    in the collapsed format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval) -> None:
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path) -> None:
+        with open(path, "w") as outfile:
+            for stack, count in self.stacks.most_common():
+                outfile.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Times the phases of writing records, per stream, when `profile_phases` is set:
+    Singer message parsing, preprocessing, lookups, writes, associations, rate limit
+    waits and retry sleeps. A phase entered within another one is only counted in the
+    inner phase, so the phases add up to the time spent on the stream. The whole run
+    can also be profiled with cProfile, tracemalloc or a sampling profiler, written to
+    `profile_path`. Nothing is timed when both are off.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.profiler = None
+        self.profile_path = None
+        self.sampling_interval = DEFAULT_SAMPLING_INTERVAL_MS / 1000
+        self.seconds = defaultdict(Counter)
+        self.records = Counter()
+        self._active = None
+        self._started_at = None
+        self._lock = threading.Lock()
+
+    def configure(self, config) -> None:
+        self.enabled = bool(config.get("profile_phases", False))
+        self.profiler = config.get("profiler") or None
+        if self.profiler is not None and self.profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler {self.profiler}, expected one of {list(PROFILERS)}")
+        self.profile_path = config.get("profile_path") or DEFAULT_PROFILE_PATHS.get(self.profiler)
+        self.sampling_interval = float(config.get("profile_interval_ms", DEFAULT_SAMPLING_INTERVAL_MS)) / 1000
+
+    def phase(self, name):
+        """Context manager timing the block as phase `name` of the current stream."""
+        if not self.enabled:
+            return nullcontext()
+        return self._timed(name)
+
+    def timed(self, name):
+        """Decorator timing each call of the function as phase `name`."""
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self._timed(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @contextmanager
+    def _timed(self, name):
+        thread = threading.get_ident()
+        parent = _current_frame.get()
+        frame = _PhaseFrame(parent, thread)
+        token = _current_frame.set(frame)
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            _current_frame.reset(token)
+            if parent is not None and parent.thread == thread:
+                # phases run on other threads, e.g. upsert workers, overlap with their parent
+                parent.nested += elapsed
+            with self._lock:
+                self.seconds[_current_stream.get()][name] += max(0.0, elapsed - frame.nested)
+
+    @contextmanager
+    def record(self, stream_name):
+        """Count a record of `stream_name` and time its Singer message handling as parsing."""
+        if not self.enabled:
+            yield
+            return
+        with self._lock:
+            self.records[stream_name] += 1
+        with self.stream(stream_name), self._timed("parse"):
+            yield
+
+    @contextmanager
+    def stream(self, stream_name):
+        """Attribute the phases timed within the block to `stream_name`."""
+        token = _current_stream.set(stream_name)
+        try:
+            yield
+        finally:
+            _current_stream.reset(token)
+
+    def start(self) -> None:
+        """Start the configured whole run profiler."""
+        self._started_at = (time.perf_counter(), time.process_time())
+        if self.profiler == "cprofile":
+            self._active = cProfile.Profile()
+            self._active.enable()
+        elif self.profiler == "tracemalloc":
+            tracemalloc.start(25)
+        elif self.profiler == "sampling":
+            self._active = SamplingProfiler(self.sampling_interval)
+            self._active.start()
+
+    def stop(self) -> None:
+        """Stop the profiler and write its results to `profile_path`."""
+        if self.profiler == "cprofile" and self._active is not None:
+            self._active.disable()
+            self._active.dump_stats(self.profile_path)
+            summary = io.StringIO()
+            pstats.Stats(self._active, stream=summary).sort_stats("cumulative").print_stats(15)
+            logger.info(f"cProfile stats written to {self.profile_path}, by cumulative time:\n{summary.getvalue()}")
+        elif self.profiler == "tracemalloc" and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            statistics = tracemalloc.take_snapshot().statistics("lineno")
+            tracemalloc.stop()
+            with open(self.profile_path, "w") as outfile:
+                outfile.write(f"current: {current} bytes, peak: {peak} bytes\n")
+                for statistic in statistics[:100]:
+                    outfile.write(f"{statistic}\n")
+            logger.info(f"Allocations written to {self.profile_path}, peak traced memory {peak / 2**20:.1f} MiB")
+        elif self.profiler == "sampling" and self._active is not None:
+            self._active.stop()
+            self._active.write(self.profile_path)
+            logger.info(f"{self._active.samples} stack samples written to {self.profile_path}")
+        self._active = None
+
+    def report(self):
+        """Seconds spent per phase for each stream, in total and per record."""
+        with self._lock:
+            streams = {}
+            for stream_name in sorted(set(self.seconds) | set(self.records), key=str):
+                seconds = self.seconds.get(stream_name, {})
+                records = self.records.get(stream_name, 0)
+                streams[stream_name or "-"] = {
+                    "records": records,
+                    "seconds": {phase: round(seconds[phase], 3) for phase in PHASES if phase in seconds},
+                    "ms_per_record": {
+                        phase: round(seconds[phase] * 1000 / records, 3) for phase in PHASES if phase in seconds
+                    } if records else {},
+                }
+        report = {"streams": streams}
+        if self._started_at is not None:
+            wall_started_at, cpu_started_at = self._started_at
+            # cpu time well below the wall time means the run waits on the network
+            report["wall_seconds"] = round(time.perf_counter() - wall_started_at, 3)
+            report["cpu_seconds"] = round(time.process_time() - cpu_started_at, 3)
+        return report
+
+    def log_stats(self) -> None:
+        if self.enabled:
+            logger.info(f"Time per phase: {self.report()}")
+
+
+PROFILER = Profiler()
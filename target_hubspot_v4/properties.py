@@ -0,0 +1,70 @@
+"""Property definitions of CRM objects, loaded once per object type per run."""
+
+import threading
+
+from target_hubspot_v4.utils import logger, request, request_push
+
+
+class PropertyRegistry:
+    """
+    Caches the property definitions of each object type, so records only create the
+    properties that are actually missing, all at once through the batch endpoint.
+    """
+
+    def __init__(self) -> None:
+        self._properties = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _object_lock(self, object_name):
+        with self._lock:
+            return self._locks.setdefault(object_name, threading.Lock())
+
+    def _load(self, config, object_name):
+        url = f"https://api.hubapi.com/crm/v3/properties/{object_name}"
+        results = request(config, url).json().get("results", [])
+        self._properties[object_name] = {definition["name"]: definition for definition in results}
+        logger.info(f"Loaded {len(results)} {object_name} property definitions")
+
+    def properties(self, config, object_name):
+        """Definitions of the properties of `object_name`, by property name."""
+        object_name = object_name.lower()
+        with self._object_lock(object_name):
+            if object_name not in self._properties:
+                self._load(config, object_name)
+            return self._properties[object_name]
+
+    def ensure(self, config, object_name, definitions):
+        """
+        Create the properties in `definitions` that do not exist yet with one batch call
+        and return the names of those that exist afterwards.
+        """
+        object_name = object_name.lower()
+        existing = self.properties(config, object_name)
+        with self._object_lock(object_name):
+            missing = {}
+            for definition in definitions:
+                if definition["name"] not in existing:
+                    missing.setdefault(definition["name"], definition)
+            if missing:
+                url = f"https://api.hubapi.com/crm/v3/properties/{object_name}/batch/create"
+                try:
+                    response = request_push(config, url, {"inputs": list(missing.values())})
+                    created = response.json().get("results", [])
+                    errors = response.json().get("errors", [])
+                except Exception as e:
+                    created, errors = [], [{"message": str(e)}]
+                for definition in created:
+                    existing[definition["name"]] = definition
+                    logger.info(f"Custom field {definition['name']} created")
+                if errors or len(created) < len(missing):
+                    # another run may have created some of them meanwhile
+                    self._load(config, object_name)
+                    existing = self._properties[object_name]
+                    for name in missing:
+                        if name not in existing:
+                            logger.error(f"Error creating custom field {name}: {[error.get('message') for error in errors]}")
+            return {definition["name"] for definition in definitions if definition["name"] in existing}
+
+
+PROPERTIES = PropertyRegistry()
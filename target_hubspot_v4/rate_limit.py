@@ -0,0 +1,137 @@
+"""Process-wide client side rate limiting of HubSpot API requests."""
+
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from target_hubspot_v4.profiling import PROFILER
+
+logger = logging.getLogger("target-hubspot-v4")
+
+# requests per second used until HubSpot's rate limit headers tell otherwise,
+# the lowest tier allows 100 requests / 10s and the search API 5 requests / s
+DEFAULT_RATES = {"crm": 10.0, "search": 4.0, "associations": 10.0}
+# buckets whose requests also count against the quota of another bucket
+PARENT_BUCKETS = {"associations": "crm"}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns the time waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.waited += waited
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            with PROFILER.phase("throttle"):
+                time.sleep(wait)
+            waited += wait
+
+    def update(self, rate: float = None, capacity: float = None, remaining: float = None) -> None:
+        with self._lock:
+            self._refill()
+            if rate:
+                self.rate = rate
+            if capacity:
+                self.capacity = capacity
+            if remaining is not None:
+                # other clients of the same portal share the quota
+                self.tokens = min(self.tokens, remaining)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def drain(self) -> None:
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0)
+
+
+class RateLimiter:
+    """
+    Token buckets for the general CRM API, the search API and association endpoints.
+    Every request acquires a token from its bucket first, association requests from
+    the `crm` bucket as well since they share its quota, and the quota is tuned from
+    the `X-HubSpot-RateLimit-*` headers of each response.
+    """
+
+    def __init__(self, rates: dict = None) -> None:
+        self.buckets = {}
+        self.configure(rates)
+
+    def configure(self, rates: dict = None) -> None:
+        rates = dict(DEFAULT_RATES, **(rates or {}))
+        self.buckets = {name: TokenBucket(float(rate)) for name, rate in rates.items()}
+
+    @staticmethod
+    def bucket_name(url: str) -> str:
+        path = urlsplit(url).path
+        if path.endswith("/search"):
+            return "search"
+        if "/associations" in path:
+            return "associations"
+        return "crm"
+
+    def bucket_names(self, url: str) -> list:
+        name = self.bucket_name(url)
+        return [name, PARENT_BUCKETS[name]] if name in PARENT_BUCKETS else [name]
+
+    def acquire(self, url: str) -> float:
+        return sum(self.buckets[name].acquire() for name in self.bucket_names(url))
+
+    def observe(self, url: str, response) -> None:
+        """Tune the bucket of `url` from the rate limit headers of its response."""
+        name = self.bucket_name(url)
+        headers = response.headers
+        if response.status_code == 429:
+            for bucket_name in self.bucket_names(url):
+                self.buckets[bucket_name].drain()
+        if name == "search":
+            # the search limit is fixed per portal and not described by the headers
+            return
+
+        def header(name):
+            value = headers.get(f"X-HubSpot-RateLimit-{name}")
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        interval_ms = header("Interval-Milliseconds")
+        limit = header("Max")
+        remaining = header("Remaining")
+        secondly = header("Secondly")
+        rate = limit / (interval_ms / 1000) if limit and interval_ms else None
+        if secondly:
+            rate = min(rate, secondly) if rate else secondly
+        capacity = min(limit, secondly) if limit and secondly else (secondly or limit)
+        if rate or capacity or remaining is not None:
+            # the headers describe the quota shared with the parent bucket
+            bucket = self.buckets[PARENT_BUCKETS.get(name, name)]
+            bucket.update(rate=rate, capacity=capacity, remaining=remaining)
+
+    def log_stats(self) -> None:
+        waited = {name: round(bucket.waited, 1) for name, bucket in self.buckets.items() if bucket.waited}
+        if waited:
+            logger.info(f"Rate limiter wait time in seconds per bucket: {waited}")
+
+
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,144 @@
+"""Retry policy shared by every HubSpot request helper."""
+
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import wraps
+
+import requests
+from hotglue_singer_sdk.exceptions import RetriableAPIError
+
+from target_hubspot_v4.metrics import METRICS, endpoint_template
+from target_hubspot_v4.profiling import PROFILER
+
+logger = logging.getLogger("target-hubspot-v4")
+
+RETRY_EXCEPTIONS = (requests.exceptions.RequestException, RetriableAPIError)
+
+
+def endpoint_name(exc, default):
+    """Endpoint template of the failed request, e.g. `PATCH /crm/v3/objects/{object}/{id}`."""
+    response = getattr(exc, "response", None)
+    request = getattr(response, "request", None) or getattr(exc, "request", None)
+    if request is None or not request.url:
+        return default
+    return endpoint_template(request.method, request.url)
+
+
+def retry_after(response):
+    """Seconds to wait according to the `Retry-After` header, if any."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def rate_limit_window(response):
+    """Seconds until an exhausted HubSpot rate limit window is certainly over, if any."""
+    headers = response.headers
+    if headers.get("X-HubSpot-RateLimit-Secondly-Remaining") == "0":
+        return 1.0
+    interval = headers.get("X-HubSpot-RateLimit-Interval-Milliseconds")
+    if headers.get("X-HubSpot-RateLimit-Remaining") == "0" and interval:
+        try:
+            return float(interval) / 1000
+        except ValueError:
+            return None
+    return None
+
+
+class RetryPolicy:
+    """
+    Retries failed requests up to `max_tries` attempts. 429s wait for `Retry-After`
+    or the end of the rate limit window, server and connection errors back off
+    exponentially with full jitter. Retries and sleep time are counted per endpoint.
+    """
+
+    def __init__(self, max_tries=5, base_wait=2.0, max_wait=60.0) -> None:
+        self.max_tries = max_tries
+        self.base_wait = base_wait
+        self.max_wait = max_wait
+        self.stats = defaultdict(lambda: {"retries": 0, "sleep": 0.0})
+        self._lock = threading.Lock()
+
+    def configure(self, config) -> None:
+        self.max_tries = int(config.get("retry_max_tries", self.max_tries))
+        self.base_wait = float(config.get("retry_base_wait", self.base_wait))
+        self.max_wait = float(config.get("retry_max_wait", self.max_wait))
+
+    def wait_time(self, exc, tries) -> float:
+        jitter = random.uniform(0, min(self.max_wait, self.base_wait * 2 ** (tries - 1)))
+        response = getattr(exc, "response", None)
+        if response is not None and response.status_code == 429:
+            wait = retry_after(response)
+            if wait is None:
+                wait = rate_limit_window(response)
+            # the search API sends no headers, its limit is per second
+            return wait if wait is not None else max(1.0, jitter)
+        return jitter
+
+    def record(self, endpoint, wait) -> None:
+        with self._lock:
+            self.stats[endpoint]["retries"] += 1
+            self.stats[endpoint]["sleep"] += wait
+        METRICS.observe_retry(endpoint, wait)
+
+    def retry(self, giveup=None, on_giveup=None):
+        """
+        Decorator retrying on request errors. `giveup` and `on_giveup` behave as in
+        `backoff.on_exception`: `on_giveup` is called with the retry details before
+        the last error is raised.
+        """
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started_at = time.monotonic()
+                tries = 0
+                while True:
+                    tries += 1
+                    try:
+                        return func(*args, **kwargs)
+                    except RETRY_EXCEPTIONS as exc:
+                        if (giveup and giveup(exc)) or tries >= self.max_tries:
+                            if on_giveup:
+                                on_giveup({
+                                    "target": func,
+                                    "args": args,
+                                    "kwargs": kwargs,
+                                    "tries": tries,
+                                    "elapsed": time.monotonic() - started_at,
+                                })
+                            raise
+                        endpoint = endpoint_name(exc, func.__name__)
+                        wait = self.wait_time(exc, tries)
+                        self.record(endpoint, wait)
+                        logger.info(f"Retrying {endpoint} in {wait:.1f}s after try {tries} failed: {exc}")
+                        with PROFILER.phase("retry_sleep"):
+                            time.sleep(wait)
+
+            return wrapper
+
+        return decorator
+
+    def log_stats(self) -> None:
+        if self.stats:
+            stats = {
+                endpoint: {"retries": stat["retries"], "sleep": round(stat["sleep"], 1)}
+                for endpoint, stat in sorted(self.stats.items())
+            }
+            logger.info(f"Request retries and sleep time in seconds per endpoint: {stats}")
+
+
+RETRY_POLICY = RetryPolicy()
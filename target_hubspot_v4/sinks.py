@@ -1,11 +1,63 @@
 """Hubspot-v4 target sink class, which handles writing streams."""
 
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from hotglue_etl_exceptions import InvalidPayloadError
+from hotglue_singer_sdk.exceptions import FatalAPIError
+
+from target_hubspot_v4.associations import ASSOCIATION_TYPES
+from target_hubspot_v4.buffer import BufferedSinkMixin
+from target_hubspot_v4.cache import LOOKUP_CACHE
 from target_hubspot_v4.client import HubspotSink
-from target_hubspot_v4.utils import request_push, search_objects_by_property
+from target_hubspot_v4.hashes import WRITE_HASHES
+from target_hubspot_v4.id_map import ID_MAP
+from target_hubspot_v4.imports import (
+    DEFAULT_MAX_ROWS,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_TIMEOUT_MINUTES,
+    ImportFile,
+    ImportSpool,
+    build_import_request,
+    import_directory,
+    read_import_errors,
+    submit_import,
+    wait_for_import,
+)
+from target_hubspot_v4.index import get_object_index
+from target_hubspot_v4.profiling import PROFILER
+from target_hubspot_v4.utils import (
+    MAX_BATCH_INPUTS,
+    SearchResultsCapped,
+    chunk_unique,
+    create_associations_batch,
+    group_by_shared_keys,
+    normalize_lookup_value,
+    read_objects_by_ids,
+    read_objects_by_unique_property,
+    request_push,
+    search_objects_by_property,
+    search_objects_by_property_values,
+)
 
-class FallbackSink(HubspotSink):
+
+class FallbackSink(BufferedSinkMixin, HubspotSink):
     """Precoro target sink class."""
 
+    def __init__(self, target, stream_name, schema, key_properties) -> None:
+        super().__init__(target, stream_name, schema, key_properties)
+        self.object_index = None
+        # ids taken from the state, which are looked up again if they fail to update
+        self._mapped_ids = set()
+        # records kept on disk while the stream may be written through the Imports API
+        self.import_spool = None
+        self.spooled_records = 0
+        if self.import_records or self.import_min_records:
+            self.import_spool = ImportSpool(import_directory(self.config), self.name)
+        if not self.is_full_path and self.name not in self.marketing_sinks:
+            self.object_index = get_object_index(self.config, self.name, self.lookup_fields, self.lookup_method)
+
     @property
     def is_full_path(self):
         return '/' in self.stream_name
@@ -21,6 +73,74 @@ class FallbackSink(HubspotSink):
     def name(self):
         return self.stream_name
 
+    @property
+    def batch_upsert(self):
+        """Whether records of this stream are buffered and written through the batch endpoints."""
+        if self.is_full_path or self.name in self.marketing_sinks:
+            return False
+        batch_upsert = self.config.get("batch_upsert", False)
+        if isinstance(batch_upsert, list):
+            return self.name.lower() in [stream.lower() for stream in batch_upsert]
+        return bool(batch_upsert)
+
+    @property
+    def import_records(self):
+        """Whether records of this stream are written through the Imports API whatever their count."""
+        if self.is_full_path or self.name in self.marketing_sinks:
+            return False
+        import_streams = self.config.get("import_streams", False)
+        if isinstance(import_streams, list):
+            return self.name.lower() in [stream.lower() for stream in import_streams]
+        return bool(import_streams)
+
+    @property
+    def import_min_records(self):
+        """Record count from which the stream is written through the Imports API, if any."""
+        if self.is_full_path or self.name in self.marketing_sinks:
+            return None
+        min_records = self.config.get("import_min_records")
+        return int(min_records) if min_records else None
+
+    @property
+    def importing(self):
+        """Whether the spooled records are imported rather than written through the API."""
+        return self.import_records or (
+            self.import_min_records is not None and self.spooled_records >= self.import_min_records
+        )
+
+    @property
+    def import_max_rows(self):
+        return max(1, int(self.config.get("import_max_rows", DEFAULT_MAX_ROWS)))
+
+    @property
+    def upsert_concurrency(self):
+        return max(1, int(self.config.get("upsert_concurrency", 1)))
+
+    @property
+    def only_upsert_empty_fields(self):
+        """Whether the values existing objects already have are kept instead of overwritten."""
+        if self.is_full_path or self.name in self.marketing_sinks:
+            return False
+        return bool(self.config.get("only_upsert_empty_fields", False))
+
+    @property
+    def buffer_records(self):
+        """Whether records are buffered and written when the sink is drained instead of one by one."""
+        # existing objects are read a buffer at a time for only_upsert_empty_fields
+        if self.batch_upsert or self.upsert_concurrency > 1 or self.only_upsert_empty_fields:
+            return True
+        return self.import_records or bool(self.import_min_records)
+
+    @property
+    def batch_size(self):
+        return max(1, min(int(self.config.get("batch_size", MAX_BATCH_INPUTS)), MAX_BATCH_INPUTS))
+
+    @property
+    def max_size(self) -> int:
+        if self.buffer_records:
+            return self.batch_size
+        return super().max_size
+
     def perform_object_lookup(self, record: dict, lookup_fields):
         if len(lookup_fields) == 0:
             return []
@@ -50,6 +170,35 @@ class FallbackSink(HubspotSink):
                     [{"property_name": lookup_field, "value": record[lookup_field]} for lookup_field in lookup_fields]
                 )
 
+    def lookup_values(self, properties):
+        """The record's values of the lookup fields, which the ids kept in the state are keyed by."""
+        if not self.lookup_fields:
+            return None
+        return {lookup_field: properties.get(lookup_field) for lookup_field in self.lookup_fields}
+
+    @PROFILER.timed("lookup")
+    def apply_object_lookup(self, record: dict):
+        """Set the id of the existing object matching the record's lookup fields, if any."""
+        known_id = ID_MAP.get(self.name, self.lookup_values(record))
+        if known_id:
+            self.logger.info(f"Found object by {self.lookup_fields} in the state with id '{known_id}'")
+            self._mapped_ids.add(known_id)
+            record["id"] = known_id
+            return
+        if self.object_index is not None:
+            existing_objects = self.object_index.lookup(record, self.lookup_method)
+        else:
+            self.logger.debug(f"Searching for object by {self.lookup_fields}")
+            # look contact by email and update id if found
+            existing_objects = self.perform_object_lookup(record, self.lookup_fields)
+        if existing_objects and len(existing_objects) > 1:
+            raise Exception(f"Multiple objects found for lookup fields {self.lookup_fields} on record {record}")
+        if existing_objects and len(existing_objects) == 1:
+            self.logger.info(f"Found object by {self.lookup_fields} with id '{existing_objects[0]['id']}'")
+            record["id"] = existing_objects[0]["id"]
+            ID_MAP.set(self.name, self.lookup_values(record), record["id"])
+
+    @PROFILER.timed("preprocess")
     def preprocess_record(self, record: dict, context: dict) -> None:
         """Process the record."""
         if self.is_full_path:
@@ -64,23 +213,17 @@ class FallbackSink(HubspotSink):
         for key, value in record.items():
             record[key] = self.parse_objs(value)
 
-        
-        if self.lookup_fields:
-            self.logger.debug(f"Searching for object by {self.lookup_fields}")
-            # look contact by email and update id if found
-            existing_objects = self.perform_object_lookup(record, self.lookup_fields)
-            if existing_objects and len(existing_objects) > 1:
-                raise Exception(f"Multiple objects found for lookup fields {self.lookup_fields} on record {record}")
-            if existing_objects and len(existing_objects) == 1:
-                self.logger.info(f"Found object by {self.lookup_fields} with id '{existing_objects[0]['id']}'")
-                record["id"] = existing_objects[0]["id"]
+        # buffered records are looked up when they are flushed
+        if self.lookup_fields and not self.buffer_records:
+            self.apply_object_lookup(record)
 
         payload = {"properties": record}
         if associations:
             payload["associations"] = associations
         return payload
     
-    def upsert_record(self, record: dict, context: dict):
+    @PROFILER.timed("write")
+    def write_record(self, record: dict, context: dict):
         state_updates = dict()
         method = "POST"
         endpoint = self.endpoint
@@ -96,15 +239,30 @@ class FallbackSink(HubspotSink):
                 endpoint = f"{endpoint}/{id}"
                 # Hubspot only supports including associations in POST object
                 associations = record.pop("associations", None)
+                if not self.is_full_path and WRITE_HASHES.unchanged(self.name, record.get("properties"), id=id):
+                    self.logger.info(f"Skipping update of unchanged {self.name} with id '{id}'")
+                    if associations:
+                        self.put_associations(id, associations)
+                    return id, True, state_updates
 
             if record.get("properties") or record.get("associations"):
-                response = self.request_api(method, endpoint=endpoint, request_data=record)
+                try:
+                    response = self.request_api(method, endpoint=endpoint, request_data=record)
+                except InvalidPayloadError:
+                    if method != "PATCH" or id not in self._mapped_ids:
+                        raise
+                    if associations:
+                        record["associations"] = associations
+                    return self.upsert_unmapped(record, id, context)
                 id = response.json()[pk]
             elif self.is_full_path:
                 full_url = f"https://api.hubapi.com{self.endpoint}"
                 response = request_push(dict(self.config), full_url, payload=record, method=method)
                 id = response.json().get(pk)
 
+            if not self.is_full_path:
+                self.record_write(id, record.get("properties"))
+
             if associations:
                 self.put_associations(id, associations)
 
@@ -112,24 +270,627 @@ class FallbackSink(HubspotSink):
             
             return id, True, state_updates
 
-    def put_associations(self, id, associations):
-        for association in associations:
-            to_id = association.get("to", {}).get("id")
-            to_object_name = association.get("to", {}).get("objectType")
-            fully_qualified_object_name = association.get("from", {}).get("objectType")
-            if not to_id:
-                raise Exception(f"to id is required for {association}")
+    def upsert_unmapped(self, record, id, context):
+        """Look up and upsert again a record whose id from the state failed to update, e.g. as the object was deleted."""
+        self.logger.warning(f"Update of {self.name} with id '{id}' from the state failed, looking it up again")
+        self._mapped_ids.discard(id)
+        ID_MAP.discard(self.name, self.lookup_values(record["properties"]))
+        self.apply_object_lookup(record["properties"])
+        return self.write_record(record, context)
 
-            if not to_object_name:
-                raise Exception(f"to objectType is required for {association}")
+    def record_write(self, id, properties):
+        """Keep the lookup cache, index, known ids and write hashes in line with an object this run wrote."""
+        LOOKUP_CACHE.invalidate(self.name, id, properties)
+        if self.object_index is not None:
+            self.object_index.record_write(id, properties)
+        if properties is not None:
+            ID_MAP.set(self.name, self.lookup_values(properties), id)
+        if WRITE_HASHES.enabled and properties is not None:
+            pk = self.key_properties[0] if self.key_properties else "id"
+            written = {key: value for key, value in properties.items() if key != pk}
+            WRITE_HASHES.record(self.name, id, written, lookup=self.write_hash_lookup(written))
 
-            types = association.get("types", [])
-            if not types:
-                raise Exception(f"types is required for {association}")
+    def write_hash_lookup(self, properties):
+        """Unique lookup value the write hash is also kept by, for records upserted without an id."""
+        unique_field = self.unique_lookup_field
+        if unique_field and properties.get(unique_field):
+            return {unique_field: properties[unique_field]}
+        return None
 
-            from_object_name = fully_qualified_object_name or self.name
+    def skip_unchanged(self, entry, action):
+        """Set the id of a buffered record whose properties were already written as they are, True when skipped."""
+        pk = self.key_properties[0] if self.key_properties else "id"
+        properties = entry["record"]["properties"]
+        written = {key: value for key, value in properties.items() if key != pk}
+        if action == "update":
+            id = WRITE_HASHES.unchanged(self.name, written, id=properties[pk])
+        else:
+            id = WRITE_HASHES.unchanged(self.name, written, lookup=self.write_hash_lookup(written))
+        if not id:
+            return False
+        entry["id"] = id
+        # written with the rest of the buffer
+        entry["associations"] = entry["record"].get("associations")
+        entry["unchanged"] = True
+        return True
 
-            associations_url = f"https://api.hubapi.com/crm/v4/objects/{from_object_name}/{id}/associations/{to_object_name}/{to_id}"
-            
-            response = request_push(dict(self.config), associations_url, payload=types, method="PUT")
-            self.validate_response(response)
+    @PROFILER.timed("write")
+    def flush_buffer(self, context: dict) -> None:
+        """Flush the buffered records, or spool them to disk when the stream may be imported."""
+        pending, self._pending_records = self._pending_records, []
+        if not pending:
+            return
+
+        if self.import_spool is not None:
+            self.import_spool.append(pending)
+            self.spooled_records += len(pending)
+            if self.importing and self.import_spool.rows >= self.import_max_rows:
+                self.import_spooled(context)
+            return
+
+        self.write_pending(pending, context)
+
+    def write_pending(self, pending, context):
+        """Write buffered records through the batch create, update and upsert endpoints, or one by one."""
+        if not self.batch_upsert:
+            if self.only_upsert_empty_fields:
+                if self.lookup_fields:
+                    pk = self.key_properties[0] if self.key_properties else "id"
+                    unresolved = [entry for entry in pending if not entry["record"]["properties"].get(pk)]
+                    self.resolve_batch_lookups(unresolved)
+                    for entry in unresolved:
+                        entry["looked_up"] = True
+                self.keep_existing_values(pending)
+            return self.upsert_concurrently(pending, context)
+
+        pk = self.key_properties[0] if self.key_properties else "id"
+        unique_field = self.unique_lookup_field
+        actions = {"update": [], "upsert": [], "create": []}
+
+        if self.lookup_fields:
+            self.resolve_batch_lookups([
+                entry for entry in pending
+                if not entry["record"]["properties"].get(pk)
+                and not (unique_field and entry["record"]["properties"].get(unique_field))
+            ])
+
+        if self.only_upsert_empty_fields:
+            self.keep_existing_values(pending)
+
+        for entry in pending:
+            if entry["error"] is not None:
+                continue
+            properties = entry["record"].get("properties") or {}
+            if properties.get(pk):
+                actions["update"].append(entry)
+            elif unique_field and properties.get(unique_field):
+                actions["upsert"].append(entry)
+            else:
+                actions["create"].append(entry)
+
+        if WRITE_HASHES.enabled:
+            for action in ("update", "upsert"):
+                actions[action] = [entry for entry in actions[action] if not self.skip_unchanged(entry, action)]
+
+        for action, entries in actions.items():
+            for chunk in chunk_unique(entries, self.batch_size, key=lambda entry: self.batch_input_key(entry, action)):
+                self.write_batch(action, chunk, context)
+
+        for entry in pending:
+            if entry["error"] is not None and entry["record"]["properties"].get(pk) in self._mapped_ids:
+                # the id from the state is stale, the record is looked up and written on its own
+                id = entry["record"]["properties"].pop(pk)
+                self._mapped_ids.discard(id)
+                ID_MAP.discard(self.name, self.lookup_values(entry["record"]["properties"]))
+                entry["error"] = entry["associations"] = None
+                self.upsert_entry(entry, context)
+
+        for entry in pending:
+            # records written one by one were recorded by write_record
+            if entry["id"] and not entry.get("unchanged") and not entry.get("recorded"):
+                self.record_write(entry["id"], entry["record"].get("properties"))
+
+        self.write_batch_associations(pending)
+
+        for entry in pending:
+            self.update_batch_entry_state(entry)
+
+    @PROFILER.timed("write")
+    def finish_imports(self, context):
+        """Import the spooled records, or write them as usual when the stream stayed under `import_min_records`."""
+        if self.import_spool is None or not self.import_spool.rows:
+            return
+        if self.importing:
+            return self.import_spooled(context)
+        self.logger.info(
+            f"{self.spooled_records} {self.name} records are under import_min_records, writing them through the API"
+        )
+        for chunk in self.import_spool.read(self.batch_size):
+            self.write_pending(chunk, context)
+
+    def import_columns(self):
+        """Columns of the import files: the id, then the spooled properties in the order of the schema."""
+        pk = self.key_properties[0] if self.key_properties else "id"
+        schema_properties = self.schema.get("properties") or {}
+        if "properties" in schema_properties and isinstance(schema_properties["properties"].get("properties"), dict):
+            # records wrapped in a properties key
+            schema_properties = schema_properties["properties"]["properties"]
+        spooled = self.import_spool.columns
+        columns = [name for name in schema_properties if name in spooled]
+        columns += [name for name in spooled if name not in schema_properties]
+        return [pk] + [name for name in columns if name not in (pk, "associations")]
+
+    def import_spooled(self, context):
+        """
+        Write the spooled records through the Imports API, one import per `import_max_rows`
+        records. Lookups that are not by a unique field and only_upsert_empty_fields merges
+        are resolved in batches first, and records with associations are written as usual.
+        """
+        columns = self.import_columns()
+        import_file = None
+        for chunk in self.import_spool.read(self.batch_size):
+            for entry in self.prepare_import(chunk, context):
+                if import_file is None:
+                    import_file = ImportFile(import_directory(self.config), self.name, columns)
+                import_file.add(entry)
+                if import_file.rows >= self.import_max_rows:
+                    self.write_import(import_file)
+                    import_file = None
+        if import_file is not None:
+            self.write_import(import_file)
+
+    def prepare_import(self, chunk, context):
+        """Resolve the spooled records the import cannot, returning the records to import."""
+        pk = self.key_properties[0] if self.key_properties else "id"
+        if self.lookup_fields and not self.unique_lookup_field:
+            # the import only matches records by id or by a unique property
+            self.resolve_batch_lookups([entry for entry in chunk if not entry["record"]["properties"].get(pk)])
+        if self.only_upsert_empty_fields:
+            self.keep_existing_values(chunk)
+
+        importable, others = [], []
+        for entry in chunk:
+            properties = entry["record"]["properties"]
+            if entry["error"] is not None:
+                self.update_batch_entry_state(entry)
+            elif entry["record"].get("associations"):
+                others.append(entry)
+            elif WRITE_HASHES.enabled and self.skip_unchanged(entry, "update" if properties.get(pk) else "upsert"):
+                self.update_batch_entry_state(entry)
+            else:
+                importable.append(entry)
+        if others:
+            self.write_pending(others, context)
+        return importable
+
+    def write_import(self, import_file):
+        """Import a file, wait for HubSpot to process it and update the state of each of its records."""
+        import_file.close()
+        config = dict(self.config)
+        pk = self.key_properties[0] if self.key_properties else "id"
+        name = f"{self.name} {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}"
+        import_request = build_import_request(
+            name, self.name, import_file.file_name, import_file.columns, id_column=pk, unique_column=self.unique_lookup_field
+        )
+        error, errors_by_row = None, {}
+        try:
+            import_id = submit_import(config, import_request, import_file.path, import_file.file_name)["id"]
+            self.logger.info(f"Started import {import_id} of {import_file.rows} {self.name}")
+            hubspot_import = wait_for_import(
+                config,
+                import_id,
+                float(self.config.get("import_poll_interval", DEFAULT_POLL_INTERVAL)),
+                float(self.config.get("import_timeout_minutes", DEFAULT_TIMEOUT_MINUTES)) * 60,
+            )
+            state = hubspot_import.get("state")
+            counters = (hubspot_import.get("metadata") or {}).get("counters", {})
+            self.logger.info(f"Import {import_id} of {self.name} is {state}: {counters}")
+            errors_by_row, other_errors = read_import_errors(config, import_id)
+            for message in other_errors:
+                self.logger.warning(f"Import {import_id} of {self.name} error: {message}")
+            if state != "DONE":
+                error = Exception(f"Import {import_id} of {self.name} is {state}: {', '.join(other_errors)}")
+        except Exception as e:
+            error = e
+
+        for index, entry in enumerate(import_file.entries()):
+            properties = entry["record"]["properties"]
+            # imports do not report the ids of the objects they create or match by unique value
+            entry["id"] = properties.get(pk) or None
+            if index in errors_by_row:
+                entry["error"] = Exception(", ".join(errors_by_row[index]))
+            else:
+                entry["error"] = error
+            if entry["error"] is None:
+                self.record_write(entry["id"], properties)
+            self.update_batch_entry_state(entry)
+        import_file.remove()
+
+    def upsert_concurrently(self, pending, context):
+        """
+        Upsert the buffered records one by one on `upsert_concurrency` workers. Records sharing
+        an id or lookup value are upserted by the same worker in input order, and the state is
+        updated in input order once every record is done.
+        """
+        groups = group_by_shared_keys(pending, self.record_dependency_keys)
+
+        def upsert_group(group):
+            for entry in group:
+                self.upsert_entry(entry, context)
+
+        with ThreadPoolExecutor(max_workers=self.upsert_concurrency) as executor:
+            # workers keep the context of the sink, e.g. the stream requests are counted for
+            futures = [executor.submit(contextvars.copy_context().run, upsert_group, group) for group in groups]
+            for future in futures:
+                future.result()
+
+        self.write_batch_associations(pending)
+
+        for entry in pending:
+            self.update_batch_entry_state(entry)
+
+    def record_dependency_keys(self, entry):
+        """Values a record shares with any other record that has to be written before it."""
+        record = entry["record"]
+        properties = record.get("properties") or record
+        pk = self.key_properties[0] if self.key_properties else "id"
+        keys = []
+        if properties.get(pk):
+            keys.append((pk, str(properties[pk])))
+        for lookup_field in self.lookup_fields or []:
+            value = normalize_lookup_value(properties.get(lookup_field))
+            if value:
+                keys.append((lookup_field, value))
+        return keys
+
+    def upsert_entry(self, entry, context):
+        try:
+            if self.lookup_fields and not self.is_full_path and not entry.get("looked_up"):
+                self.apply_object_lookup(entry["record"]["properties"])
+            pk = self.key_properties[0] if self.key_properties else "id"
+            if not self.is_full_path and entry["record"]["properties"].get(pk):
+                # written with the rest of the buffer once every record is upserted
+                entry["associations"] = entry["record"].pop("associations", None)
+            entry["id"], _, _ = self.write_record(entry["record"], context)
+            entry["recorded"] = True
+        except Exception as e:
+            entry["error"] = e
+
+    @PROFILER.timed("lookup")
+    def resolve_batch_lookups(self, entries):
+        """Set the ids of buffered records from their lookup fields, resolving the whole batch at once."""
+        if ID_MAP.enabled:
+            unresolved = []
+            for entry in entries:
+                properties = entry["record"]["properties"]
+                known_id = ID_MAP.get(self.name, self.lookup_values(properties))
+                if known_id:
+                    self._mapped_ids.add(known_id)
+                    properties["id"] = known_id
+                else:
+                    unresolved.append(entry)
+            entries = unresolved
+
+        if self.object_index is not None:
+            for entry in entries:
+                try:
+                    self.apply_object_lookup(entry["record"]["properties"])
+                except Exception as e:
+                    entry["error"] = e
+            return
+
+        lookup_fields = self.lookup_fields
+        if len(lookup_fields) > 1 and self.lookup_method == "sequential":
+            unresolved = entries
+            for lookup_field in lookup_fields:
+                for entry, matches in self.find_batch_matches(unresolved, [lookup_field]):
+                    if len(matches) == 1:
+                        self.logger.info(f"Found object by {lookup_field} with id '{matches[0]['id']}'")
+                        entry["record"]["properties"]["id"] = matches[0]["id"]
+                unresolved = [entry for entry in unresolved if entry["error"] is None and not entry["record"]["properties"].get("id")]
+            return
+
+        for entry, matches in self.find_batch_matches(entries, lookup_fields):
+            if len(matches) > 1:
+                entry["error"] = Exception(f"Multiple objects found for lookup fields {lookup_fields} on record {entry['record']['properties']}")
+            elif len(matches) == 1:
+                self.logger.info(f"Found object by {lookup_fields} with id '{matches[0]['id']}'")
+                entry["record"]["properties"]["id"] = matches[0]["id"]
+
+    @PROFILER.timed("lookup")
+    def keep_existing_values(self, entries):
+        """
+        Keep the values the existing objects of buffered records already have, for
+        `only_upsert_empty_fields`. Objects are read through batch/read by id, or by the
+        unique lookup field of records without one, 100 per call and with only the
+        properties written, and each record's empty fields are merged locally.
+        """
+        pk = self.key_properties[0] if self.key_properties else "id"
+        unique_field = self.unique_lookup_field
+        by_id, by_unique_value = [], []
+        for entry in entries:
+            properties = entry["record"]["properties"]
+            if entry["error"] is not None:
+                continue
+            if properties.get(pk):
+                by_id.append(entry)
+            elif unique_field and properties.get(unique_field):
+                by_unique_value.append(entry)
+
+        def merge(entries, id_property, read):
+            for chunk in chunk_unique(entries, MAX_BATCH_INPUTS, key=lambda entry: str(entry["record"]["properties"][id_property]).lower()):
+                written = sorted({key for entry in chunk for key in entry["record"]["properties"] if key != pk})
+                try:
+                    objects = read([entry["record"]["properties"][id_property] for entry in chunk], written)
+                except Exception as e:
+                    # writing without the existing values would overwrite them
+                    for entry in chunk:
+                        entry["error"] = e
+                    continue
+                found = {
+                    str(obj["id"] if id_property == pk else (obj.get("properties") or {}).get(id_property)).lower(): obj
+                    for obj in objects
+                }
+                for entry in chunk:
+                    properties = entry["record"]["properties"]
+                    existing = found.get(str(properties[id_property]).lower())
+                    if not existing:
+                        continue
+                    for key, value in (existing.get("properties") or {}).items():
+                        if key in properties and key != pk and value is not None:
+                            properties[key] = value
+
+        merge(by_id, pk, lambda ids, written: read_objects_by_ids(dict(self.config), self.name, ids, written))
+        merge(by_unique_value, unique_field, lambda values, written: read_objects_by_unique_property(
+            dict(self.config), self.name, unique_field, values, written
+        ))
+
+    def find_batch_matches(self, entries, lookup_fields):
+        """
+        Return (entry, matching objects) pairs for the entries that have every lookup field set.
+        A unique lookup field is read through batch/read, anything else through one IN search per 100 values.
+        """
+        def lookup_key(properties):
+            return tuple(normalize_lookup_value(properties.get(lookup_field)) for lookup_field in lookup_fields)
+
+        entries = [
+            entry for entry in entries
+            if entry["error"] is None and all(entry["record"]["properties"].get(lookup_field) for lookup_field in lookup_fields)
+        ]
+        values_by_key = {}
+        for entry in entries:
+            properties = entry["record"]["properties"]
+            values_by_key.setdefault(lookup_key(properties), [properties[lookup_field] for lookup_field in lookup_fields])
+
+        matches_by_key = {}
+        failed_keys = {}
+        uncached_keys = []
+        for key, values in values_by_key.items():
+            cached, objects = LOOKUP_CACHE.get(self.name, dict(zip(lookup_fields, values)))
+            if cached:
+                matches_by_key[key] = objects
+            else:
+                uncached_keys.append(key)
+
+        for keys in chunk_unique(uncached_keys, MAX_BATCH_INPUTS):
+            try:
+                if len(lookup_fields) == 1 and lookup_fields[0] in self.unique_fields:
+                    objects = read_objects_by_unique_property(
+                        dict(self.config), self.name, lookup_fields[0], [values_by_key[key][0] for key in keys]
+                    )
+                else:
+                    objects = search_objects_by_property_values(
+                        dict(self.config),
+                        self.name,
+                        {
+                            lookup_field: list({key[index] for key in keys})
+                            for index, lookup_field in enumerate(lookup_fields)
+                        },
+                    )
+            except SearchResultsCapped as e:
+                # the IN filters match every combination of the values, search each record's values instead
+                self.logger.warning(f"{e}, searching the {len(keys)} lookups one by one")
+                for key in keys:
+                    try:
+                        matches_by_key[key] = search_objects_by_property(
+                            dict(self.config),
+                            self.name,
+                            [{"property_name": lookup_field, "value": value} for lookup_field, value in zip(lookup_fields, values_by_key[key])],
+                        )
+                    except Exception as search_error:
+                        failed_keys[key] = search_error
+                continue
+            except Exception as e:
+                failed_keys.update({key: e for key in keys})
+                continue
+            found = {}
+            for obj in objects:
+                # IN filters match any combination of the values, keep exact tuples only
+                found.setdefault(lookup_key(obj.get("properties") or {}), []).append(obj)
+            for key in keys:
+                matches_by_key[key] = found.get(key, [])
+                LOOKUP_CACHE.set(self.name, dict(zip(lookup_fields, values_by_key[key])), matches_by_key[key])
+
+        matches = []
+        for entry in entries:
+            key = lookup_key(entry["record"]["properties"])
+            if key in failed_keys:
+                entry["error"] = failed_keys[key]
+            else:
+                matches.append((entry, matches_by_key.get(key, [])))
+        return matches
+
+    def batch_input_key(self, entry, action):
+        """Key HubSpot uses to reject duplicated inputs within one batch call."""
+        properties = entry["record"].get("properties") or {}
+        if action == "update":
+            pk = self.key_properties[0] if self.key_properties else "id"
+            return str(properties.get(pk))
+        if action == "upsert":
+            return normalize_lookup_value(properties.get(self.unique_lookup_field))
+        return None
+
+    def build_batch_inputs(self, action, chunk):
+        pk = self.key_properties[0] if self.key_properties else "id"
+        inputs = []
+        for index, entry in enumerate(chunk):
+            record = entry["record"]
+            properties = {key: value for key, value in (record.get("properties") or {}).items() if key != pk}
+            batch_input = {"properties": properties, "objectWriteTraceId": str(index)}
+            if action == "update":
+                batch_input["id"] = record["properties"][pk]
+                # Hubspot only supports including associations in create calls
+                entry["associations"] = record.get("associations")
+            elif action == "upsert":
+                batch_input["idProperty"] = self.unique_lookup_field
+                batch_input["id"] = record["properties"][self.unique_lookup_field]
+                entry["associations"] = record.get("associations")
+            elif record.get("associations"):
+                batch_input["associations"] = record["associations"]
+            inputs.append(batch_input)
+        return inputs
+
+    def write_batch(self, action, chunk, context):
+        pk = self.key_properties[0] if self.key_properties else "id"
+        if action == "update" and not any(len(entry["record"]["properties"]) > 1 for entry in chunk):
+            # nothing to write besides the id, same as the per-record path
+            for entry in chunk:
+                entry["id"] = entry["record"]["properties"][pk]
+                entry["associations"] = entry["record"].get("associations")
+            return
+
+        try:
+            self.post_batch(action, chunk)
+        except (InvalidPayloadError, FatalAPIError) as e:
+            # a single invalid input fails the whole call, retry one by one to report per record
+            self.logger.warning(f"Batch {action} of {len(chunk)} {self.name} failed, retrying per record: {e}")
+            for entry in chunk:
+                try:
+                    if action == "upsert":
+                        # no id to write to, upserted by its unique value on its own
+                        self.post_batch(action, [entry])
+                    else:
+                        entry["id"], _, _ = self.write_record(entry["record"], context)
+                        entry["associations"] = None
+                        entry["recorded"] = True
+                except Exception as record_error:
+                    entry["error"] = record_error
+        except Exception as e:
+            for entry in chunk:
+                entry["error"] = e
+
+    def post_batch(self, action, chunk):
+        inputs = self.build_batch_inputs(action, chunk)
+        response = self.request_api(
+            "POST", endpoint=f"{self.endpoint}/batch/{action}", request_data={"inputs": inputs}
+        )
+        self.map_batch_response(action, chunk, inputs, response.json())
+
+    def map_batch_response(self, action, chunk, inputs, response_json):
+        """Map batch results and errors back to the buffered records they belong to."""
+        by_trace_id = {batch_input["objectWriteTraceId"]: entry for batch_input, entry in zip(inputs, chunk)}
+        by_input_id = {normalize_lookup_value(batch_input.get("id")): entry for batch_input, entry in zip(inputs, chunk)}
+        results = response_json.get("results", [])
+        errors = response_json.get("errors", [])
+
+        unmatched_results = []
+        for result in results:
+            entry = by_trace_id.get(result.get("objectWriteTraceId"))
+            if entry is None and action == "update":
+                entry = by_input_id.get(normalize_lookup_value(result.get("id")))
+            if entry is None and action == "upsert":
+                value = (result.get("properties") or {}).get(self.unique_lookup_field)
+                entry = by_input_id.get(normalize_lookup_value(value))
+            if entry is None:
+                unmatched_results.append(result)
+            else:
+                entry["id"] = result.get("id")
+
+        for error in errors:
+            error_context = error.get("context") or {}
+            keys = error_context.get("objectWriteTraceId") or []
+            entries = [by_trace_id[key] for key in keys if key in by_trace_id]
+            if not entries:
+                entries = [by_input_id[key] for key in map(normalize_lookup_value, error_context.get("ids") or []) if key in by_input_id]
+            for entry in entries:
+                entry["error"] = Exception(error.get("message") or str(error))
+
+        if unmatched_results and not errors and len(results) == len(chunk):
+            # HubSpot keeps the input order when every input succeeded
+            for result, entry in zip(results, chunk):
+                entry["id"] = result.get("id")
+
+        for entry in chunk:
+            if entry["id"] is None and entry["error"] is None:
+                entry["error"] = Exception(f"No result returned for record in batch {action} of {self.name}")
+
+    def association_input(self, id, association):
+        """Validate an association of object `id`, returning (from object, to object, batch input)."""
+        to_id = association.get("to", {}).get("id")
+        to_object_name = association.get("to", {}).get("objectType")
+        fully_qualified_object_name = association.get("from", {}).get("objectType")
+        if not to_id:
+            raise Exception(f"to id is required for {association}")
+
+        if not to_object_name:
+            raise Exception(f"to objectType is required for {association}")
+
+        types = association.get("types", [])
+        if not types and association.get("label"):
+            types = [{"label": association["label"]}]
+        if not types:
+            raise Exception(f"types is required for {association}")
+
+        from_object_name = fully_qualified_object_name or self.name
+        # types can be given by label name only, resolved from the cached label definitions
+        types = ASSOCIATION_TYPES.resolve_types(dict(self.config), from_object_name, to_object_name, types)
+        batch_input = {"from": {"id": str(id)}, "to": {"id": str(to_id)}, "types": types}
+        return from_object_name, to_object_name, batch_input
+
+    def put_associations(self, id, associations):
+        """Create the associations of a record written on its own, with one batch call per object types."""
+        entry = {"id": id, "error": None, "associations": associations}
+        self.write_batch_associations([entry])
+        if entry["error"] is not None:
+            raise entry["error"]
+
+    @PROFILER.timed("associations")
+    def write_batch_associations(self, entries):
+        """
+        Create the associations of the written records through the v4 batch endpoint, grouped
+        by object types with up to 100 pairs per call. Failed pairs fail the record they belong to.
+        """
+        inputs_by_types = {}
+        for entry in entries:
+            if entry["error"] is not None or not entry["id"] or not entry.get("associations"):
+                continue
+            try:
+                entry_inputs = [self.association_input(entry["id"], association) for association in entry["associations"]]
+            except Exception as e:
+                entry["error"] = e
+                continue
+            for from_object_name, to_object_name, batch_input in entry_inputs:
+                inputs_by_types.setdefault((from_object_name, to_object_name), []).append((entry, batch_input))
+
+        for (from_object_name, to_object_name), pairs in inputs_by_types.items():
+            for chunk in chunk_unique(pairs, MAX_BATCH_INPUTS):
+                try:
+                    response_json = create_associations_batch(
+                        dict(self.config), from_object_name, to_object_name, [batch_input for _, batch_input in chunk]
+                    )
+                except Exception as e:
+                    for entry, _ in chunk:
+                        entry["error"] = entry["error"] or e
+                    continue
+
+                created = {
+                    (str(result.get("fromObjectId")), str(result.get("toObjectId")))
+                    for result in response_json.get("results", [])
+                }
+                messages = "; ".join(error.get("message") or str(error) for error in response_json.get("errors", []))
+                for entry, batch_input in chunk:
+                    if (batch_input["from"]["id"], batch_input["to"]["id"]) not in created and entry["error"] is None:
+                        entry["error"] = Exception(
+                            f"Association of {from_object_name} {batch_input['from']['id']} to {to_object_name} "
+                            f"{batch_input['to']['id']} was not created: {messages}"
+                        )
@@ -6,11 +6,21 @@ from pathlib import PurePath
 from hotglue_singer_sdk import typing as th
 from hotglue_singer_sdk.sinks import Sink
 from hotglue_singer_sdk.helpers.capabilities import AlertingLevel
+from hotglue_singer_sdk.helpers._util import read_json_file
 
 from target_hubspot_v4.sinks import (
     FallbackSink,
 )
 from target_hubspot_v4.unified import UnifiedSink
+from target_hubspot_v4.auth import TOKEN_MANAGER
+from target_hubspot_v4.cache import LOOKUP_CACHE
+from target_hubspot_v4.hashes import WRITE_HASHES
+from target_hubspot_v4.id_map import ID_MAP
+from target_hubspot_v4.metrics import METRICS
+from target_hubspot_v4.profiling import PROFILER
+from target_hubspot_v4.rate_limit import RATE_LIMITER
+from target_hubspot_v4.retry import RETRY_POLICY
+from target_hubspot_v4.transport import TRANSPORT
 
 
 class TargetHubspotv4(TargetHotglue):
@@ -25,6 +35,15 @@ class TargetHubspotv4(TargetHotglue):
     ) -> None:
         self.config_file = config[0]
         super().__init__(config, parse_env_config, validate_config)
+        LOOKUP_CACHE.max_size = int(self.config.get("lookup_cache_size", LOOKUP_CACHE.max_size))
+        RATE_LIMITER.configure(self.config.get("rate_limits"))
+        RETRY_POLICY.configure(self.config)
+        TOKEN_MANAGER.configure(self._config, self.config_file)
+        TRANSPORT.configure(self.config)
+        PROFILER.configure(self.config)
+        WRITE_HASHES.configure(self.config)
+        # the state of the previous run, only read for the ids it carries
+        ID_MAP.configure(self.config, read_json_file(state) if isinstance(state, (str, PurePath)) else state)
 
     name = "target-hubspot-v4"
     alerting_level = AlertingLevel.ERROR
@@ -57,5 +76,36 @@ class TargetHubspotv4(TargetHotglue):
         for sink_class in self.SINK_TYPES:
             return FallbackSink
 
+    def _process_record_message(self, message_dict: dict) -> None:
+        METRICS.count_record(message_dict.get("stream"))
+        with METRICS.stream(message_dict.get("stream")), PROFILER.record(message_dict.get("stream")):
+            super()._process_record_message(message_dict)
+
+    def listen(self, file_input=None) -> None:
+        PROFILER.start()
+        try:
+            super().listen(file_input)
+        finally:
+            PROFILER.stop()
+
+    def _process_endofpipe(self) -> None:
+        # buffered sinks are flushed first, drain_all snapshots the state before draining
+        for sink in self._sinks_to_clear + list(self._sinks_active.values()):
+            self.drain_one(sink)
+            if isinstance(sink, FallbackSink):
+                with METRICS.stream(sink.stream_name), PROFILER.stream(sink.stream_name):
+                    sink.finish_imports({})
+        ID_MAP.write_state(self._latest_state.setdefault("target", {}) if self.streaming_job else self._latest_state)
+        super()._process_endofpipe()
+        LOOKUP_CACHE.log_stats()
+        RATE_LIMITER.log_stats()
+        RETRY_POLICY.log_stats()
+        ID_MAP.log_stats()
+        TRANSPORT.log_stats()
+        PROFILER.log_stats()
+        WRITE_HASHES.log_stats()
+        WRITE_HASHES.close()
+        METRICS.write_report(self.config, phases=PROFILER.report() if PROFILER.enabled else None)
+
 if __name__ == "__main__":
     TargetHubspotv4.cli()
@@ -0,0 +1,56 @@
+"""Fakes shared by the tests: responses of the request helpers and sinks built without the SDK."""
+
+import logging
+
+import pytest
+
+from target_hubspot_v4 import sinks, unified
+from target_hubspot_v4.cache import LookupCache
+from target_hubspot_v4.dag import WorkflowRunner
+from target_hubspot_v4.sinks import FallbackSink
+from target_hubspot_v4.unified import UnifiedSink
+
+
+class FakeResponse:
+    """Response of a request helper with a JSON body."""
+
+    reason = "OK"
+
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def make_sink(monkeypatch):
+    """
+    Build a FallbackSink or UnifiedSink with `config` and `stream_name` but without the
+    SDK's set up, so no request is sent. The sinks get a fresh lookup cache.
+    """
+
+    def make(sink_class=FallbackSink, config=None, stream_name="contacts"):
+        monkeypatch.setattr(sinks, "LOOKUP_CACHE", LookupCache())
+        monkeypatch.setattr(unified, "LOOKUP_CACHE", LookupCache())
+        sink = sink_class.__new__(sink_class)
+        sink._config = dict(config or {})
+        sink.stream_name = stream_name
+        sink.key_properties = []
+        sink.logger = logging.getLogger("test")
+        sink._pending_records = []
+        if issubclass(sink_class, UnifiedSink):
+            sink.workflows = WorkflowRunner()
+            sink._list_ids = {}
+            sink._list_memberships = {}
+            sink._existing_activities = {}
+        else:
+            sink.object_index = None
+            sink._mapped_ids = set()
+        return sink
+
+    return make
@@ -0,0 +1,161 @@
+"""Tests for the association type registry and associated ids cache."""
+
+import pytest
+
+from target_hubspot_v4 import associations, sinks
+from target_hubspot_v4.associations import AssociatedIdsCache, AssociationTypeRegistry
+from target_hubspot_v4.tests.conftest import FakeResponse
+
+
+def test_labels_are_loaded_once_and_resolved_by_name(monkeypatch):
+    urls = []
+
+    def request(config, url):
+        urls.append(url)
+        return FakeResponse({"results": [
+            {"category": "USER_DEFINED", "typeId": 36, "label": "Decision maker"},
+            {"category": "HUBSPOT_DEFINED", "typeId": 3, "label": None},
+        ]})
+
+    monkeypatch.setattr(associations, "request", request)
+    registry = AssociationTypeRegistry()
+
+    assert registry.resolve({}, "deals", "contacts") == {"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": 3}
+    assert registry.resolve_types({}, "Deals", "contacts", [{"label": "decision maker"}]) == [
+        {"associationCategory": "USER_DEFINED", "associationTypeId": 36}
+    ]
+    with pytest.raises(Exception, match="Decision maker"):
+        registry.resolve({}, "deals", "contacts", "Champion")
+    assert urls == ["https://api.hubapi.com/crm/v4/associations/deals/contacts/labels"]
+
+
+def test_associated_ids_are_read_in_batch_once(monkeypatch):
+    reads = []
+
+    def request_push(config, url, payload):
+        reads.append([batch_input["id"] for batch_input in payload["inputs"]])
+        return FakeResponse({"results": [
+            {"from": {"id": "1"}, "to": [{"toObjectId": 10}, {"toObjectId": 11}]},
+        ]})
+
+    monkeypatch.setattr(associations, "request_push", request_push)
+    cache = AssociatedIdsCache()
+
+    assert cache.get_many({}, "contacts", "deals", ["1", 2, "1"]) == {"1": ["10", "11"], "2": []}
+    cache.add("deals", "contacts", 12, 2)
+    assert cache.get_many({}, "contacts", "deals", [2]) == {"2": ["12"]}
+    assert reads == [["1", "2"]]
+
+
+DEFAULT_TYPE = [{"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": 3}]
+
+
+def association_sink(monkeypatch, make_sink, create_associations_batch):
+    monkeypatch.setattr(sinks, "create_associations_batch", create_associations_batch)
+    return make_sink(stream_name="deals")
+
+
+def entry(id, *associations):
+    return {"record": {}, "id": id, "error": None, "associations": list(associations)}
+
+
+def association(to_object_name, to_id, types=DEFAULT_TYPE):
+    return {"to": {"objectType": to_object_name, "id": to_id}, "types": types}
+
+
+def test_batch_associations_fail_only_the_records_of_failed_pairs(monkeypatch, make_sink):
+    calls = []
+
+    def create_associations_batch(config, from_object_name, to_object_name, inputs):
+        calls.append((from_object_name, to_object_name, [(i["from"]["id"], i["to"]["id"]) for i in inputs]))
+        if to_object_name == "companies":
+            return {
+                "results": [{"fromObjectId": 1, "toObjectId": 20}],
+                "errors": [{"message": "Company 21 does not exist"}],
+            }
+        return {"results": [{"fromObjectId": 1, "toObjectId": 10}, {"fromObjectId": 2, "toObjectId": 11}]}
+
+    sink = association_sink(monkeypatch, make_sink, create_associations_batch)
+    entries = [
+        entry("1", association("contacts", "10"), association("companies", "20")),
+        entry("2", association("contacts", "11"), association("companies", "21")),
+        entry("3", association("contacts", None)),
+        entry(None, association("contacts", "12")),
+    ]
+
+    sink.write_batch_associations(entries)
+
+    assert calls == [
+        ("deals", "contacts", [("1", "10"), ("2", "11")]),
+        ("deals", "companies", [("1", "20"), ("2", "21")]),
+    ]
+    assert entries[0]["error"] is None
+    assert str(entries[1]["error"]) == (
+        "Association of deals 2 to companies 21 was not created: Company 21 does not exist"
+    )
+    assert str(entries[2]["error"]).startswith("to id is required")
+    assert entries[3]["error"] is None
+
+
+def test_failed_association_calls_fail_only_their_records(monkeypatch, make_sink):
+    def create_associations_batch(config, from_object_name, to_object_name, inputs):
+        if to_object_name == "companies":
+            raise Exception("Internal error")
+        return {"results": [{"fromObjectId": int(i["from"]["id"]), "toObjectId": int(i["to"]["id"])} for i in inputs]}
+
+    sink = association_sink(monkeypatch, make_sink, create_associations_batch)
+    entries = [entry("1", association("contacts", "10")), entry("2", association("companies", "20"))]
+
+    sink.write_batch_associations(entries)
+
+    assert [str(entry["error"]) if entry["error"] else None for entry in entries] == [None, "Internal error"]
+
+
+def test_batch_associations_resolve_types_given_by_label(monkeypatch, make_sink):
+    def request(config, url):
+        return FakeResponse({"results": [
+            {"category": "USER_DEFINED", "typeId": 36, "label": "Decision maker"},
+            {"category": "HUBSPOT_DEFINED", "typeId": 3, "label": None},
+        ]})
+
+    monkeypatch.setattr(associations, "request", request)
+    monkeypatch.setattr(sinks, "ASSOCIATION_TYPES", AssociationTypeRegistry())
+    sent = []
+
+    def create_associations_batch(config, from_object_name, to_object_name, inputs):
+        sent.extend(inputs)
+        return {"results": [{"fromObjectId": 1, "toObjectId": 10}, {"fromObjectId": 2, "toObjectId": 11}]}
+
+    sink = association_sink(monkeypatch, make_sink, create_associations_batch)
+    entries = [
+        entry("1", association("contacts", "10", [{"label": "decision maker"}])),
+        entry("2", {"to": {"objectType": "contacts", "id": "11"}, "label": "Champion"}),
+    ]
+
+    sink.write_batch_associations(entries)
+
+    assert sent == [{
+        "from": {"id": "1"},
+        "to": {"id": "10"},
+        "types": [{"associationCategory": "USER_DEFINED", "associationTypeId": 36}],
+    }]
+    assert entries[0]["error"] is None
+    assert str(entries[1]["error"]).startswith("Association label Champion not found")
+
+
+def test_associations_of_single_records_are_created_in_batch(monkeypatch, make_sink):
+    calls = []
+
+    def create_associations_batch(config, from_object_name, to_object_name, inputs):
+        calls.append((to_object_name, [i["to"]["id"] for i in inputs]))
+        if to_object_name == "companies":
+            return {"results": [], "errors": [{"message": "Company 20 does not exist"}]}
+        return {"results": [{"fromObjectId": 1, "toObjectId": int(i["to"]["id"])} for i in inputs]}
+
+    sink = association_sink(monkeypatch, make_sink, create_associations_batch)
+
+    sink.put_associations("1", [association("contacts", "10"), association("contacts", "11")])
+    with pytest.raises(Exception, match="Company 20 does not exist"):
+        sink.put_associations("1", [association("companies", "20")])
+
+    assert calls == [("contacts", ["10", "11"]), ("companies", ["20"])]
@@ -0,0 +1,35 @@
+"""Tests for the shared OAuth token manager."""
+
+import json
+import threading
+
+from target_hubspot_v4 import auth
+from target_hubspot_v4.auth import TokenManager
+from target_hubspot_v4.tests.conftest import FakeResponse
+
+
+def test_token_is_refreshed_once_and_persisted(monkeypatch, tmp_path):
+    posts = []
+
+    def post(method, url, data):
+        posts.append(data["refresh_token"])
+        return FakeResponse({"access_token": "access", "refresh_token": "rotated", "expires_in": 1800})
+
+    monkeypatch.setattr(auth.TRANSPORT, "request", post)
+    config_file = tmp_path / "config.json"
+    config = {"client_id": "id", "client_secret": "secret", "refresh_token": "initial"}
+    config_file.write_text(json.dumps(config))
+    manager = TokenManager()
+    manager.configure(config, str(config_file))
+
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(manager.access_token())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tokens == ["access"] * 8
+    assert posts == ["initial"]
+    assert json.loads(config_file.read_text())["refresh_token"] == "rotated"
+    assert [path.name for path in tmp_path.iterdir()] == ["config.json"]
@@ -0,0 +1,145 @@
+"""Tests for the batch writes of fallback sinks."""
+
+from hotglue_etl_exceptions import InvalidPayloadError
+
+from target_hubspot_v4.buffer import BUFFERED
+from target_hubspot_v4.tests.conftest import FakeResponse
+
+
+def batch_sink(monkeypatch, make_sink, request_api):
+    sink = make_sink(config={"batch_upsert": True})
+    sink.states = []
+    sink.recorded = []
+    monkeypatch.setattr(sink, "request_api", request_api)
+    monkeypatch.setattr(sink, "record_write", lambda id, properties: sink.recorded.append(id))
+    monkeypatch.setattr(sink, "update_batch_entry_state", lambda entry: sink.states.append((entry["id"], entry["error"])))
+    return sink
+
+
+def entry(properties):
+    return {"record": {"properties": properties}, "id": None, "error": None}
+
+
+def echo_batch(calls):
+    """Answer batch calls with an id per input, out of input order."""
+    def request_api(method, endpoint, request_data):
+        calls.append((endpoint, request_data["inputs"]))
+        results = [
+            {"id": batch_input.get("id") if endpoint.endswith("update") else f"new-{batch_input['objectWriteTraceId']}",
+             "objectWriteTraceId": batch_input["objectWriteTraceId"]}
+            for batch_input in request_data["inputs"]
+        ]
+        return FakeResponse({"results": results[::-1]})
+    return request_api
+
+
+def test_records_are_split_into_updates_upserts_and_creates_and_states_kept_in_order(monkeypatch, make_sink):
+    calls = []
+    sink = batch_sink(monkeypatch, make_sink, echo_batch(calls))
+    pending = [
+        entry({"firstname": "A"}),
+        entry({"id": "7", "firstname": "B"}),
+        entry({"email": "c@x.com", "firstname": "C"}),
+        entry({"id": "8", "email": "d@x.com"}),
+    ]
+
+    sink.write_pending(pending, {})
+
+    assert [(endpoint, [batch_input.get("id") for batch_input in inputs]) for endpoint, inputs in calls] == [
+        ("/contacts/batch/update", ["7", "8"]),
+        ("/contacts/batch/upsert", ["c@x.com"]),
+        ("/contacts/batch/create", [None]),
+    ]
+    assert calls[1][1][0]["idProperty"] == "email"
+    assert sink.states == [("new-0", None), ("7", None), ("new-0", None), ("8", None)]
+    assert sink.recorded == ["new-0", "7", "new-0", "8"]
+
+
+def test_batch_errors_are_mapped_by_trace_id_or_input_id(monkeypatch, make_sink):
+    sink = batch_sink(monkeypatch, make_sink, None)
+    chunk = [entry({"id": "1"}), entry({"id": "2"}), entry({"id": "3"})]
+    inputs = sink.build_batch_inputs("update", chunk)
+
+    sink.map_batch_response("update", chunk, inputs, {
+        "results": [{"id": "1"}],
+        "errors": [
+            {"message": "Invalid value", "context": {"objectWriteTraceId": ["1"]}},
+            {"message": "Object not found", "context": {"ids": ["3"]}},
+        ],
+    })
+
+    assert [entry["id"] for entry in chunk] == ["1", None, None]
+    assert [str(entry["error"]) for entry in chunk] == ["None", "Invalid value", "Object not found"]
+
+
+def test_results_without_ids_are_mapped_in_input_order(monkeypatch, make_sink):
+    sink = batch_sink(monkeypatch, make_sink, None)
+    chunk = [entry({"firstname": "A"}), entry({"firstname": "B"})]
+    inputs = sink.build_batch_inputs("create", chunk)
+
+    sink.map_batch_response("create", chunk, inputs, {"results": [{"id": "11"}, {"id": "12"}]})
+
+    assert [(entry["id"], entry["error"]) for entry in chunk] == [("11", None), ("12", None)]
+
+
+def test_failed_batches_are_retried_per_record_without_creating_existing_objects(monkeypatch, make_sink):
+    calls = []
+
+    def request_api(method, endpoint, request_data):
+        inputs = request_data["inputs"]
+        calls.append((endpoint, [batch_input["id"] for batch_input in inputs]))
+        if len(inputs) > 1:
+            raise InvalidPayloadError("Property values were not valid")
+        if inputs[0]["id"] == "bad@x.com":
+            raise InvalidPayloadError("Invalid email")
+        return FakeResponse({"results": [{"id": "5", "objectWriteTraceId": "0"}]})
+
+    sink = batch_sink(monkeypatch, make_sink, request_api)
+    upserted = []
+
+    def write_record(record, context):
+        upserted.append(record["properties"]["id"])
+        return record["properties"]["id"], True, {}
+
+    monkeypatch.setattr(sink, "write_record", write_record)
+    pending = [
+        entry({"email": "a@x.com"}),
+        entry({"email": "bad@x.com"}),
+        entry({"id": "1", "firstname": "A"}),
+        entry({"id": "2", "firstname": "B"}),
+    ]
+
+    sink.write_pending(pending, {})
+
+    assert calls == [
+        ("/contacts/batch/update", ["1", "2"]),
+        ("/contacts/batch/upsert", ["a@x.com", "bad@x.com"]),
+        ("/contacts/batch/upsert", ["a@x.com"]),
+        ("/contacts/batch/upsert", ["bad@x.com"]),
+    ]
+    assert upserted == ["1", "2"]
+    assert [(id, str(error) if error else None) for id, error in sink.states] == [
+        ("5", None), (None, "Invalid email"), ("1", None), ("2", None)
+    ]
+    # the records written one by one were recorded by write_record
+    assert sink.recorded == ["5"]
+
+
+def test_buffered_records_are_queued_with_the_state_the_sdk_reports(monkeypatch, make_sink):
+    sink = make_sink(config={"batch_upsert": True})
+    monkeypatch.setattr(sink, "write_record", lambda record, context: ("1", True, {}))
+    record = {"properties": {"email": "a@x.com"}}
+
+    # what the SDK's process_record does with the outcome of upsert_record
+    id, success, state_updates = sink.upsert_record(record, {})
+    sink.update_state({"success": success, "hash": "h", "externalId": "e"}, record=record, snapshot_field_values={"a": 1})
+
+    assert (id, success, state_updates) == (None, BUFFERED, {})
+    assert not success
+    assert sink._pending_records == [{
+        "record": record, "hash": "h", "external_id": "e", "snapshot_field_values": {"a": 1}, "id": None, "error": None,
+    }]
+
+    sink._config = {}
+    assert sink.upsert_record(record, {}) == ("1", True, {})
+    assert len(sink._pending_records) == 1
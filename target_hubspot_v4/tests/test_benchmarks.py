@@ -0,0 +1,53 @@
+"""Tests for the benchmark stand-in of the HubSpot API."""
+
+import requests
+
+from benchmarks.faults import FaultInjector
+from benchmarks.run import compare
+from benchmarks.stub import HubSpotStub
+
+
+def test_stub_upserts_and_searches_objects():
+    stub = HubSpotStub()
+    base_url = stub.start()
+    try:
+        stub.seed("contacts", [{"email": "a@x.com"}])
+        response = requests.post(f"{base_url}/crm/v3/objects/contacts/batch/upsert", json={"inputs": [
+            {"idProperty": "email", "id": "A@x.com", "properties": {"firstname": "A"}},
+            {"idProperty": "email", "id": "b@x.com", "properties": {"firstname": "B"}},
+        ]})
+        assert response.status_code == 200
+        assert [result["id"] for result in response.json()["results"]] == ["1001", "1002"]
+
+        response = requests.post(f"{base_url}/crm/v3/objects/contacts/search", json={
+            "filterGroups": [{"filters": [{"propertyName": "email", "operator": "IN", "values": ["a@x.com", "c@x.com"]}]}],
+            "properties": ["firstname"],
+        })
+        assert [result["properties"]["firstname"] for result in response.json()["results"]] == ["A"]
+        assert stub.calls == {
+            "POST /crm/v3/objects/{object}/batch/upsert": 1,
+            "POST /crm/v3/objects/{object}/search": 1,
+        }
+    finally:
+        stub.stop()
+
+
+def test_more_calls_per_record_than_the_baseline_is_a_regression():
+    baseline = [{"scenario": "contacts", "records": 1000, "calls_per_record": 1.0}]
+
+    assert compare([{"scenario": "contacts", "records": 1000, "calls_per_record": 1.04}], baseline, 0.05) == []
+    assert len(compare([{"scenario": "contacts", "records": 1000, "calls_per_record": 1.1}], baseline, 0.05)) == 1
+
+
+def test_rate_limit_faults_send_headers_and_429s():
+    faults = FaultInjector({"rate_limit": {"max": 100, "interval_ms": 10000, "secondly": 2}}, seed=1)
+
+    headers, fault = faults.fault("/crm/v3/objects/contacts")
+    assert fault is None
+    assert headers["X-HubSpot-RateLimit-Secondly-Remaining"] == "1"
+    assert headers["X-HubSpot-RateLimit-Remaining"] == "99"
+    faults.fault("/crm/v3/objects/contacts")
+    headers, fault = faults.fault("/crm/v3/objects/contacts")
+    assert fault[0] == 429
+    assert headers["X-HubSpot-RateLimit-Secondly-Remaining"] == "0"
+    assert faults.injected == {"429": 1}
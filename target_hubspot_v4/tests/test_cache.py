@@ -0,0 +1,39 @@
+"""Tests for the in-run lookup cache."""
+
+from target_hubspot_v4.cache import LookupCache
+
+
+def test_negative_result_is_cached_and_filled_on_create():
+    cache = LookupCache()
+    cache.set("contacts", {"email": "A@x.com"}, [])
+
+    assert cache.get("contacts", {"email": "a@x.com "}) == (True, [])
+
+    cache.invalidate("contacts", "11", {"email": "a@x.com", "firstname": "A"})
+    cached, results = cache.get("contacts", {"email": "a@x.com"})
+    assert cached
+    assert [result["id"] for result in results] == ["11"]
+
+
+def test_entry_is_dropped_when_looked_up_value_changes():
+    cache = LookupCache()
+    cache.set("companies", {"name": "Acme"}, [{"id": "5", "properties": {"name": "Acme"}}])
+
+    cache.invalidate("companies", "5", {"domain": "acme.com"})
+    assert cache.get("companies", {"name": "Acme"})[0]
+
+    cache.invalidate("companies", "5", {"name": "Acme Inc"})
+    assert cache.get("companies", {"name": "Acme"}) == (False, None)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LookupCache(max_size=2)
+    cache.set("deals", {"dealname": "a"}, [])
+    cache.set("deals", {"dealname": "b"}, [])
+    cache.get("deals", {"dealname": "a"})
+    cache.set("deals", {"dealname": "c"}, [])
+
+    assert cache.get("deals", {"dealname": "b"}) == (False, None)
+    assert cache.get("deals", {"dealname": "a"})[0]
+    assert cache.hits == 2
+    assert cache.misses == 1
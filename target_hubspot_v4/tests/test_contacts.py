@@ -0,0 +1,37 @@
+"""Tests for the batched contacts of unified sinks."""
+
+from target_hubspot_v4 import unified
+from target_hubspot_v4.tests.conftest import FakeResponse
+from target_hubspot_v4.unified import UnifiedSink
+
+
+def test_conflicting_contacts_are_retried_one_by_one(monkeypatch, make_sink):
+    def request_push(config, url, payload, params=None, method="POST"):
+        return FakeResponse({
+            "results": [{"id": "1", "objectWriteTraceId": "0"}],
+            "errors": [{
+                "category": "CONFLICT",
+                "message": "Contact already exists. Existing ID: 42",
+                "context": {"objectWriteTraceId": ["1"]},
+            }],
+        }, 207)
+
+    uploaded = []
+
+    def upload_contact(row):
+        uploaded.append(dict(row))
+        return {"id": row["id"]}
+
+    monkeypatch.setattr(unified, "request_push", request_push)
+    sink = make_sink(UnifiedSink)
+    monkeypatch.setattr(sink, "record_write", lambda *args: None)
+    monkeypatch.setattr(sink, "upload_contact", upload_contact)
+    chunk = [
+        {"row": {"properties": {"email": "a@x.com"}}, "id": None, "error": None},
+        {"row": {"properties": {"email": "b@x.com"}}, "id": None, "error": None},
+    ]
+
+    sink.write_contacts_batch("create", chunk)
+
+    assert [(entry["id"], entry["error"]) for entry in chunk] == [("1", None), ("42", None)]
+    assert uploaded == [{"properties": {"email": "b@x.com"}, "id": "42"}]
@@ -0,0 +1,101 @@
+"""Tests for the workflow engine."""
+
+import threading
+
+import pytest
+
+from target_hubspot_v4.dag import Workflow, WorkflowRunner
+
+
+def test_independent_steps_overlap_and_dependents_see_results():
+    runner = WorkflowRunner(max_workers=2)
+    barrier = threading.Barrier(2, timeout=5)
+    workflow = Workflow()
+
+    async def first(results):
+        # both steps have to be in flight at once to pass the barrier
+        await runner.call(barrier.wait)
+        return "a"
+
+    async def second(results):
+        await runner.call(barrier.wait)
+        return "b"
+
+    async def combine(results):
+        return results["first"] + results["second"]
+
+    workflow.add("first", first)
+    workflow.add("second", second)
+    workflow.add("combine", combine, after=["first", "second"])
+
+    assert runner.run(workflow)["combine"] == "ab"
+
+
+def test_failed_workflow_is_reported_without_stopping_other_chains():
+    runner = WorkflowRunner()
+    written = []
+
+    def build(name, fail=False):
+        workflow = Workflow()
+
+        async def write(results):
+            if fail:
+                raise ValueError(name)
+            written.append(name)
+
+        async def after_write(results):
+            written.append(f"{name} done")
+
+        workflow.add("write", write)
+        workflow.add("after_write", after_write, after=["write"])
+        return lambda: workflow
+
+    outcomes = runner.run_all([[build("a", fail=True), build("b")], [build("c")]])
+
+    assert isinstance(outcomes[0][0], ValueError)
+    assert "a done" not in written
+    assert written.index("b") < written.index("b done")
+    assert "c done" in written
+
+    with pytest.raises(ValueError):
+        Workflow().add("orphan", None, after=["missing"])
+
+
+def test_single_worker_runners_run_steps_inline():
+    runner = WorkflowRunner()
+    threads = []
+    workflow = Workflow()
+
+    async def write(results):
+        return await runner.call(lambda: threads.append(threading.get_ident()) or "id")
+
+    async def associate(results):
+        return await runner.gather(*(runner.call(lambda to=to: f"{results['write']}-{to}") for to in ("a", "b")))
+
+    workflow.add("write", write)
+    workflow.add("associate", associate, after=["write"])
+
+    assert runner.run(workflow) == {"write": "id", "associate": ["id-a", "id-b"]}
+    assert threads == [threading.get_ident()]
+    assert runner._executor is None
+
+
+def test_worker_threads_are_kept_between_runs():
+    runner = WorkflowRunner(max_workers=2)
+
+    def build():
+        workflow = Workflow()
+
+        async def write(results):
+            return await runner.call(threading.get_ident)
+
+        workflow.add("write", write)
+        return workflow
+
+    runner.run(build())
+    executor = runner._executor
+    runner.run(build())
+    assert runner._executor is executor
+
+    runner.close()
+    assert runner._executor is None
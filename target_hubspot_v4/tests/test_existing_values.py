@@ -0,0 +1,33 @@
+"""Tests for the existing values kept by only_upsert_empty_fields."""
+
+from target_hubspot_v4 import sinks
+
+
+def test_existing_values_are_read_in_batch_and_kept(monkeypatch, make_sink):
+    reads = []
+
+    def read_objects_by_ids(config, object_name, ids, properties=None):
+        reads.append(("id", list(ids), properties))
+        return [{"id": "7", "properties": {"firstname": "Old", "lastname": None}}]
+
+    def read_objects_by_unique_property(config, object_name, property_name, values, properties=None):
+        reads.append((property_name, list(values), properties))
+        return [{"id": "8", "properties": {"email": "b@x.com", "firstname": "Kept"}}]
+
+    monkeypatch.setattr(sinks, "read_objects_by_ids", read_objects_by_ids)
+    monkeypatch.setattr(sinks, "read_objects_by_unique_property", read_objects_by_unique_property)
+    sink = make_sink(config={"only_upsert_empty_fields": True})
+    entries = [
+        {"record": {"properties": {"id": "7", "firstname": "New", "lastname": "New"}}, "error": None},
+        {"record": {"properties": {"email": "B@x.com", "firstname": "New"}}, "error": None},
+        {"record": {"properties": {"email": "c@x.com", "firstname": "New"}}, "error": None},
+    ]
+
+    sink.keep_existing_values(entries)
+
+    assert [entry["record"]["properties"]["firstname"] for entry in entries] == ["Old", "Kept", "New"]
+    assert entries[0]["record"]["properties"]["lastname"] == "New"
+    assert reads == [
+        ("id", ["7"], ["firstname", "lastname"]),
+        ("email", ["B@x.com", "c@x.com"], ["email", "firstname"]),
+    ]
@@ -0,0 +1,35 @@
+"""Tests for the write hashes kept across runs."""
+
+import time
+
+from target_hubspot_v4.hashes import WriteHashStore
+
+
+def test_unchanged_properties_are_found_in_the_next_run(tmp_path):
+    config = {"change_detection_path": str(tmp_path / "hashes.db")}
+    store = WriteHashStore()
+    store.configure(config)
+    store.record("contacts", "11", {"email": "a@x.com", "age": 30}, lookup={"email": "A@x.com"})
+    store.close()
+
+    store.configure(config)
+    assert store.unchanged("contacts", {"age": "30", "email": "a@x.com"}, id="11") == "11"
+    assert store.unchanged("contacts", {"email": "a@x.com", "age": 30}, lookup={"email": "a@x.com "}) == "11"
+    assert store.unchanged("contacts", {"email": "a@x.com", "age": 31}, id="11") is None
+    assert store.unchanged("contacts", {"email": "a@x.com", "age": 30}, id="12") is None
+    assert store.skipped == {"contacts": 2}
+
+    store.configure(dict(config, change_detection_refresh=True))
+    assert store.unchanged("contacts", {"email": "a@x.com", "age": 30}, id="11") is None
+    store.close()
+
+
+def test_hashes_older_than_the_ttl_are_ignored(tmp_path):
+    store = WriteHashStore()
+    store.configure({"change_detection_path": str(tmp_path / "hashes.db"), "change_detection_ttl_hours": 1})
+    store.record("companies", "5", {"name": "Acme"})
+    assert store.unchanged("companies", {"name": "Acme"}, id="5") == "5"
+
+    store._pending = {key: (id, digest, time.time() - 7200) for key, (id, digest, _) in store._pending.items()}
+    assert store.unchanged("companies", {"name": "Acme"}, id="5") is None
+    store.close()
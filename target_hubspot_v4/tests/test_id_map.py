@@ -0,0 +1,35 @@
+"""Tests for the ids kept in the state across runs."""
+
+from target_hubspot_v4.id_map import IdMap
+
+
+def test_ids_are_carried_to_the_next_run_through_the_state():
+    config = {"lookup_state": True, "lookup_state_compress": True}
+    id_map = IdMap()
+    id_map.configure(config)
+    id_map.set("contacts", {"email": "A@x.com"}, 11)
+    id_map.set("contacts", {"email": None}, 12)
+    state = {"bookmarks": {}}
+    id_map.write_state(state)
+    assert isinstance(state["lookup_ids"], str)
+
+    id_map.configure(config, state)
+    assert id_map.get("contacts", {"email": "a@x.com "}) == "11"
+    assert id_map.get("contacts", {"email": "b@x.com"}) is None
+    id_map.discard("contacts", {"email": "a@x.com"})
+    assert id_map.get("contacts", {"email": "a@x.com"}) is None
+    assert (id_map.hits, id_map.misses) == (1, 2)
+
+
+def test_least_recently_used_ids_are_dropped():
+    id_map = IdMap()
+    id_map.configure({"lookup_state": True, "lookup_state_max_ids": 2})
+    id_map.set("companies", {"domain": "a.com", "name": "A"}, 1)
+    id_map.set("companies", {"domain": "b.com", "name": "B"}, 2)
+    id_map.get("companies", {"name": "A", "domain": "a.com"})
+    id_map.set("companies", {"domain": "c.com", "name": "C"}, 3)
+
+    assert id_map.get("companies", {"domain": "b.com", "name": "B"}) is None
+    assert id_map.get("companies", {"domain": "a.com", "name": "A"}) == "1"
+    # ids of other lookup fields are not reused
+    assert id_map.get("companies", {"domain": "a.com"}) is None
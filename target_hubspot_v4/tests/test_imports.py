@@ -0,0 +1,71 @@
+"""Tests for the writes through the Imports API."""
+
+from target_hubspot_v4 import imports, sinks
+from target_hubspot_v4.imports import ImportFile, ImportSpool, build_import_request, read_import_errors
+from target_hubspot_v4.tests.conftest import FakeResponse
+
+
+def entry(properties):
+    return {"record": {"properties": properties}, "hash": "h", "external_id": None, "snapshot_field_values": None}
+
+
+def test_spooled_records_are_written_to_a_csv_file_with_their_mappings(tmp_path):
+    spool = ImportSpool(str(tmp_path), "contacts")
+    spool.append([entry({"email": "a@x.com", "vip": True}), entry({"id": "7", "email": "b@x.com", "age": 30.0})])
+    assert list(spool.columns) == ["email", "vip", "id", "age"]
+
+    import_file = ImportFile(str(tmp_path), "contacts", ["id", "email", "vip", "age"])
+    for chunk in spool.read(1):
+        import_file.add(chunk[0])
+    import_file.close()
+    with open(import_file.path) as infile:
+        assert infile.read().splitlines() == ["id,email,vip,age", ",a@x.com,true,", "7,b@x.com,,30"]
+    assert [row["record"]["properties"]["email"] for row in import_file.entries()] == ["a@x.com", "b@x.com"]
+    import_file.remove()
+    assert list(tmp_path.iterdir()) == []
+
+    import_request = build_import_request("contacts", "contacts", "contacts.csv", ["id", "email"], "id", "email")
+    assert import_request["importOperations"] == {"0-1": "UPSERT"}
+    assert import_request["files"][0]["fileImportPage"]["columnMappings"] == [
+        {"columnObjectTypeId": "0-1", "columnName": "id", "propertyName": "hs_object_id", "columnType": "HUBSPOT_OBJECT_ID"},
+        {"columnObjectTypeId": "0-1", "columnName": "email", "propertyName": "email", "columnType": "HUBSPOT_ALTERNATE_ID"},
+    ]
+
+
+def test_import_errors_are_mapped_to_rows(monkeypatch):
+    pages = [
+        {
+            "results": [{"errorType": "INVALID_EMAIL", "invalidValue": "bad", "sourceData": {"lineNumber": 3}}],
+            "paging": {"next": {"after": "1"}},
+        },
+        {"results": [{"errorType": "INVALID_OBJECT_ID", "invalidValue": "9", "sourceData": {"lineNumber": 3}}, {"errorType": "FILE_ERROR"}]},
+    ]
+    calls = []
+
+    def request(config, url, params=None):
+        calls.append(params)
+        return FakeResponse(pages[len(calls) - 1])
+
+    monkeypatch.setattr(imports, "request", request)
+
+    assert read_import_errors({}, "1") == ({1: ["INVALID_EMAIL: bad", "INVALID_OBJECT_ID: 9"]}, ["FILE_ERROR"])
+    assert calls == [{"limit": 500}, {"limit": 500, "after": "1"}]
+
+
+def test_imported_rows_keep_their_ids_and_are_recorded(monkeypatch, tmp_path, make_sink):
+    monkeypatch.setattr(sinks, "submit_import", lambda config, import_request, path, file_name: {"id": "1"})
+    monkeypatch.setattr(sinks, "wait_for_import", lambda *args: {"state": "DONE"})
+    monkeypatch.setattr(sinks, "read_import_errors", lambda config, import_id: ({1: ["INVALID_EMAIL: bad"]}, []))
+    sink = make_sink()
+    recorded, states = [], []
+    monkeypatch.setattr(sink, "record_write", lambda id, properties: recorded.append((id, properties["email"])))
+    monkeypatch.setattr(sink, "update_batch_entry_state", lambda entry: states.append((entry["id"], str(entry["error"]))))
+    import_file = ImportFile(str(tmp_path), "contacts", ["id", "email"])
+    for properties in ({"id": "7", "email": "a@x.com"}, {"email": "bad"}, {"email": "c@x.com"}):
+        import_file.add(entry(properties))
+
+    sink.write_import(import_file)
+
+    assert states == [("7", "None"), (None, "INVALID_EMAIL: bad"), (None, "None")]
+    assert recorded == [("7", "a@x.com"), (None, "c@x.com")]
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,88 @@
+"""Tests for the pre-warmed lookup indexes."""
+
+from target_hubspot_v4 import index as index_module
+from target_hubspot_v4.index import ObjectIndex, search_shard
+from target_hubspot_v4.tests.conftest import FakeResponse
+
+
+def company(id, name, domain, createdate=None):
+    properties = {"name": name, "domain": domain}
+    if createdate:
+        properties["createdate"] = createdate
+    return {"id": id, "properties": properties}
+
+
+def fill(index):
+    for obj in [company("3", "A", "a.com"), company("1", "B", "b.com"), company("2", "B", "x.com"), company("4", "C", None)]:
+        index.add(obj)
+    index.freeze()
+
+
+def test_dict_and_compact_indexes_resolve_the_same_records():
+    for compact in (False, True):
+        index = ObjectIndex("companies", ["name", "domain"], sequential=True, compact=compact)
+        fill(index)
+
+        assert index.size == 4
+        assert index.lookup({"name": " a ", "domain": "A.com"}) == [{"id": "3"}]
+        assert index.lookup({"name": "B", "domain": "a.com"}) == []
+        assert index.lookup({"name": "C"}) == []
+        # names matching several objects are looked up by domain next
+        assert sorted(match["id"] for match in index.get({"name": "B"}, ("name",))) == ["1", "2"]
+        assert index.lookup({"name": "B", "domain": "x.com"}, "sequential") == [{"id": "2"}]
+
+
+def test_compact_indexes_merge_their_sorted_runs(monkeypatch):
+    monkeypatch.setattr(index_module, "SORT_RUN_SIZE", 3)
+    index = ObjectIndex("companies", ["domain"], compact=True)
+    for id in range(1, 11):
+        index.add(company(str(id), "A", f"{id}.com"))
+    index.freeze()
+
+    hashes = index._hashes[("domain",)]
+    assert list(hashes) == sorted(hashes)
+    assert [index.get({"domain": f"{id}.com"}) for id in range(1, 11)] == [[{"id": str(id)}] for id in range(1, 11)]
+
+
+def test_written_objects_take_precedence():
+    index = ObjectIndex("companies", ["name", "domain"], sequential=True, compact=True)
+    fill(index)
+
+    index.record_write("9", {"name": "D", "domain": "d.com"})
+    index.record_write("5", {"name": "B", "domain": "x.com"})
+    index.record_write(None, {"name": "E", "domain": "e.com"})
+
+    assert index.lookup({"name": "d", "domain": "d.com"}) == [{"id": "9"}]
+    assert index.lookup({"name": "B", "domain": "x.com"}) == [{"id": "5"}]
+    assert index.get({"name": "B"}, ("name",)) == [{"id": "5"}]
+    assert index.lookup({"name": "E", "domain": "e.com"}) == []
+
+
+def test_search_shards_restart_from_the_last_createdate_at_the_cap(monkeypatch):
+    monkeypatch.setattr(index_module, "PAGE_SIZE", 2)
+    monkeypatch.setattr(index_module, "SEARCH_RESULTS_CAP", 4)
+    dates = ["2024-01-01T00:00:00Z", "2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z",
+             "2024-01-03T00:00:00Z", "2024-01-03T00:00:00Z", "2024-01-04T00:00:00Z"]
+    objects = [company(str(id), f"N{id}", f"{id}.com", date) for id, date in enumerate(dates, 1)]
+    starts = []
+
+    def request_push(config, url, payload):
+        start, end = (f["value"] for f in payload["filterGroups"][0]["filters"])
+        if "after" not in payload:
+            starts.append(start)
+        matches = [obj for obj in objects if start <= index_module.parse_createdate(obj["properties"]["createdate"]) < end]
+        offset = int(payload.get("after", 0))
+        body = {"results": matches[offset:offset + payload["limit"]]}
+        if offset + payload["limit"] < len(matches):
+            body["paging"] = {"next": {"after": str(offset + payload["limit"])}}
+        return FakeResponse(body)
+
+    monkeypatch.setattr(index_module, "request_push", request_push)
+    index = ObjectIndex("companies", ["name"])
+    first = index_module.parse_createdate(dates[0])
+
+    search_shard({}, "companies", ["name"], first, first + 10 ** 10, index)
+
+    assert starts == [first, index_module.parse_createdate(dates[3])]
+    assert index.size == 6
+    assert [index.get({"name": f"N{id}"}) for id in range(1, 7)] == [[{"id": str(id)}] for id in range(1, 7)]
@@ -0,0 +1,64 @@
+"""Tests for the list memberships of unified contacts."""
+
+from target_hubspot_v4 import unified
+from target_hubspot_v4.tests.conftest import FakeResponse
+from target_hubspot_v4.unified import UnifiedSink
+
+
+def test_memberships_are_flushed_once_per_list(monkeypatch, make_sink):
+    lookups = []
+    updates = []
+
+    def request(config, url):
+        lookups.append(url)
+        return FakeResponse({"list": {"listId": url.rsplit("/", 1)[-1].upper()}})
+
+    def request_push(config, url, payload, method="POST"):
+        updates.append((url, payload))
+        return FakeResponse({})
+
+    monkeypatch.setattr(unified, "request", request)
+    monkeypatch.setattr(unified, "request_push", request_push)
+    sink = make_sink(UnifiedSink)
+
+    sink.subscribe_to_lists("1", ["a", "b"])
+    sink.subscribe_to_lists("2", ["a"])
+    sink.unsubscribe_from_lists("3", ["a"])
+    sink.unsubscribe_from_lists("2", ["b"])
+    assert updates == []
+    sink.flush_list_memberships()
+
+    assert len(lookups) == 2
+    assert [(url.split("/")[-3], payload["recordIdsToAdd"], payload["recordIdsToRemove"]) for url, payload in updates] == [
+        ("A", ["1", "2"], ["3"]),
+        ("B", ["1"], ["2"]),
+    ]
+
+
+def test_failed_membership_changes_fail_their_contacts(monkeypatch, make_sink):
+    def request_push(config, url, payload, method="POST"):
+        if "B" in url:
+            raise Exception("500 Server Error, Payload: " + str(payload))
+        return FakeResponse({})
+
+    monkeypatch.setattr(unified, "request_push", request_push)
+    sink = make_sink(UnifiedSink)
+    sink._list_ids = {"a": "A", "b": "B"}
+    entries = [{"id": "1", "error": None}, {"id": "2", "error": None}, {"id": "3", "error": Exception("failed")}]
+
+    sink.subscribe_to_lists("1", ["a"])
+    sink.subscribe_to_lists("2", ["a", "b"])
+    sink.write_list_memberships(entries)
+
+    assert entries[0]["error"] is None
+    assert str(entries[1]["error"]).startswith("Failed to update memberships of list B: 500 Server Error")
+    assert str(entries[2]["error"]) == "failed"
+    assert sink._list_memberships == {}
+
+
+def test_contact_streams_are_buffered_for_their_memberships(make_sink):
+    sink = make_sink(UnifiedSink)
+    assert sink.buffer_records
+
+    sink.stream_name = "deals"
+    assert not sink.buffer_records
@@ -0,0 +1,107 @@
+"""Tests for the batched lookups of fallback sinks."""
+
+from target_hubspot_v4 import sinks
+from target_hubspot_v4.utils import SearchResultsCapped
+
+
+def entry(properties):
+    return {"record": {"properties": properties}, "id": None, "error": None}
+
+
+def company(id, name, domain):
+    return {"id": id, "properties": {"name": name, "domain": domain}}
+
+
+def test_unique_fields_are_read_through_batch_read(monkeypatch, make_sink):
+    reads = []
+
+    def read_objects_by_unique_property(config, object_name, property_name, values, properties=None):
+        reads.append((object_name, property_name, list(values)))
+        return [{"id": "5", "properties": {"email": "a@x.com"}}]
+
+    monkeypatch.setattr(sinks, "read_objects_by_unique_property", read_objects_by_unique_property)
+    sink = make_sink()
+    entries = [entry({"email": "A@x.com "}), entry({"email": "b@x.com"}), entry({"email": "a@x.com"}), entry({})]
+
+    sink.resolve_batch_lookups(entries)
+
+    assert reads == [("contacts", "email", ["A@x.com ", "b@x.com"])]
+    assert [entry["record"]["properties"].get("id") for entry in entries] == ["5", None, "5", None]
+
+
+def test_in_searches_keep_exact_tuples_and_report_multiple_matches(monkeypatch, make_sink):
+    searches = []
+
+    def search_objects_by_property_values(config, object_name, values_by_property):
+        searches.append({name: sorted(values) for name, values in values_by_property.items()})
+        # the IN filters also match other combinations of the values
+        return [company("1", "A", "a.com"), company("2", "A", "b.com"), company("3", "B", "b.com"), company("4", "B", "b.com")]
+
+    monkeypatch.setattr(sinks, "search_objects_by_property_values", search_objects_by_property_values)
+    sink = make_sink(config={"lookup_fields": {"companies": ["name", "domain"]}}, stream_name="companies")
+    entries = [entry({"name": "A", "domain": "a.com"}), entry({"name": "B", "domain": "a.com"}), entry({"name": "B", "domain": "b.com"})]
+
+    sink.resolve_batch_lookups(entries)
+
+    assert searches == [{"domain": ["a.com", "b.com"], "name": ["a", "b"]}]
+    assert [entry["record"]["properties"].get("id") for entry in entries] == ["1", None, None]
+    assert str(entries[2]["error"]).startswith("Multiple objects found")
+
+
+def test_mixed_case_values_are_searched_in_lowercase(monkeypatch, make_sink):
+    def search_objects_by_property_values(config, object_name, values_by_property):
+        # HubSpot only matches IN values sent in lowercase
+        if "acme corp" in values_by_property["name"]:
+            return [company("1", "ACME Corp", "Acme.com")]
+        return []
+
+    monkeypatch.setattr(sinks, "search_objects_by_property_values", search_objects_by_property_values)
+    sink = make_sink(config={"lookup_fields": {"companies": ["name", "domain"]}}, stream_name="companies")
+    entries = [entry({"name": "ACME Corp ", "domain": "ACME.com"})]
+
+    sink.resolve_batch_lookups(entries)
+
+    assert entries[0]["record"]["properties"].get("id") == "1"
+
+
+def test_capped_in_searches_fall_back_to_one_search_per_record(monkeypatch, make_sink):
+    def search_objects_by_property_values(config, object_name, values_by_property):
+        raise SearchResultsCapped("Search of companies matched 12000 objects")
+
+    searches = []
+
+    def search_objects_by_property(config, object_name, properties):
+        searches.append({prop["property_name"]: prop["value"] for prop in properties})
+        return [company("9", "B", "b.com")] if properties[0]["value"] == "B" else []
+
+    monkeypatch.setattr(sinks, "search_objects_by_property_values", search_objects_by_property_values)
+    monkeypatch.setattr(sinks, "search_objects_by_property", search_objects_by_property)
+    sink = make_sink(config={"lookup_fields": {"companies": ["name", "domain"]}}, stream_name="companies")
+    entries = [entry({"name": "A", "domain": "a.com"}), entry({"name": "B", "domain": "b.com"})]
+
+    sink.resolve_batch_lookups(entries)
+
+    assert searches == [{"name": "A", "domain": "a.com"}, {"name": "B", "domain": "b.com"}]
+    assert [(entry["record"]["properties"].get("id"), entry["error"]) for entry in entries] == [(None, None), ("9", None)]
+
+
+def test_sequential_lookups_try_each_field_in_turn(monkeypatch, make_sink):
+    searches = []
+
+    def search_objects_by_property_values(config, object_name, values_by_property):
+        searches.append(values_by_property)
+        if "name" in values_by_property:
+            return [company("1", "A", "other.com"), company("2", "B", "x.com"), company("3", "B", "y.com")]
+        return [company("4", "C", "c.com")]
+
+    monkeypatch.setattr(sinks, "search_objects_by_property_values", search_objects_by_property_values)
+    config = {"lookup_fields": {"companies": ["name", "domain"]}, "lookup_method": "sequential"}
+    sink = make_sink(config=config, stream_name="companies")
+    entries = [entry({"name": "A", "domain": "a.com"}), entry({"name": "B", "domain": "b.com"}), entry({"name": "C", "domain": "c.com"})]
+
+    sink.resolve_batch_lookups(entries)
+
+    # names matching several companies are looked up by domain next, like those matching none
+    assert [list(values) for values in searches] == [["name"], ["domain"]]
+    assert sorted(searches[1]["domain"]) == ["b.com", "c.com"]
+    assert [entry["record"]["properties"].get("id") for entry in entries] == ["1", None, "4"]
@@ -0,0 +1,55 @@
+"""Tests for the request metrics."""
+
+import requests
+
+from target_hubspot_v4 import buffer
+from target_hubspot_v4.buffer import BufferedSinkMixin
+from target_hubspot_v4.metrics import Metrics, endpoint_template
+
+
+def test_endpoints_are_templated():
+    assert endpoint_template("POST", "https://api.hubapi.com/crm/v3/objects/contacts/search") == "POST /crm/v3/objects/{object}/search"
+    assert endpoint_template("GET", "https://api.hubapi.com/crm/v3/objects/contacts/a@b.com?idProperty=email") == "GET /crm/v3/objects/{object}/{id}"
+    assert endpoint_template("POST", "https://api.hubapi.com/crm/v4/associations/deals/contacts/batch/create") == (
+        "POST /crm/v4/associations/{from}/{to}/batch/create"
+    )
+
+
+def test_requests_are_counted_per_endpoint_and_stream():
+    metrics = Metrics()
+    request = requests.Request("POST", "https://api.hubapi.com/crm/v3/objects/deals", json={"a": 1}).prepare()
+    response = requests.Response()
+    response.status_code = 201
+    response._content = b"{}"
+
+    metrics.count_record("deals")
+    with metrics.stream("deals"):
+        metrics.observe(request, response, 0.2)
+        metrics.observe(request, None, 0.5)
+    metrics.observe_retry("POST /crm/v3/objects/{object}", 1.5)
+
+    report = metrics.report()
+    endpoint = report["endpoints"]["POST /crm/v3/objects/{object}"]
+    assert (endpoint["requests"], endpoint["statuses"], endpoint["errors"], endpoint["retries"]) == (2, {"201": 1}, 1, 1)
+    assert endpoint["bytes_sent"] == 2 * len(request.body)
+    assert report["streams"]["deals"] == {"records": 1, "requests": 2, "requests_per_record": 2.0}
+    assert 'hubspot_request_duration_seconds_bucket{endpoint="POST /crm/v3/objects/{object}",le="0.25"} 1' in metrics.openmetrics()
+
+
+def test_buffered_writes_are_attributed_to_their_stream(monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(buffer, "METRICS", metrics)
+    request = requests.Request("POST", "https://api.hubapi.com/crm/v3/objects/deals/batch/create").prepare()
+
+    class Sink(BufferedSinkMixin):
+        stream_name = "deals"
+
+        def flush_buffer(self, context):
+            metrics.observe(request, None, 0.1)
+
+        def write_record(self, record, context):
+            return None, False, {}
+
+    Sink().process_batch({})
+
+    assert metrics.report()["streams"]["deals"]["requests"] == 1
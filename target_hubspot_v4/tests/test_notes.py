@@ -0,0 +1,107 @@
+"""Tests for the batched notes of unified sinks."""
+
+from target_hubspot_v4 import unified
+from target_hubspot_v4.tests.conftest import FakeResponse
+from target_hubspot_v4.unified import UnifiedSink
+
+
+class FakeAssociationTypes:
+    def resolve(self, config, from_object_name, to_object_name, label=None):
+        return {"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": f"{from_object_name}-{to_object_name}"}
+
+
+def note(content, **record):
+    return {"record": dict(record, content=content, created_at="2024-01-01T00:00:00Z"), "id": None, "error": None}
+
+
+def test_note_names_are_resolved_once_and_notes_created_with_their_associations(monkeypatch, make_sink):
+    searches = []
+
+    def search_objects_by_property_values(config, object_name, values_by_property):
+        (property_name, values), = values_by_property.items()
+        searches.append((object_name, property_name, sorted(values)))
+        objects = {
+            "companies": [{"id": "1", "properties": {"name": "Acme"}}, {"id": "2", "properties": {"name": "Dup"}},
+                          {"id": "3", "properties": {"name": "dup"}}],
+            "deals": [{"id": "10", "properties": {"dealname": "Big"}}],
+        }
+        return objects[object_name]
+
+    creates = []
+
+    def request_push(config, url, payload, params=None, method="POST"):
+        creates.append((url, payload["inputs"]))
+        return FakeResponse({"results": [
+            {"id": f"n{batch_input['objectWriteTraceId']}", "objectWriteTraceId": batch_input["objectWriteTraceId"]}
+            for batch_input in payload["inputs"]
+        ]})
+
+    monkeypatch.setattr(unified, "ASSOCIATION_TYPES", FakeAssociationTypes())
+    monkeypatch.setattr(unified, "search_objects_by_property_values", search_objects_by_property_values)
+    monkeypatch.setattr(unified, "request_push", request_push)
+    sink = make_sink(UnifiedSink, stream_name="notes")
+    updated = []
+    monkeypatch.setattr(sink, "run_workflows", lambda entries: updated.extend(entries))
+    recorded = []
+    monkeypatch.setattr(sink, "record_write", lambda *args: recorded.append(args))
+    pending = [
+        note("first", company_name="Acme", deal_name="Big"),
+        note("second", company_name="acme ", deal_id="77"),
+        note("third", company_name="Dup"),
+        note("fourth", deal_name="Missing"),
+        note("fifth", id="5"),
+    ]
+
+    sink.upsert_notes_batch(pending)
+
+    assert searches == [("companies", "name", ["acme", "dup"]), ("deals", "dealname", ["big", "missing"])]
+    assert updated == [pending[4]]
+    assert [(url, [batch_input["properties"]["hs_note_body"] for batch_input in inputs]) for url, inputs in creates] == [
+        ("https://api.hubapi.com/crm/v3/objects/notes/batch/create", ["first", "second"]),
+    ]
+    company_type = {"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": "notes-companies"}
+    deal_type = {"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": "notes-deals"}
+    assert [batch_input["associations"] for batch_input in creates[0][1]] == [
+        [{"to": {"id": "1"}, "types": [company_type]}, {"to": {"id": "10"}, "types": [deal_type]}],
+        [{"to": {"id": "1"}, "types": [company_type]}, {"to": {"id": "77"}, "types": [deal_type]}],
+    ]
+    assert [(entry["id"], entry.get("success")) for entry in pending[:2]] == [("n0", True), ("n1", True)]
+    assert [(object_name, id, properties["hs_note_body"]) for object_name, id, properties in recorded] == [
+        ("notes", "n0", "first"), ("notes", "n1", "second")
+    ]
+    assert [(entry.get("success"), entry.get("state_updates")) for entry in pending[2:4]] == [
+        (False, {"error": "More than one company found for the provided company name"}),
+        (False, {"error": "No deal found for the provided deal name"}),
+    ]
+
+
+def test_single_tasks_and_notes_are_recorded_like_other_writes(monkeypatch, make_sink):
+    def request_push(config, url, payload, params=None, method="POST"):
+        return FakeResponse({"id": url.rsplit("/", 1)[-1][:-1] + "-1"})
+
+    monkeypatch.setattr(unified, "request_push", request_push)
+    sink = make_sink(UnifiedSink, stream_name="tasks")
+    recorded = []
+    record_write = sink.record_write
+    monkeypatch.setattr(sink, "record_write", lambda *args: recorded.append(args) or record_write(*args))
+
+    sink.workflows.run(sink.task_workflow({"title": "Call back", "end_datetime": "2024-01-01T00:00:00Z"}))
+    sink.workflows.run(sink.note_workflow(note("Met")["record"]))
+
+    assert [(object_name, id) for object_name, id, _ in recorded] == [("tasks", "task-1"), ("notes", "note-1")]
+    assert recorded[0][2]["hs_task_subject"] == "Call back"
+    assert recorded[1][2]["hs_note_body"] == "Met"
+
+
+def test_mixed_case_names_are_searched_in_lowercase(monkeypatch, make_sink):
+    def search_objects_by_property_values(config, object_name, values_by_property):
+        # HubSpot only matches IN values sent in lowercase
+        names = {"acme corp": {"id": "1", "properties": {"name": "ACME Corp"}}}
+        return [names[value] for value in values_by_property["name"] if value in names]
+
+    monkeypatch.setattr(unified, "search_objects_by_property_values", search_objects_by_property_values)
+    sink = make_sink(UnifiedSink, stream_name="notes")
+
+    matches = sink.find_by_lookup_property_values("companies", ["ACME Corp", "Acme corp "])
+
+    assert matches == {"acme corp": [{"id": "1", "properties": {"name": "ACME Corp"}}]}
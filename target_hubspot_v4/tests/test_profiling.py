@@ -0,0 +1,34 @@
+"""Tests for the phase timing."""
+
+import time
+
+from target_hubspot_v4.profiling import Profiler
+
+
+def test_nested_phases_are_only_counted_once():
+    profiler = Profiler()
+    profiler.configure({"profile_phases": True})
+
+    @profiler.timed("lookup")
+    def lookup():
+        time.sleep(0.02)
+
+    with profiler.record("deals"):
+        with profiler.phase("write"):
+            lookup()
+
+    report = profiler.report()["streams"]["deals"]
+    assert report["records"] == 1
+    assert report["seconds"]["lookup"] >= 0.02
+    assert report["seconds"]["write"] < 0.02
+    assert report["seconds"]["parse"] < 0.02
+
+
+def test_nothing_is_timed_when_disabled():
+    profiler = Profiler()
+    profiler.configure({})
+
+    with profiler.record("deals"), profiler.phase("write"):
+        pass
+
+    assert profiler.report()["streams"] == {}
@@ -0,0 +1,26 @@
+"""Tests for the property definitions registry."""
+
+from target_hubspot_v4 import properties
+from target_hubspot_v4.properties import PropertyRegistry
+from target_hubspot_v4.tests.conftest import FakeResponse
+
+
+def test_only_missing_properties_are_created_in_one_call(monkeypatch):
+    existing = [{"name": "email"}, {"name": "shoe_size"}]
+    created = []
+
+    def request(config, url):
+        return FakeResponse({"results": existing})
+
+    def request_push(config, url, payload):
+        created.append([definition["name"] for definition in payload["inputs"]])
+        return FakeResponse({"results": payload["inputs"]})
+
+    monkeypatch.setattr(properties, "request", request)
+    monkeypatch.setattr(properties, "request_push", request_push)
+    registry = PropertyRegistry()
+    definitions = [{"name": "shoe_size"}, {"name": "hat_size"}, {"name": "pet"}]
+
+    assert registry.ensure({}, "contacts", definitions) == {"shoe_size", "hat_size", "pet"}
+    assert registry.ensure({}, "contacts", definitions) == {"shoe_size", "hat_size", "pet"}
+    assert created == [["hat_size", "pet"]]
@@ -0,0 +1,58 @@
+"""Tests for the shared rate limiter."""
+
+import requests
+
+from target_hubspot_v4.rate_limit import RateLimiter
+
+
+def make_response(status_code=200, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+def test_requests_are_routed_to_their_bucket():
+    assert RateLimiter.bucket_name("https://api.hubapi.com/crm/v3/objects/contacts/search") == "search"
+    assert RateLimiter.bucket_name("https://api.hubapi.com/crm/v4/associations/deals/contacts/batch/create") == "associations"
+    assert RateLimiter.bucket_name("https://api.hubapi.com/crm/v4/objects/deals/1/associations/contacts/2") == "associations"
+    assert RateLimiter.bucket_name("https://api.hubapi.com/crm/v3/objects/contacts?limit=100") == "crm"
+
+
+def test_bucket_is_tuned_from_rate_limit_headers():
+    limiter = RateLimiter()
+    url = "https://api.hubapi.com/crm/v3/objects/contacts"
+    limiter.observe(url, make_response(headers={
+        "X-HubSpot-RateLimit-Interval-Milliseconds": "10000",
+        "X-HubSpot-RateLimit-Max": "190",
+        "X-HubSpot-RateLimit-Remaining": "3",
+    }))
+
+    bucket = limiter.buckets["crm"]
+    assert bucket.rate == 19
+    assert bucket.capacity == 190
+    assert bucket.tokens <= 3
+
+    limiter.observe(url, make_response(status_code=429))
+    assert bucket.tokens <= 0
+    assert limiter.buckets["search"].rate == 4
+
+
+def test_association_requests_count_against_the_crm_quota():
+    limiter = RateLimiter({"crm": 2, "associations": 5})
+    url = "https://api.hubapi.com/crm/v4/associations/deals/contacts/batch/create"
+    limiter.acquire(url)
+    limiter.acquire("https://api.hubapi.com/crm/v3/objects/contacts")
+
+    assert limiter.buckets["crm"].tokens < 1
+    assert limiter.buckets["associations"].tokens >= 3
+
+    limiter.observe(url, make_response(headers={
+        "X-HubSpot-RateLimit-Interval-Milliseconds": "10000",
+        "X-HubSpot-RateLimit-Max": "190",
+    }))
+    assert limiter.buckets["crm"].rate == 19
+    assert limiter.buckets["associations"].rate == 5
+
+    limiter.observe(url, make_response(status_code=429))
+    assert limiter.buckets["associations"].tokens <= 0
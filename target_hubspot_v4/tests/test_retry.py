@@ -0,0 +1,52 @@
+"""Tests for the shared retry policy."""
+
+import pytest
+import requests
+
+from target_hubspot_v4 import retry
+from target_hubspot_v4.retry import RetryPolicy
+
+
+def make_error(status_code, headers=None, url="https://api.hubapi.com/crm/v3/objects/contacts/123"):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response.request = requests.Request("PATCH", url).prepare()
+    return requests.exceptions.HTTPError(f"{status_code}", response=response)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(retry.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_retry_after_is_honored_and_counted_per_endpoint(sleeps):
+    policy = RetryPolicy(max_tries=3)
+    errors = [make_error(429, {"Retry-After": "7"}), make_error(503)]
+
+    @policy.retry()
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert call() == "ok"
+    assert sleeps[0] == 7
+    assert 0 <= sleeps[1] <= 4
+    assert policy.stats["PATCH /crm/v3/objects/{object}/{id}"]["retries"] == 2
+
+
+def test_gives_up_after_max_tries(sleeps):
+    policy = RetryPolicy(max_tries=2)
+    given_up = []
+
+    @policy.retry(on_giveup=given_up.append)
+    def call():
+        raise make_error(429, {"X-HubSpot-RateLimit-Secondly-Remaining": "0"})
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        call()
+    assert sleeps == [1.0]
+    assert given_up[0]["tries"] == 2
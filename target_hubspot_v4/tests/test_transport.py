@@ -0,0 +1,41 @@
+"""Tests for the shared HTTP transport."""
+
+import threading
+
+import requests
+
+from target_hubspot_v4 import transport
+from target_hubspot_v4.transport import Transport
+
+
+def make_response(content):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = content
+    return response
+
+
+def test_slow_gets_are_hedged_and_first_response_wins(monkeypatch):
+    release = threading.Event()
+    sent = []
+
+    def send(request, timeout, verify):
+        sent.append(request.method)
+        if len(sent) == 1:
+            # the first copy hangs until the test ends
+            release.wait(5)
+            return make_response(b"slow")
+        return make_response(b"fast")
+
+    monkeypatch.setattr(transport.RATE_LIMITER, "acquire", lambda url: 0)
+    client = Transport()
+    client.configure({"hedge_after_ms": 10})
+    monkeypatch.setattr(client.session, "send", send)
+
+    try:
+        assert client.request("GET", "https://api.hubapi.com/crm/v3/objects/contacts/1").content == b"fast"
+        assert client.request("POST", "https://api.hubapi.com/crm/v3/objects/contacts", json={}).content == b"fast"
+    finally:
+        release.set()
+    assert sent == ["GET", "GET", "POST"]
+    assert (client.hedged, client.hedges_won) == (1, 1)
@@ -0,0 +1,45 @@
+"""Tests for the request-independent helpers in utils."""
+
+from target_hubspot_v4 import utils
+from target_hubspot_v4.tests.conftest import FakeResponse
+from target_hubspot_v4.utils import chunk_unique, group_by_shared_keys, search_objects_by_property_values
+
+
+def test_chunk_unique_respects_size():
+    chunks = chunk_unique(list(range(250)), 100)
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+
+
+def test_chunk_unique_splits_duplicate_keys_in_order():
+    items = [{"id": "1", "n": 1}, {"id": "2", "n": 2}, {"id": "1", "n": 3}]
+    chunks = chunk_unique(items, 100, key=lambda item: item["id"])
+    assert [[item["n"] for item in chunk] for chunk in chunks] == [[1, 2], [3]]
+
+
+def test_group_by_shared_keys_links_items_transitively():
+    items = [
+        {"n": 1, "keys": ["a"]},
+        {"n": 2, "keys": ["b"]},
+        {"n": 3, "keys": ["c", "a"]},
+        {"n": 4, "keys": ["b", "c"]},
+        {"n": 5, "keys": []},
+    ]
+    groups = group_by_shared_keys(items, lambda item: item["keys"])
+    assert [[item["n"] for item in group] for group in groups] == [[1, 2, 3, 4], [5]]
+
+
+def test_in_filters_are_sent_in_lowercase(monkeypatch):
+    payloads = []
+
+    def request_push(config, url, payload, params=None, method="POST"):
+        payloads.append(payload)
+        return FakeResponse({"total": 0, "results": []})
+
+    monkeypatch.setattr(utils, "request_push", request_push)
+    monkeypatch.setattr(utils, "get_params_and_headers", lambda config, params: ({}, {}))
+
+    search_objects_by_property_values({}, "contacts", {"email": ["Ann@X.com", " ann@x.com", "b@x.com"]})
+
+    assert payloads[0]["filterGroups"][0]["filters"] == [
+        {"propertyName": "email", "operator": "IN", "values": ["ann@x.com", "b@x.com"]}
+    ]
@@ -0,0 +1,129 @@
+"""Shared HTTP transport: one pooled keep-alive session with timeouts and hedged lookups."""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from target_hubspot_v4.metrics import METRICS
+from target_hubspot_v4.rate_limit import RATE_LIMITER
+
+logger = logging.getLogger("target-hubspot-v4")
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 120
+
+
+class Transport:
+    """
+    Sends every request of the process through a single session, so connections are
+    kept alive and reused across sinks and workers, with connect and read timeouts.
+    GET requests still running after `hedge_after` seconds are sent a second time and
+    the first response wins, which cuts the tail latency of lookups.
+    """
+
+    def __init__(self) -> None:
+        self.pool_size = DEFAULT_POOL_SIZE
+        self.timeout = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+        self.hedge_after = None
+        self.hedged = 0
+        self.hedges_won = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._adapters = {}
+        self.session = self._build_session()
+
+    def configure(self, config):
+        """Size the pool for the configured concurrency and read the timeouts and hedging delay."""
+        concurrency = max(1, int(config.get("upsert_concurrency", 1)))
+        self.pool_size = max(1, int(config.get("http_pool_size", max(DEFAULT_POOL_SIZE, concurrency))))
+        self.timeout = (
+            float(config.get("http_connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+            float(config.get("http_read_timeout", DEFAULT_READ_TIMEOUT)),
+        )
+        hedge_after_ms = config.get("hedge_after_ms")
+        self.hedge_after = float(hedge_after_ms) / 1000 if hedge_after_ms else None
+        with self._lock:
+            self.session.close()
+            self.session = self._build_session()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        for prefix, mounted_adapter in self._adapters.items():
+            session.mount(prefix, mounted_adapter)
+        return session
+
+    def mount(self, prefix, adapter) -> None:
+        """Send the requests to URLs starting with `prefix` through `adapter`, e.g. a stand-in of the API."""
+        with self._lock:
+            self._adapters[prefix] = adapter
+            self.session.mount(prefix, adapter)
+
+    def send(self, request, verify=True):
+        """Send a prepared request, hedging GETs slower than `hedge_after`."""
+        started_at = time.monotonic()
+        response = None
+        try:
+            if request.method == "GET" and self.hedge_after:
+                response = self._send_hedged(request, verify)
+            else:
+                response = self.session.send(request, timeout=self.timeout, verify=verify)
+            return response
+        finally:
+            METRICS.observe(request, response, time.monotonic() - started_at)
+
+    def request(self, method, url, verify=True, **kwargs):
+        """Build and send a request, taking the same arguments as `requests.Request`."""
+        return self.send(requests.Request(method, url, **kwargs).prepare(), verify=verify)
+
+    def _send_hedged(self, request, verify):
+        executor = self._get_executor()
+        primary = executor.submit(self.session.send, request, timeout=self.timeout, verify=verify)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        # the hedge counts against the rate limit like any other request
+        RATE_LIMITER.acquire(request.url)
+        hedge = executor.submit(self.session.send, request.copy(), timeout=self.timeout, verify=verify)
+        with self._lock:
+            self.hedged += 1
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is hedge:
+                    with self._lock:
+                        self.hedges_won += 1
+                return response
+        raise error
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # a primary and a hedge per pooled connection
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size * 2)
+            return self._executor
+
+    def log_stats(self) -> None:
+        if self.hedged:
+            logger.info(f"Hedged requests: {self.hedged} sent, {self.hedges_won} answered first")
+
+
+TRANSPORT = Transport()
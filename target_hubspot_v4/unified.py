@@ -1,16 +1,29 @@
 """HubspotV2 target sink class, which handles writing streams."""
 
 from datetime import datetime
+from functools import partial
 import re
 import json
 
 from hotglue_singer_sdk.target_sdk.client import HotglueSink
 
-from target_hubspot_v4.utils import request_push, request, search_company_by_name, search_contact_by_email, map_country, search_call_by_id, search_deal_by_name, search_task_by_id
+from target_hubspot_v4.associations import ASSOCIATED_IDS, ASSOCIATION_TYPES
+from target_hubspot_v4.buffer import BufferedSinkMixin
+from target_hubspot_v4.cache import LOOKUP_CACHE, normalize_lookup_value
+from target_hubspot_v4.dag import Workflow, WorkflowRunner
+from target_hubspot_v4.hashes import WRITE_HASHES
+from target_hubspot_v4.id_map import ID_MAP
+from target_hubspot_v4.index import get_object_index
+from target_hubspot_v4.profiling import PROFILER
+from target_hubspot_v4.properties import PROPERTIES
+from target_hubspot_v4.utils import MAX_BATCH_INPUTS, chunk_unique, group_by_shared_keys, read_objects_by_ids, read_objects_by_unique_property, request_push, search_objects_by_property_values, request, search_company_by_name, search_contact_by_email, map_country, search_call_by_id, search_deal_by_name, search_task_by_id
 from hotglue_singer_sdk.plugin_base import PluginBase
 from typing import Dict, List, Optional
 
-class UnifiedSink(HotglueSink):
+# record ids an add-and-remove list memberships call accepts
+MAX_LIST_MEMBERSHIP_CHANGES = 100000
+
+class UnifiedSink(BufferedSinkMixin, HotglueSink):
     """UnifiedSink target sink class."""
 
     def __init__(
@@ -23,47 +36,376 @@ class UnifiedSink(HotglueSink):
         self._state = dict(target._state)
         self._target = target
         super().__init__(target, stream_name, schema, key_properties)
+        self.workflows = WorkflowRunner(self.upsert_concurrency)
+        # list ids by name, and membership changes by list id, written once per buffer of contacts
+        self._list_ids = {}
+        self._list_memberships = {}
+        # calls and tasks updated by the buffered records, by object and id, see read_existing_activities
+        self._existing_activities = {}
+        # build the indexes this stream resolves ids from before the first record
+        for object_name in self.indexed_objects.get(self.stream_name.lower(), []):
+            self.object_index(object_name)
 
-    max_size = 10  # Max records to write in one batch
-    contacts = []
     base_url = "https://api.hubapi.com/crm/v3/objects"
+    # property each object is looked up by
+    lookup_properties = {"contacts": "email", "companies": "name", "deals": "dealname"}
+    # objects each stream looks up, by stream name
+    indexed_objects = {
+        "contacts": ["contacts"],
+        "contact": ["contacts"],
+        "customer": ["contacts"],
+        "customers": ["contacts"],
+        "deals": ["contacts"],
+        "deal": ["contacts"],
+        "opportunities": ["contacts"],
+        "notes": ["companies", "deals"],
+        "note": ["companies", "deals"],
+    }
+
+    contact_streams = ["contacts", "contact", "customer", "customers"]
+    activity_streams = ["activities", "activity"]
+    note_streams = ["notes", "note"]
+    # streams written as request graphs, which overlap between buffered records
+    workflow_streams = ["activities", "activity", "companies", "company", "deals", "deal", "opportunities", "notes", "note"]
 
     @property
     def name(self):
         return self.stream_name
+
+    @property
+    def upsert_concurrency(self):
+        return max(1, int(self.config.get("upsert_concurrency", 1)))
+
+    @property
+    def batch_upsert(self):
+        """Whether contacts, activities or notes are buffered and written through the batch endpoints."""
+        if self.stream_name.lower() not in self.contact_streams + self.activity_streams + self.note_streams:
+            return False
+        batch_upsert = self.config.get("batch_upsert", False)
+        if isinstance(batch_upsert, list):
+            return self.stream_name.lower() in [stream.lower() for stream in batch_upsert]
+        return bool(batch_upsert)
+
+    @property
+    def only_upsert_empty_fields(self):
+        return bool(self.config.get("only_upsert_empty_fields", False))
+
+    @property
+    def buffer_records(self):
+        if self.batch_upsert:
+            return True
+        if self.stream_name.lower() in self.contact_streams:
+            # list memberships are written once per list and buffer, not once per contact
+            return True
+        if self.only_upsert_empty_fields and self.stream_name.lower() in self.contact_streams + self.activity_streams:
+            # the existing objects whose values are kept are read a buffer at a time
+            return True
+        return self.upsert_concurrency > 1 and self.stream_name.lower() in self.workflow_streams
+
+    @property
+    def max_size(self):
+        # Max records to write in one batch
+        if self.buffer_records:
+            return max(1, min(int(self.config.get("batch_size", MAX_BATCH_INPUTS)), MAX_BATCH_INPUTS))
+        return 10
     
+    @PROFILER.timed("preprocess")
     def preprocess_record(self, record: dict, context: dict) -> dict:
         return record
 
-    def upsert_record(self, record: dict, context: dict):
+    def object_index(self, object_name):
+        """Warmed up index of `object_name` by its lookup property, None unless enabled in config."""
+        property_name = self.lookup_properties.get(object_name)
+        return get_object_index(self.config, object_name, [property_name] if property_name else [])
+
+    def record_write(self, object_name, id, properties):
+        """Keep the lookup cache, index and write hashes in line with an object this run wrote."""
+        LOOKUP_CACHE.invalidate(object_name, id, properties)
+        index = self.object_index(object_name)
+        if index is not None:
+            index.record_write(id, properties)
+        WRITE_HASHES.record(object_name, id, properties)
+        if object_name == "contacts" and properties:
+            # contacts are the only object with a unique lookup property
+            ID_MAP.set("contacts", {"email": properties.get("email")}, id)
+
+    def unchanged_write(self, object_name, id, properties):
+        """Whether `properties` were already written to object `id` as they are, so its update can be skipped."""
+        if id and WRITE_HASHES.unchanged(object_name, properties, id=id):
+            self.logger.info(f"Skipping update of unchanged {object_name} with id '{id}'")
+            return True
+        return False
+
+    @PROFILER.timed("lookup")
+    def find_by_lookup_property(self, object_name, value, search):
+        """Return the objects whose lookup property equals `value`, from the index when warmed up."""
+        index = self.object_index(object_name)
+        if index is not None:
+            return index.get({self.lookup_properties[object_name]: value})
+        return search(dict(self.config), value)
+
+    @PROFILER.timed("lookup")
+    def find_by_lookup_property_values(self, object_name, values):
+        """
+        Objects matching each of `values` on the lookup property, by normalized value. Distinct
+        values missing from the lookup cache are searched 100 at a time with an IN filter.
+        """
+        property_name = self.lookup_properties[object_name]
+        values = {normalize_lookup_value(value): value for value in values if value}
+        index = self.object_index(object_name)
+        if index is not None:
+            return {key: index.get({property_name: value}) for key, value in values.items()}
+
+        matches = {}
+        uncached = []
+        for key, value in values.items():
+            cached, objects = LOOKUP_CACHE.get(object_name, {property_name: value})
+            if cached:
+                matches[key] = objects
+            else:
+                uncached.append(key)
+
+        for keys in chunk_unique(uncached, MAX_BATCH_INPUTS):
+            # the normalized values, IN filters only match lowercase strings
+            objects = search_objects_by_property_values(dict(self.config), object_name, {property_name: list(keys)})
+            found = {}
+            for obj in objects:
+                found.setdefault(normalize_lookup_value((obj.get("properties") or {}).get(property_name)), []).append(obj)
+            for key in keys:
+                matches[key] = found.get(key, [])
+                LOOKUP_CACHE.set(object_name, {property_name: values[key]}, matches[key])
+        return matches
+
+    @PROFILER.timed("write")
+    def write_record(self, record: dict, context: dict):
         id = None
         success = False
         state_updates = dict()
-        if self.stream_name.lower() in ["contacts", "contact", "customer", "customers"]:
+        if self.stream_name.lower() in self.contact_streams:
             success, id, state_updates = self.process_contacts(record)
-        if self.stream_name.lower() in ["activities", "activity"]:
-            success, id, state_updates = self.process_activities(record)
+        workflow = self.record_workflow(record)
+        if workflow is not None:
+            success, id, state_updates = self.workflows.run(workflow)["result"]
+        return id, success, state_updates
+
+    def record_workflow(self, record):
+        """Graph of the requests writing the record, its "result" step returns (success, id, state_updates)."""
+        if self.stream_name.lower() in self.activity_streams:
+            return self.activity_workflow(record)
         if self.stream_name.lower() in ["companies", "company"]:
-            success, id, state_updates = self.upload_company(record)
+            return self.company_workflow(record)
         if self.stream_name.lower() in ["deals", "deal", "opportunities"]:
-            success, id, state_updates = self.upload_deal(record)
-        if self.stream_name.lower() in ["notes", "note"]:
-            success, id, state_updates = self.process_notes(record)
-        return id, success, state_updates
+            return self.deal_workflow(record)
+        if self.stream_name.lower() in self.note_streams:
+            return self.note_workflow(record)
+        return None
+
+    @PROFILER.timed("write")
+    def flush_buffer(self, context: dict) -> None:
+        pending, self._pending_records = self._pending_records, []
+        if not pending:
+            return
+
+        if self.stream_name.lower() in self.activity_streams:
+            self.read_existing_activities(pending)
+
+        if self.batch_upsert and self.stream_name.lower() in self.contact_streams:
+            self.upsert_contacts_batch(pending)
+        elif self.stream_name.lower() in self.contact_streams:
+            self.upsert_contacts(pending)
+        elif self.batch_upsert and self.stream_name.lower() in self.activity_streams:
+            self.upsert_activities_batch(pending)
+        elif self.batch_upsert:
+            self.upsert_notes_batch(pending)
+        else:
+            self.run_workflows(pending)
+        self._existing_activities = {}
+
+        if self.stream_name.lower() in self.contact_streams:
+            self.write_list_memberships(pending)
+
+        for entry in pending:
+            self.update_batch_entry_state(entry)
+
+    def run_workflows(self, entries):
+        """Write buffered records as concurrent workflows, setting the outcome on each entry."""
+        # records writing the same object run one after another, the rest overlap
+        chains = group_by_shared_keys(
+            entries, lambda entry: [str(entry["record"]["id"])] if entry["record"].get("id") else []
+        )
+        outcomes = self.workflows.run_all(
+            [[partial(self.record_workflow, entry["record"]) for entry in chain] for chain in chains]
+        )
+        for chain, chain_outcomes in zip(chains, outcomes):
+            for entry, outcome in zip(chain, chain_outcomes):
+                if isinstance(outcome, Exception):
+                    entry["error"] = outcome
+                else:
+                    entry["success"], entry["id"], entry["state_updates"] = outcome["result"]
+
+    def upsert_activities_batch(self, pending):
+        """
+        Create buffered calls through batch/create with their contact and the contact's deals
+        associated inline, the deals of every contact of the batch being read at once.
+        Other activities, and calls merged with an existing one, are written as workflows.
+        """
+        config = dict(self.config)
+        only_upsert_empty_fields = self.config.get("only_upsert_empty_fields", False)
+        calls = []
+        others = []
+        for entry in pending:
+            record = entry["record"]
+            if record.get("type") == "call" and not (record.get("id") and only_upsert_empty_fields):
+                calls.append(entry)
+            else:
+                others.append(entry)
+        if others:
+            self.run_workflows(others)
+        if not calls:
+            return
+
+        for entry in calls:
+            try:
+                entry["call"] = self.build_call(entry["record"])
+            except Exception as e:
+                entry["error"] = e
+        calls = [entry for entry in calls if entry["error"] is None]
+
+        try:
+            deals_by_contact = ASSOCIATED_IDS.get_many(
+                config, "contacts", "deals", [entry["record"].get("contact_id") for entry in calls]
+            )
+            contact_type = ASSOCIATION_TYPES.resolve(config, "calls", "contacts")
+            deal_type = ASSOCIATION_TYPES.resolve(config, "calls", "deals")
+        except Exception as e:
+            for entry in calls:
+                entry["error"] = e
+            return
+
+        for chunk in chunk_unique(calls, MAX_BATCH_INPUTS):
+            inputs = []
+            for index, entry in enumerate(chunk):
+                contact_id = entry["record"].get("contact_id")
+                associations = []
+                if contact_id:
+                    associations.append({"to": {"id": str(contact_id)}, "types": [contact_type]})
+                    associations.extend(
+                        {"to": {"id": deal_id}, "types": [deal_type]}
+                        for deal_id in deals_by_contact.get(str(contact_id), [])
+                    )
+                inputs.append({**entry["call"], "associations": associations, "objectWriteTraceId": str(index)})
 
-    def process_activities(self, record):
-        res = None
+            try:
+                response = request_push(config, f"{self.base_url}/calls/batch/create", {"inputs": inputs})
+            except Exception as e:
+                # a single invalid input fails the whole call, write one by one to report per record
+                self.logger.warning(f"Batch create of {len(chunk)} calls failed, writing one by one: {e}")
+                self.run_workflows(chunk)
+                continue
+
+            self.map_batch_create_results(chunk, inputs, response.json(), "calls")
+
+    def map_batch_create_results(self, chunk, inputs, response_json, object_name):
+        """Set the id, or the error, of each buffered record from a batch create response, recording the writes."""
+        results = response_json.get("results", [])
+        errors = response_json.get("errors", [])
+        by_trace_id = {batch_input["objectWriteTraceId"]: entry for batch_input, entry in zip(inputs, chunk)}
+        for result in results:
+            entry = by_trace_id.get(result.get("objectWriteTraceId"))
+            if entry is not None:
+                entry["id"] = result.get("id")
+        for error in errors:
+            for key in (error.get("context") or {}).get("objectWriteTraceId") or []:
+                if key in by_trace_id:
+                    by_trace_id[key]["error"] = Exception(error.get("message") or str(error))
+        if not errors and len(results) == len(chunk) and any(entry["id"] is None for entry in chunk):
+            # HubSpot keeps the input order when every input succeeded
+            for result, entry in zip(results, chunk):
+                entry["id"] = result.get("id")
+
+        for entry, batch_input in zip(chunk, inputs):
+            if entry["error"] is not None:
+                continue
+            if entry["id"] is None:
+                entry["error"] = Exception(f"No result returned in batch create of {object_name}")
+            else:
+                entry["success"] = True
+                self.record_write(object_name, entry["id"], batch_input["properties"])
+
+    @PROFILER.timed("lookup")
+    def read_existing_activities(self, entries):
+        """
+        With only_upsert_empty_fields, read the calls and tasks the buffered records update
+        through batch/read, 100 per call and with only the properties written, so each
+        workflow merges its values locally instead of reading its activity on its own.
+        """
+        if not self.only_upsert_empty_fields:
+            return
+        builders = {"call": ("calls", self.build_call), "task": ("tasks", self.build_task)}
+        ids, properties = {}, {}
+        for entry in entries:
+            record = entry["record"]
+            if not record.get("id") or record.get("type") not in builders:
+                continue
+            object_name, build = builders[record["type"]]
+            try:
+                written = build(record)["properties"]
+            except Exception:
+                # the workflow reports the record's error
+                continue
+            ids.setdefault(object_name, set()).add(str(record["id"]))
+            properties.setdefault(object_name, set()).update(written)
+
+        for object_name, object_ids in ids.items():
+            for chunk in chunk_unique(sorted(object_ids), MAX_BATCH_INPUTS):
+                try:
+                    objects = read_objects_by_ids(dict(self.config), object_name, chunk, sorted(properties[object_name]))
+                except Exception as e:
+                    # read again one by one by the workflows
+                    self.logger.warning(f"Batch read of {len(chunk)} {object_name} failed: {e}")
+                    continue
+                found = {str(obj["id"]): obj for obj in objects}
+                for id in chunk:
+                    self._existing_activities[(object_name, id)] = found.get(id)
+
+    async def existing_activity(self, object_name, id, properties, search):
+        """The activity read by read_existing_activities, or read now when it was not."""
+        if (object_name, str(id)) in self._existing_activities:
+            return self._existing_activities[(object_name, str(id))]
+        return await self.workflows.call(search, dict(self.config), id, properties=properties)
+
+    def keep_existing_values(self, properties, existing):
+        """Keep the values the existing object already has, for only_upsert_empty_fields."""
+        if existing:
+            for key in properties.keys():
+                if existing["properties"].get(key, None) is not None:
+                    properties[key] = existing["properties"][key]
+
+    def activity_workflow(self, record):
         if record.get("type") == "call":
-            res = self.process_call(record)
-        if record.get("type") == "task":
-            res = self.upload_task(record)
-        if res:
-            return True, res.get("id"), {}
-        return False, None, {"error": f"Failed to process activity because type is not supported or was not found, type: {record.get('type')}"}
+            workflow = self.call_workflow(record)
+        elif record.get("type") == "task":
+            workflow = self.task_workflow(record)
+        else:
+            workflow = Workflow()
 
-    def process_call(self, record):
-        url = f"{self.base_url}/calls"
-        call = {
+            async def no_activity(results):
+                return None
+
+            workflow.add("activity", no_activity)
+
+        async def result(results):
+            res = results["activity"]
+            if res:
+                return True, res.get("id"), {}
+            return False, None, {"error": f"Failed to process activity because type is not supported or was not found, type: {record.get('type')}"}
+
+        workflow.add("result", result, after=["activity"])
+        return workflow
+
+    @PROFILER.timed("preprocess")
+    def build_call(self, record):
+        return {
             "properties": {
                 "hs_timestamp": record.get("activity_datetime"),
                 "hs_call_title": record.get("title"),
@@ -78,42 +420,59 @@ class UnifiedSink(HotglueSink):
             }
         }
 
-        if record.get("id"):
-           
-            if self.config.get("only_upsert_empty_fields", False):
-                matched_call = search_call_by_id(dict(self.config), record.get("id"), properties=list(call["properties"].keys()))
-                if matched_call:
-                    for key in call["properties"].keys():
-                        if matched_call["properties"].get(key, None) is not None:
-                            call["properties"][key] = matched_call["properties"][key]
+    def call_workflow(self, record):
+        workflow = Workflow()
+        config = dict(self.config)
+        call = self.build_call(record)
 
-        resp = request_push(dict(self.config), url, call)
-        data = resp.json()
+        existing_call = []
+        if record.get("id") and self.config.get("only_upsert_empty_fields", False):
 
-        # Defining the association call -> contact
+            async def keep_existing_fields(results):
+                matched_call = await self.existing_activity(
+                    "calls", record.get("id"), list(call["properties"].keys()), search_call_by_id
+                )
+                self.keep_existing_values(call["properties"], matched_call)
 
-        callId = data.get("id")
-        contactId = record.get("contact_id")
+            existing_call.append(workflow.add("existing_call", keep_existing_fields))
 
-        url = f"{self.base_url}/calls/{callId}/associations/contact/{contactId}/call_to_contact"
+        async def create_call(results):
+            resp = await self.workflows.call(request_push, config, f"{self.base_url}/calls", call)
+            return resp.json()
 
-        request_push(dict(self.config), url, {}, method="PUT")
+        contactId = record.get("contact_id")
 
-        url = f"https://api.hubapi.com/crm/v4/objects/contacts/{contactId}/associations/deals"
+        # Defining the association call -> contact
+        async def associate_contact(results):
+            callId = results["activity"].get("id")
+            url = f"{self.base_url}/calls/{callId}/associations/contact/{contactId}/call_to_contact"
+            await self.workflows.call(request_push, config, url, {}, method="PUT")
 
-        response = request(dict(self.config), url)
+        # the contact's deals are fetched while the call is created
+        async def find_contact_deals(results):
+            deals = await self.workflows.call(ASSOCIATED_IDS.get_many, config, "contacts", "deals", [contactId])
+            return deals.get(str(contactId), [])
 
-        response = response.json()
         # Defining the association call -> deal
-        if response.get("results"):
-            for deal in response.get("results"):
-                dealId = deal.get("toObjectId")
-                url = f"{self.base_url}/calls/{callId}/associations/deal/{dealId}/call_to_deal"
-                request_push(dict(self.config), url, {}, method="PUT")
-        return data
+        async def associate_deals(results):
+            callId = results["activity"].get("id")
+            await self.workflows.gather(*(
+                self.workflows.call(
+                    request_push, config, f"{self.base_url}/calls/{callId}/associations/deal/{dealId}/call_to_deal", {}, method="PUT"
+                )
+                for dealId in results["contact_deals"]
+            ))
 
+        workflow.add("activity", create_call, after=existing_call)
+        workflow.add("contact_association", associate_contact, after=["activity"])
+        workflow.add("contact_deals", find_contact_deals)
+        workflow.add("deal_associations", associate_deals, after=["activity", "contact_deals"])
+        return workflow
 
-    def process_contacts(self, record):
+
+    @PROFILER.timed("preprocess")
+    def build_contact_row(self, record):
+        """Map a unified contact record to the contact properties written to HubSpot."""
         phone_numbers = record.get("phone_numbers")
         phone = None
         if phone_numbers:
@@ -182,21 +541,61 @@ class UnifiedSink(HotglueSink):
 
         if record.get("id"):
             row.update({"id": record.get("id")})
+        return row
 
-        contact_search = search_contact_by_email(dict(self.config), row["properties"].get("email"), properties=list(row["properties"].keys()))
+    def known_contact_id(self, row):
+        """Id of the contact with the row's email from the state, unless the contact's values are needed."""
+        if self.config.get("only_upsert_empty_fields", False) or row.get("id"):
+            return None
+        return ID_MAP.get("contacts", {"email": row["properties"].get("email")})
 
-        if "id" not in row and row["properties"].get("email"):    
+    def process_contacts(self, record):
+        row = self.build_contact_row(record)
+
+        known_id = self.known_contact_id(row)
+        contacts_index = self.object_index("contacts")
+        if known_id:
+            contact_search = {"id": known_id}
+        elif contacts_index is not None and not self.config.get("only_upsert_empty_fields", False):
+            matches = contacts_index.get({"email": row["properties"].get("email")})
+            contact_search = matches[0] if len(matches) == 1 else None
+        else:
+            contact_search = search_contact_by_email(dict(self.config), row["properties"].get("email"), properties=list(row["properties"].keys()))
+        return self.write_contact(record, row, contact_search, known_id)
+
+    def write_contact(self, record, row, contact_search, known_id=None):
+        """Write a contact row to the existing contact matching it, if any, and queue its list memberships."""
+        self.apply_existing_contact(row, contact_search)
+        if self.unchanged_write("contacts", row.get("id"), row["properties"]):
+            res = {"id": row["id"]}
+        else:
+            # self.contacts.append(row)ƒ
+            # for now process one contact at a time because if on contact is duplicate whole batch will fail
+            self.logger.info(f"Uploading contact = {row}")
+            try:
+                res = self.upload_contact(row)
+            except Exception:
+                if not known_id:
+                    raise
+                # the contact was deleted since its id was stored, search it again
+                self.logger.warning(f"Update of contact with id '{known_id}' from the state failed, searching it again")
+                ID_MAP.discard("contacts", {"email": row["properties"].get("email")})
+                return self.process_contacts(record)
+        self.sync_contact_lists(record, res.get("id"))
+        return True, res.get("id"), {}
+
+    def apply_existing_contact(self, row, contact_search):
+        """Target the existing contact matching the row, keeping its values with only_upsert_empty_fields."""
+        if "id" not in row and row["properties"].get("email"):
             if contact_search:
                 row.update({"id": contact_search.get("id")})
 
-
         if self.config.get("only_upsert_empty_fields", False) and contact_search:
             for key in row["properties"].keys():
                 if contact_search.get("properties", {}).get(key, None) is not None:
                     row["properties"][key] = contact_search.get("properties", {}).get(key)
-        # self.contacts.append(row)ƒ
-        # for now process one contact at a time because if on contact is duplicate whole batch will fail
-        self.logger.info(f"Uploading contact = {row}")
+
+    def upload_contact(self, row):
         try:
             res = self.contact_upload(row)
         except Exception as e:
@@ -215,37 +614,239 @@ class UnifiedSink(HotglueSink):
             except Exception as e:
                 raise e
 
-        res = res.json()
-        
+        return res.json()
+
+    def sync_contact_lists(self, record, contact_id):
         if record.get("lists"):
             should_subscribe = False if record.get("subscribe_status") == "unsubscribed" else True
             if should_subscribe:
-                self.subscribe_to_lists(res.get("id"), record.get("lists"))
+                self.subscribe_to_lists(contact_id, record.get("lists"))
             else:
-                self.unsubscribe_from_lists(res.get("id"), record.get("lists"))
-        
-        return True, res.get("id"), {}
+                self.unsubscribe_from_lists(contact_id, record.get("lists"))
+
+    def upsert_contacts(self, pending):
+        """
+        Write buffered contacts one by one, the existing contacts being read by email through
+        batch/read first, with the values only_upsert_empty_fields keeps.
+        """
+        for entry in pending:
+            try:
+                entry["row"] = self.build_contact_row(entry["record"])
+            except Exception as e:
+                entry["error"] = e
+
+        self.find_existing_contacts([entry for entry in pending if entry["error"] is None])
+
+        for entry in pending:
+            if entry["error"] is not None:
+                continue
+            try:
+                entry["success"], entry["id"], entry["state_updates"] = self.write_contact(
+                    entry["record"], entry["row"], entry.get("existing"), entry.get("known_id")
+                )
+            except Exception as e:
+                entry["error"] = e
+
+    def upsert_contacts_batch(self, pending):
+        """
+        Write buffered contacts: read the existing ones by email through batch/read, apply
+        only_upsert_empty_fields locally, then write them through the batch endpoints.
+        """
+        for entry in pending:
+            try:
+                entry["row"] = self.build_contact_row(entry["record"])
+            except Exception as e:
+                entry["error"] = e
+
+        self.find_existing_contacts([entry for entry in pending if entry["error"] is None])
+
+        actions = {"update": [], "upsert": [], "create": []}
+        for entry in pending:
+            if entry["error"] is not None:
+                continue
+            row = entry["row"]
+            self.apply_existing_contact(row, entry.get("existing"))
+            if self.unchanged_write("contacts", row.get("id"), row["properties"]):
+                entry["id"] = row["id"]
+            elif row.get("id"):
+                actions["update"].append(entry)
+            elif row["properties"].get("email"):
+                actions["upsert"].append(entry)
+            else:
+                actions["create"].append(entry)
+
+        for action, entries in actions.items():
+            for chunk in chunk_unique(entries, MAX_BATCH_INPUTS, key=lambda entry: self.contact_batch_key(entry, action)):
+                self.write_contacts_batch(action, chunk)
+
+        for entry in pending:
+            if entry["error"] is not None and entry.get("known_id"):
+                # the id from the state is stale, the contact is searched and written on its own
+                ID_MAP.discard("contacts", {"email": entry["row"]["properties"].get("email")})
+                entry["error"] = None
+                try:
+                    _, entry["id"], _ = self.process_contacts(entry["record"])
+                except Exception as e:
+                    entry["error"] = e
+
+        for entry in pending:
+            if entry["error"] is not None:
+                continue
+            entry["success"] = True
+            try:
+                self.sync_contact_lists(entry["record"], entry["id"])
+            except Exception as e:
+                entry["error"] = e
+
+    @PROFILER.timed("lookup")
+    def find_existing_contacts(self, entries):
+        """Set the contact each entry's email matches as entry["existing"], reading 100 emails per call."""
+        if ID_MAP.enabled:
+            unresolved = []
+            for entry in entries:
+                entry["known_id"] = self.known_contact_id(entry["row"])
+                if entry["known_id"]:
+                    entry["existing"] = {"id": entry["known_id"]}
+                else:
+                    unresolved.append(entry)
+            entries = unresolved
+
+        contacts_index = self.object_index("contacts")
+        if contacts_index is not None and not self.config.get("only_upsert_empty_fields", False):
+            for entry in entries:
+                matches = contacts_index.get({"email": entry["row"]["properties"].get("email")})
+                entry["existing"] = matches[0] if len(matches) == 1 else None
+            return
+
+        emails = {}
+        properties = set()
+        for entry in entries:
+            email = entry["row"]["properties"].get("email")
+            if email:
+                emails.setdefault(normalize_lookup_value(email), email)
+                properties.update(entry["row"]["properties"].keys())
+
+        found = {}
+        failed = {}
+        for keys in chunk_unique(list(emails), MAX_BATCH_INPUTS):
+            try:
+                contacts = read_objects_by_unique_property(
+                    dict(self.config), "contacts", "email", [emails[key] for key in keys], properties=sorted(properties)
+                )
+            except Exception as e:
+                failed.update({key: e for key in keys})
+                continue
+            for contact in contacts:
+                found[normalize_lookup_value((contact.get("properties") or {}).get("email"))] = contact
+
+        for entry in entries:
+            key = normalize_lookup_value(entry["row"]["properties"].get("email"))
+            if key in failed:
+                entry["error"] = failed[key]
+            else:
+                entry["existing"] = found.get(key)
+
+    def contact_batch_key(self, entry, action):
+        """Key HubSpot uses to reject duplicated inputs within one batch call."""
+        if action == "update":
+            return str(entry["row"]["id"])
+        if action == "upsert":
+            return normalize_lookup_value(entry["row"]["properties"]["email"])
+        return None
+
+    def write_contacts_batch(self, action, chunk):
+        inputs = []
+        for index, entry in enumerate(chunk):
+            row = entry["row"]
+            batch_input = {"properties": row["properties"], "objectWriteTraceId": str(index)}
+            if action == "update":
+                batch_input["id"] = row["id"]
+            elif action == "upsert":
+                batch_input["idProperty"] = "email"
+                batch_input["id"] = row["properties"]["email"]
+            inputs.append(batch_input)
+
+        try:
+            response = request_push(dict(self.config), f"{self.base_url}/contacts/batch/{action}", {"inputs": inputs})
+            if response.status_code == 409:
+                raise Exception(response.text)
+        except Exception as e:
+            # a single invalid or conflicting input fails the whole call, write one by one to report per record
+            self.logger.warning(f"Batch {action} of {len(chunk)} contacts failed, uploading one by one: {e}")
+            for entry in chunk:
+                try:
+                    entry["id"] = self.upload_contact(entry["row"]).get("id")
+                except Exception as record_error:
+                    entry["error"] = record_error
+            return
+
+        response_json = response.json()
+        by_trace_id = {batch_input["objectWriteTraceId"]: entry for batch_input, entry in zip(inputs, chunk)}
+        by_input_id = {normalize_lookup_value(batch_input.get("id")): entry for batch_input, entry in zip(inputs, chunk)}
+        for result in response_json.get("results", []):
+            entry = by_trace_id.get(result.get("objectWriteTraceId"))
+            if entry is None and action == "update":
+                entry = by_input_id.get(normalize_lookup_value(result.get("id")))
+            if entry is None and action == "upsert":
+                entry = by_input_id.get(normalize_lookup_value((result.get("properties") or {}).get("email")))
+            if entry is not None:
+                entry["id"] = result.get("id")
+                self.record_write("contacts", result.get("id"), entry["row"]["properties"])
+
+        error_prefix = "Contact already exists. Existing ID: "
+        for error in response_json.get("errors", []):
+            error_context = error.get("context") or {}
+            entries = [by_trace_id[key] for key in error_context.get("objectWriteTraceId") or [] if key in by_trace_id]
+            if not entries:
+                entries = [by_input_id[key] for key in map(normalize_lookup_value, error_context.get("ids") or []) if key in by_input_id]
+            for entry in entries:
+                message = error.get("message") or ""
+                if error.get("category") == "CONFLICT" and error_prefix in message:
+                    # created meanwhile by someone else, update that contact instead
+                    entry["row"]["id"] = message.split(error_prefix, 1)[1].strip()
+                    self.logger.info(f"Reattempting uploading contact = {entry['row']}")
+                    try:
+                        entry["id"] = self.upload_contact(entry["row"]).get("id")
+                    except Exception as record_error:
+                        entry["error"] = record_error
+                else:
+                    entry["error"] = Exception(json.dumps(error))
+
+        for entry in chunk:
+            if entry["id"] is None and entry["error"] is None:
+                entry["error"] = Exception(f"No result returned for contact in batch {action}")
     
     def subscribe_to_lists(self, contact_id, lists):
-        """Subscribe a contact to multiple lists, creating lists if they don't exist."""
+        """Queue a contact to be added to multiple lists, creating lists if they don't exist."""
         for list_name in lists:
-            list_exists, list_id = self.list_exists(list_name)
-            if not list_exists:
-                self.logger.info(f"Creating new list: {list_name}")
-                list_id = self.create_list(list_name)
-            if not self.is_contact_subscribed_to_list(contact_id, list_id):
-                self.logger.info(f"Subscribing contact {contact_id} to list: {list_name} - id: {list_id}")
-                self.subscribe_to_list(contact_id, list_id)
-            self.logger.info(f"Contact {contact_id} subscribed to list: {list_name} - id: {list_id}")
+            list_id = self.get_list_id(list_name, create=True)
+            if list_id is None:
+                raise Exception(f"Could not find or create list: {list_name}")
+            self.logger.info(f"Contact {contact_id} queued to subscribe to list: {list_name} - id: {list_id}")
+            self.queue_list_membership(list_id, contact_id, True)
 
     def unsubscribe_from_lists(self, contact_id, lists):
-        """Unsubscribe a contact from multiple lists if they are subscribed."""
+        """Queue a contact to be removed from the lists that exist."""
         for list_name in lists:
+            list_id = self.get_list_id(list_name)
+            if list_id is not None:
+                self.logger.info(f"Contact {contact_id} queued to unsubscribe from list: {list_name} - id: {list_id}")
+                self.queue_list_membership(list_id, contact_id, False)
+
+    def get_list_id(self, list_name, create=False):
+        """Id of a list by name, looked up once per run. Creates the list if missing and `create` is set."""
+        if list_name not in self._list_ids:
             list_exists, list_id = self.list_exists(list_name)
-            if list_exists and self.is_contact_subscribed_to_list(contact_id, list_id):
-                self.logger.info(f"Unsubscribing contact {contact_id} from list: {list_name} - id: {list_id}")
-                self.unsubscribe_from_list(contact_id, list_id)
-            
+            self._list_ids[list_name] = list_id if list_exists else None
+        if self._list_ids[list_name] is None and create:
+            self.logger.info(f"Creating new list: {list_name}")
+            self._list_ids[list_name] = self.create_list(list_name)
+        return self._list_ids[list_name]
+
+    def queue_list_membership(self, list_id, contact_id, subscribed):
+        # the last change of a contact in a run wins
+        self._list_memberships.setdefault(list_id, {})[contact_id] = subscribed
+
     def list_exists(self, list_name):
         """Check if a list exists in HubSpot."""
         url = f"https://api.hubapi.com/crm/v3/lists/object-type-id/0-1/name/{list_name}"
@@ -273,54 +874,62 @@ class UnifiedSink(HotglueSink):
             self.logger.error(f"Error creating list {list_name}: {str(e)}")
             raise
     
-    def subscribe_to_list(self, contact_id, list_id):
-        """Add a contact to a specific list."""
-        url = f"https://api.hubapi.com/crm/v3/lists/{list_id}/memberships/add-and-remove"
-        payload = {
-            "recordIdsToRemove": [],
-            "recordIdsToAdd": [contact_id],
-            "listId": list_id
-        }
-        try:
-            response = request_push(dict(self.config), url, payload, method="PUT")
-            if response.status_code not in [200, 201]:
-                self.logger.error(f"Failed to subscribe contact {contact_id} to list {list_id}: {response.text}")
-        except Exception as e:
-            self.logger.error(f"Error subscribing contact {contact_id} to list {list_id}: {str(e)}")
-            raise
-    
-    def unsubscribe_from_list(self, contact_id, list_id):
-        """Remove a contact from a specific list."""
+    def write_list_memberships(self, entries):
+        """Write the memberships queued by the buffered contacts, failing the contacts whose changes failed."""
+        failed = self.flush_list_memberships()
+        for entry in entries:
+            if entry["error"] is None and entry["id"] is not None and str(entry["id"]) in failed:
+                entry["error"] = failed[str(entry["id"])]
+
+    def flush_list_memberships(self):
+        """
+        Write the queued membership changes with one add-and-remove call per list and chunk,
+        returning the error of each contact whose changes failed.
+        """
+        memberships, self._list_memberships = self._list_memberships, {}
+        failed = {}
+        for list_id, changes in memberships.items():
+            changes = list(changes.items())
+            for start in range(0, len(changes), MAX_LIST_MEMBERSHIP_CHANGES):
+                chunk = changes[start:start + MAX_LIST_MEMBERSHIP_CHANGES]
+                contact_ids_to_add = [contact_id for contact_id, subscribed in chunk if subscribed]
+                contact_ids_to_remove = [contact_id for contact_id, subscribed in chunk if not subscribed]
+                try:
+                    self.update_list_memberships(list_id, contact_ids_to_add, contact_ids_to_remove)
+                except Exception as e:
+                    # the error of a failed call holds its payload, keep the log and state short
+                    error = Exception(f"Failed to update memberships of list {list_id}: {str(e)[:500]}")
+                    self.logger.error(
+                        f"{error} ({len(contact_ids_to_add)} contacts to add, {len(contact_ids_to_remove)} to remove)"
+                    )
+                    failed.update({str(contact_id): error for contact_id, _ in chunk})
+        return failed
+
+    def update_list_memberships(self, list_id, contact_ids_to_add, contact_ids_to_remove):
+        """Add and remove contacts of a specific list."""
         url = f"https://api.hubapi.com/crm/v3/lists/{list_id}/memberships/add-and-remove"
         payload = {
-            "recordIdsToRemove": [contact_id],
-            "recordIdsToAdd": [],
+            "recordIdsToRemove": contact_ids_to_remove,
+            "recordIdsToAdd": contact_ids_to_add,
             "listId": list_id
         }
-        try:
-            response = request_push(dict(self.config), url, payload, method="PUT")
-            if response.status_code not in [200, 204]:
-                self.logger.error(f"Failed to unsubscribe contact {contact_id} from list {list_id}: {response.text}")
-        except Exception as e:
-            self.logger.error(f"Error unsubscribing contact {contact_id} from list {list_id}: {str(e)}")
-            raise
-    
-    def is_contact_subscribed_to_list(self, contact_id, list_id):
-        """Check if a contact is subscribed to a specific list."""
-        url = f"https://api.hubapi.com/crm/v3/lists/{list_id}/memberships/join-order"
-        try:
-            response = request(dict(self.config), url)
-            response = response.json()
-            members = [member.get("recordId") for member in response.get("results",[])]
-            return contact_id in members
-        except Exception as e:
-            self.logger.error(f"Error checking if contact {contact_id} is subscribed to list {list_id}: {str(e)}")
-            return False
+        response = request_push(dict(self.config), url, payload, method="PUT")
+        if response.status_code not in [200, 201, 204]:
+            raise Exception(f"Unexpected status {response.status_code}: {response.text}")
+        self.logger.info(
+            f"List {list_id}: subscribed {len(contact_ids_to_add)} contacts, unsubscribed {len(contact_ids_to_remove)} contacts"
+        )
 
+    def clean_up(self) -> None:
+        # memberships are written with the buffer of contacts that queue them, nothing is left normally
+        failed = self.flush_list_memberships()
+        if failed:
+            self.logger.error(f"Failed to update list memberships of {len(failed)} contacts")
+        self.workflows.close()
+        super().clean_up()
 
     def process_contacts_custom_fields(self, custom_fields):
-        url = "https://api.hubapi.com/crm/v3/properties/contacts"
-
+        definitions = []
         for field in custom_fields:
             payload = {
                 "groupName": "contactinformation",
@@ -335,20 +944,11 @@ class UnifiedSink(HotglueSink):
             if field.get("type"):  # check if type was passed in and assign
                 payload["type"] = field.get("type")
                 payload["fieldType"] = self.match_field_type_to_type(field.get("type"))
+            definitions.append(payload)
 
-            response = request_push(dict(self.config), url, payload, "POST")
-            if response.status_code == 409:
-                self.logger.info(f"Custom field {field['name'].lower()} already exists")
-            elif response.status_code == 201:
-                self.logger.info(f"Custom field {field['name'].lower()} created")
-            else:
-                self.logger.error(
-                    f"Error creating custom field {field['name'].lower()}"
-                )
-                custom_fields.remove(field)
-                self.logger.error(response.json())
-
-        return custom_fields
+        # only the missing properties are created, together in one call
+        existing = PROPERTIES.ensure(dict(self.config), "contacts", definitions)
+        return [field for field in custom_fields if field["name"].lower() in existing]
 
     def contact_upload(self, contact):
         method = "POST"
@@ -360,18 +960,11 @@ class UnifiedSink(HotglueSink):
         resp = request_push(dict(self.config), url, contact, None, method)
         if resp.status_code not in [200, 201, 204]:
             raise Exception(resp.text)
+        self.record_write("contacts", resp.json().get("id"), contact.get("properties"))
         return resp
 
-    def contacts_batch_upload(self):
-        url = f"{self.base_url}/contacts/batch/create"
-        contacts = self.contacts
-        request_push(dict(self.config), url, {"inputs": contacts})
-
-    def process_batch(self, context: dict) -> None:
-        if self.stream_name == "contacts":
-            self.contacts_batch_upload()
-
-    def upload_company(self, record):
+    def company_workflow(self, record):
+        workflow = Workflow()
         method = "POST"
         action = "created"
         mapping = {
@@ -393,16 +986,25 @@ class UnifiedSink(HotglueSink):
             url = f"{url}/{record.get('id')}"
             method = "PATCH"
             action = "updated"
-        res = request_push(
-            dict(self.config), url, {"properties": mapping}, None, method
-        )
-        res = res.json()
-        if "id" in res:
-            self.logger.info(f"Company id:{res['id']}, name:{mapping['name']}  {action}")
-        return True, res.get("id"), {}
+
+        async def upload_company(results):
+            if self.unchanged_write("companies", record.get("id"), mapping):
+                return True, record.get("id"), {}
+            res = await self.workflows.call(
+                request_push, dict(self.config), url, {"properties": mapping}, None, method
+            )
+            res = res.json()
+            self.record_write("companies", res.get("id"), mapping)
+            if "id" in res:
+                self.logger.info(f"Company id:{res['id']}, name:{mapping['name']}  {action}")
+            return True, res.get("id"), {}
+
+        workflow.add("result", upload_company)
+        return workflow
     
 
-    def upload_deal(self, record):
+    def deal_workflow(self, record):
+        workflow = Workflow()
         method = "POST"
         action = "created"
         mapping = {
@@ -439,45 +1041,77 @@ class UnifiedSink(HotglueSink):
             url = f"{url}/{record.get('id')}"
             method = "PATCH"
             action = "updated"
-        res = request_push(
-            dict(self.config), url, {"properties": mapping}, None, method
-        )
-        res = res.json()
-        if "id" in res:
-            self.logger.info(
-                f"Deal id:{res['id']}, name:{mapping['dealname']}  {action}"
+
+        async def upload_deal(results):
+            if self.unchanged_write("deals", record.get("id"), mapping):
+                return {"id": record.get("id")}
+            res = await self.workflows.call(
+                request_push, dict(self.config), url, {"properties": mapping}, None, method
             )
-            if "contact_email" in record:
-                self.upload_deal_contact_association(
-                    res["id"], None, record["contact_email"]
+            res = res.json()
+            self.record_write("deals", res.get("id"), mapping)
+            if "id" in res:
+                self.logger.info(
+                    f"Deal id:{res['id']}, name:{mapping['dealname']}  {action}"
                 )
-            elif "contact_id" in record:
-                self.upload_deal_contact_association(
-                    res["id"], record["contact_id"], None
-                )
-        return True, res.get("id"), {}
+            return res
+
+        async def result(results):
+            return True, results["deal"].get("id"), {}
+
+        workflow.add("deal", upload_deal)
+        workflow.add("result", result, after=["deal"])
+
+        if "contact_email" in record or "contact_id" in record:
+            contact_email = record["contact_email"] if "contact_email" in record else None
+            contact_id = None if "contact_email" in record else record["contact_id"]
+
+            # the contact and association type are resolved while the deal is written
+            async def find_contact(results):
+                return await self.workflows.call(self.find_deal_contact_id, contact_id, contact_email)
+
+            async def find_association_type(results):
+                return await self.workflows.call(self.get_deal_contact_association_type)
+
+            async def associate_contact(results):
+                if "id" in results["deal"]:
+                    await self.workflows.call(
+                        self.upload_deal_contact_association,
+                        results["deal"]["id"],
+                        results["contact"],
+                        results["association_type"],
+                    )
+
+            workflow.add("contact", find_contact)
+            workflow.add("association_type", find_association_type)
+            workflow.add("contact_association", associate_contact, after=["deal", "contact", "association_type"])
+        return workflow
     
 
-    def upload_deal_contact_association(self, deal_id, contact_id, contact_email=None):
-        if contact_email:
+    @PROFILER.timed("lookup")
+    def find_deal_contact_id(self, contact_id, contact_email=None):
+        contacts_index = self.object_index("contacts")
+        if contact_email and contacts_index is not None:
+            matches = contacts_index.get({"email": contact_email})
+            if len(matches) == 1:
+                contact_id = matches[0]["id"]
+        elif contact_email:
             contact_url = f"https://api.hubapi.com/crm/v3/objects/contacts/{contact_email}?idProperty=email"
             resp = request(dict(self.config), contact_url, None)
             if resp.status_code == 200:
                 contact_id = resp.json()["id"]
+        return contact_id
+
+    def get_deal_contact_association_type(self):
+        return ASSOCIATION_TYPES.resolve(dict(self.config), "deals", "contacts")
 
+    @PROFILER.timed("associations")
+    def upload_deal_contact_association(self, deal_id, contact_id, association_type):
         url = f"https://api.hubapi.com/crm/v4/objects/deals/{deal_id}/associations/contact/{contact_id}"
-        url_labels = "https://api.hubapi.com/crm/v4/associations/deals/contacts/labels"
-        res = request_push(dict(self.config), url_labels, None, None, "GET")
-        res = res.json()
-        label = res["results"][0]
-        payload = [
-            {
-                "associationCategory": label["category"],
-                "associationTypeId": label["typeId"],
-            }
-        ]
+        payload = [association_type]
         res = request_push(dict(self.config), url, payload, None, "PUT")
         res = res.json()
+        ASSOCIATED_IDS.add("deals", "contacts", deal_id, contact_id)
         if res is not None:
             self.logger.info(
                 f"Deal id:{deal_id} associated with contact id:{contact_id}"
@@ -485,10 +1119,8 @@ class UnifiedSink(HotglueSink):
         else:
             self.logger.info(res.json())
 
-    def upload_task(self, record):
-        method = "POST"
-        action = "created"
-
+    @PROFILER.timed("preprocess")
+    def build_task(self, record):
         mapping = {
             "hs_timestamp": record.get("end_datetime"),
             "hs_task_body": record.get("description"),
@@ -498,120 +1130,245 @@ class UnifiedSink(HotglueSink):
         }
         if record.get("owner_id"):
             mapping.update({"hubspot_owner_id": record.get("owner_id")})
+        return {"properties": mapping}
+
+    def task_workflow(self, record):
+        workflow = Workflow()
+        config = dict(self.config)
+        method = "POST"
+        action = "created"
+        mapping = self.build_task(record)["properties"]
 
 
+        existing_task = []
         if record.get("id") and self.config.get("only_upsert_empty_fields", False):
-                matched_task = search_task_by_id(dict(self.config), record.get("id"), properties=list(mapping.keys()))
-                if matched_task:
-                    for key in mapping.keys():
-                        if matched_task["properties"].get(key, None) is not None:
-                            mapping[key] = matched_task["properties"][key]
+
+            async def keep_existing_fields(results):
+                matched_task = await self.existing_activity(
+                    "tasks", record.get("id"), list(mapping.keys()), search_task_by_id
+                )
+                self.keep_existing_values(mapping, matched_task)
+
+            existing_task.append(workflow.add("existing_task", keep_existing_fields))
 
         url = f"{self.base_url}/tasks"
         if record.get("id"):
             url = f"{url}/{record.get('id')}"
             method = "PATCH"
             action = "updated"
-        res = request_push(
-            dict(self.config), url, {"properties": mapping}, None, method
-        )
-        res = res.json()
-        if "id" in res:
-            self.logger.info(f"Task id:{res['id']}, name:{mapping['hs_task_subject']}  {action}")
-        return res
 
-    def process_notes(self, record):
-        url = f"{self.base_url}/notes"
+        async def upload_task(results):
+            if self.unchanged_write("tasks", record.get("id"), mapping):
+                return {"id": record.get("id")}
+            res = await self.workflows.call(
+                request_push, config, url, {"properties": mapping}, None, method
+            )
+            res = res.json()
+            self.record_write("tasks", res.get("id"), mapping)
+            if "id" in res:
+                self.logger.info(f"Task id:{res['id']}, name:{mapping['hs_task_subject']}  {action}")
+            return res
+
+        workflow.add("activity", upload_task, after=existing_task)
+        return workflow
+
+    def upsert_notes_batch(self, pending):
+        """
+        Create buffered notes through batch/create with their associations inline, the company
+        and deal names of the whole batch being resolved at once. Notes with an id are
+        updated as workflows.
+        """
+        config = dict(self.config)
+        notes = [entry for entry in pending if not entry["record"].get("id")]
+        updates = [entry for entry in pending if entry["record"].get("id")]
+        if updates:
+            self.run_workflows(updates)
+        if not notes:
+            return
 
+        try:
+            companies = self.find_by_lookup_property_values(
+                "companies", [entry["record"].get("company_name") for entry in notes]
+            )
+            deals = self.find_by_lookup_property_values("deals", [entry["record"].get("deal_name") for entry in notes])
+            company_association_type = deal_association_type = None
+            if any(entry["record"].get("company_id") or entry["record"].get("company_name") for entry in notes):
+                company_association_type = ASSOCIATION_TYPES.resolve(config, "notes", "companies")
+            if any(entry["record"].get("deal_id") or entry["record"].get("deal_name") for entry in notes):
+                deal_association_type = ASSOCIATION_TYPES.resolve(config, "notes", "deals")
+        except Exception as e:
+            for entry in notes:
+                entry["error"] = e
+            return
+
+        writes = []
+        inputs = []
+        for entry in notes:
+            record = entry["record"]
+            try:
+                mapping = self.build_note(record)
+            except Exception as e:
+                entry["error"] = e
+                continue
+            associations, error = self.note_associations(
+                record,
+                companies.get(normalize_lookup_value(record.get("company_name"))),
+                deals.get(normalize_lookup_value(record.get("deal_name"))),
+                company_association_type,
+                deal_association_type,
+            )
+            if error:
+                entry["success"], entry["state_updates"] = False, {"error": error}
+                continue
+            writes.append(entry)
+            inputs.append({"properties": mapping, "associations": associations})
+
+        for start in range(0, len(writes), MAX_BATCH_INPUTS):
+            chunk = writes[start:start + MAX_BATCH_INPUTS]
+            chunk_inputs = [
+                {**batch_input, "objectWriteTraceId": str(index)}
+                for index, batch_input in enumerate(inputs[start:start + MAX_BATCH_INPUTS])
+            ]
+            try:
+                response = request_push(config, f"{self.base_url}/notes/batch/create", {"inputs": chunk_inputs})
+            except Exception as e:
+                # a single invalid input fails the whole call, write one by one to report per record
+                self.logger.warning(f"Batch create of {len(chunk)} notes failed, writing one by one: {e}")
+                self.run_workflows(chunk)
+                continue
+            self.map_batch_create_results(chunk, chunk_inputs, response.json(), "notes")
+
+    @PROFILER.timed("preprocess")
+    def build_note(self, record):
         mapping = {
             "hs_timestamp": int(datetime.fromisoformat(record.get("created_at").replace('Z', '+00:00')).timestamp()*1000),
             "hs_note_body": record.get("content"),
             "hubspot_owner_id": record.get("customer_id")
         }
 
-        mapping = {k: v for k, v in mapping.items() if v is not None}
+        return {k: v for k, v in mapping.items() if v is not None}
 
+    def note_associations(self, record, companies, deals, company_association_type, deal_association_type):
+        """Associations of a note with its company and deal, or the error of a name matching no or several objects."""
         associations = []
 
         if record.get("company_id"):
             associations.append({
                 "to": {"id": record.get("company_id")},
-                "types": [
-                    {
-                        "associationCategory": "HUBSPOT_DEFINED",
-                        "associationTypeId": 190
-                    }
-                ]
+                "types": [company_association_type]
             })
-        
+
         if record.get("company_name"):
-            companies = search_company_by_name(dict(self.config), record.get("company_name"))
             if len(companies) == 1:
                 company = companies[0]
                 associations.append({
                     "to": {"id": company["id"]},
-                    "types": [
-                        {
-                            "associationCategory": "HUBSPOT_DEFINED",
-                            "associationTypeId": 190
-                        }
-                    ]
+                    "types": [company_association_type]
                 })
             elif len(companies) > 1:
-                return False, None, {"error": f"More than one company found for the provided company name"}
+                return None, f"More than one company found for the provided company name"
             else:
-                return False, None, {"error": f"No company found for the provided company name"}
+                return None, f"No company found for the provided company name"
 
         if record.get("deal_id"):
             associations.append({
                 "to": {"id": record.get("deal_id")},
-                "types": [
-                    {
-                        "associationCategory": "HUBSPOT_DEFINED",
-                        "associationTypeId": 214
-                    }
-                ]
+                "types": [deal_association_type]
             })
-        
+
         if record.get("deal_name"):
-            deals = search_deal_by_name(dict(self.config), record.get("deal_name"))
             if len(deals) == 1:
                 deal = deals[0]
                 associations.append({
                     "to": {"id": deal["id"]},
-                    "types": [
-                        {
-                            "associationCategory": "HUBSPOT_DEFINED",
-                            "associationTypeId": 214
-                        }
-                    ]
+                    "types": [deal_association_type]
                 })
             elif len(deals) > 1:
-                return False, None, {"error": f"More than one deal found for the provided deal name"}
+                return None, f"More than one deal found for the provided deal name"
             else:
-                return False, None, {"error": f"No deal found for the provided deal name"}
+                return None, f"No deal found for the provided deal name"
 
-        payload = {"properties": mapping}
-        if associations:
-            payload["associations"] = associations
+        return associations, None
 
-        if record.get("id"):
-            url = f"{url}/{record.get('id')}"
-            method = "PATCH"
-            action = "updated"
-        else:
-            method = "POST"
-            action = "created"
+    def note_workflow(self, record):
+        workflow = Workflow()
+        url = f"{self.base_url}/notes"
+        mapping = self.build_note(record)
 
-        res = request_push(
-            dict(self.config), url, payload, None, method
-        )
-        res = res.json()
-        if "id" in res:
-            self.logger.info(
-                f"Note id:{res['id']}, body:{mapping.get('hs_note_body', '')}  {action}"
+        # company and deal names are resolved concurrently before the note is written
+        lookups = []
+        if record.get("company_name"):
+
+            async def find_companies(results):
+                return await self.workflows.call(
+                    self.find_by_lookup_property, "companies", record.get("company_name"), search_company_by_name
+                )
+
+            lookups.append(workflow.add("companies", find_companies))
+
+        if record.get("deal_name"):
+
+            async def find_deals(results):
+                return await self.workflows.call(
+                    self.find_by_lookup_property, "deals", record.get("deal_name"), search_deal_by_name
+                )
+
+            lookups.append(workflow.add("deals", find_deals))
+
+        # default association types of notes, loaded once per run
+        if record.get("company_id") or record.get("company_name"):
+
+            async def find_company_association_type(results):
+                return await self.workflows.call(ASSOCIATION_TYPES.resolve, dict(self.config), "notes", "companies")
+
+            lookups.append(workflow.add("company_association_type", find_company_association_type))
+
+        if record.get("deal_id") or record.get("deal_name"):
+
+            async def find_deal_association_type(results):
+                return await self.workflows.call(ASSOCIATION_TYPES.resolve, dict(self.config), "notes", "deals")
+
+            lookups.append(workflow.add("deal_association_type", find_deal_association_type))
+
+        async def upload_note(results):
+            associations, error = self.note_associations(
+                record,
+                results.get("companies"),
+                results.get("deals"),
+                results.get("company_association_type"),
+                results.get("deal_association_type"),
             )
-        return True, res.get("id"), {}
+            if error:
+                return False, None, {"error": error}
+
+            payload = {"properties": mapping}
+            if associations:
+                payload["associations"] = associations
+
+            if record.get("id"):
+                if self.unchanged_write("notes", record.get("id"), mapping):
+                    return True, record.get("id"), {}
+                note_url = f"{url}/{record.get('id')}"
+                method = "PATCH"
+                action = "updated"
+            else:
+                note_url = url
+                method = "POST"
+                action = "created"
+
+            res = await self.workflows.call(
+                request_push, dict(self.config), note_url, payload, None, method
+            )
+            res = res.json()
+            self.record_write("notes", res.get("id"), mapping)
+            if "id" in res:
+                self.logger.info(
+                    f"Note id:{res['id']}, body:{mapping.get('hs_note_body', '')}  {action}"
+                )
+            return True, res.get("id"), {}
+
+        workflow.add("result", upload_note, after=lookups)
+        return workflow
 
     def match_field_type_to_type(self, type):
         map_of_types = {
@@ -1,19 +1,38 @@
 import logging
-from datetime import datetime, timedelta
 
-import backoff
 import requests
 from hotglue_etl_exceptions import InvalidCredentialsError, InvalidPayloadError
 
+from target_hubspot_v4.auth import TOKEN_MANAGER
+from target_hubspot_v4.cache import LOOKUP_CACHE, normalize_lookup_value
+from target_hubspot_v4.rate_limit import RATE_LIMITER
+from target_hubspot_v4.retry import RETRY_POLICY
+from target_hubspot_v4.transport import TRANSPORT
+
 logger = logging.getLogger("target-hubspot-v4")
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 
-SESSION = requests.Session()
-
 BASE_URL = "https://api.hubapi.com"
 
+# HubSpot rejects batch calls with more inputs than this
+MAX_BATCH_INPUTS = 100
+# HubSpot search refuses to page past this many results for one query
+SEARCH_RESULTS_CAP = 10000
+
+
+class SearchResultsCapped(Exception):
+    """A search matched more objects than the search API can return."""
+
+
+def send_request(req):
+    """Send a prepared request through the shared transport and rate limiter."""
+    RATE_LIMITER.acquire(req.url)
+    resp = TRANSPORT.send(req)
+    RATE_LIMITER.observe(req.url, resp)
+    return resp
+
 
 def giveup(exc):
     return (
@@ -37,32 +56,52 @@ def on_giveup(details):
     )
 
 
-def acquire_access_token_from_refresh_token(config):
-    payload = {
-        "grant_type": "refresh_token",
-        "redirect_uri": config["redirect_uri"],
-        "refresh_token": config["refresh_token"],
-        "client_id": config["client_id"],
-        "client_secret": config["client_secret"],
-    }
-
-    resp = requests.post(BASE_URL + "/oauth/v1/token", data=payload)
-    cred_errors = ["BAD_CLIENT_ID", "BAD_CLIENT_SECRET", "BAD_REFRESH_TOKEN"]
-    if any(error in resp.text for error in cred_errors):
-        try:
-            error_message = resp.json()["message"]
-        except:
-            error_message = resp.content
-        raise InvalidCredentialsError(error_message)
+def chunk_unique(items, size, key=None):
+    """
+    Split items into chunks of at most `size` items, keeping input order.
+    When `key` is given a new chunk is started whenever the key already
+    appears in the current chunk, as HubSpot rejects batches with duplicate ids.
+    """
+    chunks = []
+    chunk, chunk_keys = [], set()
+    for item in items:
+        item_key = key(item) if key else None
+        if len(chunk) >= size or (item_key is not None and item_key in chunk_keys):
+            chunks.append(chunk)
+            chunk, chunk_keys = [], set()
+        chunk.append(item)
+        if item_key is not None:
+            chunk_keys.add(item_key)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def group_by_shared_keys(items, keys):
+    """
+    Group items that share any of the keys returned by `keys(item)`, directly or
+    through other items. Groups and the items within them keep input order.
+    """
+    parents = list(range(len(items)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    owners = {}
+    for index, item in enumerate(items):
+        for item_key in keys(item):
+            if item_key in owners:
+                parents[find(index)] = find(owners[item_key])
+            else:
+                owners[item_key] = index
 
-    resp.raise_for_status()
-    auth = resp.json()
-    config["access_token"] = auth["access_token"]
-    config["refresh_token"] = auth["refresh_token"]
-    config["token_expires"] = datetime.utcnow() + timedelta(
-        seconds=auth["expires_in"] - 600
-    )
-    logger.info("Token refreshed. Expires at %s", config["token_expires"])
+    groups = {}
+    for index, item in enumerate(items):
+        groups.setdefault(find(index), []).append(item)
+    return list(groups.values())
 
 
 def get_params_and_headers(config, params):
@@ -75,12 +114,7 @@ def get_params_and_headers(config, params):
     params = params or {}
     hapikey = config.get("hapikey")
     if hapikey is None:
-        if (
-            config.get("token_expires") is None
-            or config.get("token_expires") < datetime.utcnow()
-        ):
-            acquire_access_token_from_refresh_token(config)
-        headers = {"Authorization": "Bearer {}".format(config["access_token"])}
+        headers = {"Authorization": "Bearer {}".format(TOKEN_MANAGER.access_token(config))}
     else:
         params["hapikey"] = hapikey
         headers = {}
@@ -132,14 +166,7 @@ def raise_etl_exceptions(response):
             error_message = response.text
         raise InvalidCredentialsError(error_message)
 
-@backoff.on_exception(
-    backoff.constant,
-    (requests.exceptions.RequestException, requests.exceptions.HTTPError),
-    max_tries=5,
-    jitter=None,
-    giveup=giveup,
-    interval=10,
-)
+@RETRY_POLICY.retry(giveup=giveup)
 def request_push(config, url, payload, params=None, method="POST"):
 
     params, headers = get_params_and_headers(config, params)
@@ -148,7 +175,7 @@ def request_push(config, url, payload, params=None, method="POST"):
         method, url, json=payload, headers=headers, params=params
     ).prepare()
     logger.info(f"{method} %s", req.url)
-    resp = SESSION.send(req)
+    resp = send_request(req)
     logger.debug(resp.text)
 
     raise_etl_exceptions(resp)
@@ -165,46 +192,35 @@ def request_push(config, url, payload, params=None, method="POST"):
     return resp
 
 
-@backoff.on_exception(
-    backoff.constant,
-    (requests.exceptions.RequestException, requests.exceptions.HTTPError),
-    max_tries=5,
-    jitter=None,
-    giveup=giveup,
-    on_giveup=on_giveup,
-    interval=10,
-)
+@RETRY_POLICY.retry(giveup=giveup, on_giveup=on_giveup)
 def request(config, url, params=None):
 
     params, headers = get_params_and_headers(config, params)
 
     req = requests.Request("GET", url, params=params, headers=headers).prepare()
     logger.info("GET %s", req.url)
-    resp = SESSION.send(req)
+    resp = send_request(req)
     raise_etl_exceptions(resp)
     resp.raise_for_status()
 
     return resp
 
-@backoff.on_exception(
-    backoff.constant,
-    (requests.exceptions.RequestException, requests.exceptions.HTTPError),
-    max_tries=5,
-    jitter=None,
-    giveup=giveup,
-    on_giveup=on_giveup,
-    interval=10,
-)
+@RETRY_POLICY.retry(giveup=giveup, on_giveup=on_giveup)
 def search_contact_by_email(config, email, properties=[]):
+    cached, contact = LOOKUP_CACHE.get("contacts", {"email": email}, properties)
+    if cached:
+        return contact
     params, headers = get_params_and_headers(config, None)
     url = f"https://api.hubapi.com/crm/v3/objects/contacts/{email}?idProperty=email"
     if properties:
         url += f"&properties={','.join(properties)}"
     req = requests.Request("GET", url, params=params, headers=headers).prepare()
-    response = SESSION.send(req)
+    response = send_request(req)
     if response.status_code == 200:
+        LOOKUP_CACHE.set("contacts", {"email": email}, response.json(), properties)
         return response.json()
     elif response.status_code == 404:
+        LOOKUP_CACHE.set("contacts", {"email": email}, None, properties)
         return None
     else:
         raise_for_status(response)
@@ -222,6 +238,11 @@ def search_objects_by_property(config: dict, object_name: str, properties):
     Returns:
         List of matching objects
     """
+    lookup = {property["property_name"]: property["value"] for property in properties}
+    cached, results = LOOKUP_CACHE.get(object_name, lookup)
+    if cached:
+        return results
+
     params, _headers = get_params_and_headers(config, None)
     filters = {
         "filterGroups": [
@@ -242,16 +263,142 @@ def search_objects_by_property(config: dict, object_name: str, properties):
     raise_for_status(response)
 
     res = response.json()
+    LOOKUP_CACHE.set(object_name, lookup, res.get('results', []))
     return res.get('results', [])
 
 
+def search_objects_by_property_values(config: dict, object_name: str, values_by_property: dict):
+    """
+    Search for CRM objects whose properties are in the given sets of values,
+    using one `IN` filter per property and following pagination. Values are
+    sent normalized like `normalize_lookup_value`, lowercase and trimmed.
+
+    Args:
+        config: Configuration dictionary with authentication details
+        object_name: The type of object to search (e.g., 'contacts', 'companies', 'deals')
+        values_by_property: Dictionary of property name to a list of at most 100 values
+
+    Returns:
+        List of matching objects, with the searched properties included
+
+    Raises:
+        SearchResultsCapped: When more objects match than the search API returns
+    """
+    params, _headers = get_params_and_headers(config, None)
+    payload = {
+        "filterGroups": [
+            {
+                "filters": [
+                    {
+                        "propertyName": property_name,
+                        "operator": "IN",
+                        # IN filters only match string values sent in lowercase
+                        "values": list(dict.fromkeys(normalize_lookup_value(value) for value in values))
+                    }
+                    for property_name, values in values_by_property.items()
+                ]
+            }
+        ],
+        "properties": list(values_by_property.keys()),
+        "limit": 100,
+    }
+    url = f"https://api.hubapi.com/crm/v3/objects/{object_name}/search"
+    results = []
+    while True:
+        response = request_push(config, url, payload, params, "POST")
+        raise_for_status(response)
+        res = response.json()
+        if res.get("total", 0) > SEARCH_RESULTS_CAP:
+            # the results past the cap would be missing, not the objects
+            raise SearchResultsCapped(
+                f"Search of {object_name} matched {res['total']} objects, more than the {SEARCH_RESULTS_CAP} returned"
+            )
+        results.extend(res.get('results', []))
+        after = res.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            return results
+        payload["after"] = after
+
+
+def read_objects_by_unique_property(config: dict, object_name: str, property_name: str, values, properties=None):
+    """
+    Read CRM objects by the values of a unique property (e.g. email) through the
+    batch read endpoint. Values with no matching object are left out of the result.
+
+    Args:
+        config: Configuration dictionary with authentication details
+        object_name: The type of object to read (e.g., 'contacts')
+        property_name: Unique property used as `idProperty`
+        values: List of at most 100 property values
+        properties: Other properties to read
+
+    Returns:
+        List of matching objects, with the unique property included
+    """
+    params, _headers = get_params_and_headers(config, None)
+    payload = {
+        "idProperty": property_name,
+        "inputs": [{"id": value} for value in values],
+        "properties": [property_name] + [name for name in properties or [] if name != property_name],
+    }
+    url = f"https://api.hubapi.com/crm/v3/objects/{object_name}/batch/read"
+    response = request_push(config, url, payload, params, "POST")
+    raise_for_status(response)
+    # values that matched nothing come back in "errors" of a 207 response
+    return response.json().get("results", [])
+
+
+def read_objects_by_ids(config: dict, object_name: str, ids, properties=None):
+    """
+    Read CRM objects by id through the batch read endpoint. Ids with no matching
+    object are left out of the result.
+
+    Args:
+        config: Configuration dictionary with authentication details
+        object_name: The type of object to read (e.g., 'calls')
+        ids: List of at most 100 object ids
+        properties: Properties to read
+
+    Returns:
+        List of matching objects
+    """
+    params, _headers = get_params_and_headers(config, None)
+    payload = {
+        "inputs": [{"id": str(id)} for id in ids],
+        "properties": list(properties or []),
+    }
+    url = f"https://api.hubapi.com/crm/v3/objects/{object_name}/batch/read"
+    response = request_push(config, url, payload, params, "POST")
+    raise_for_status(response)
+    return response.json().get("results", [])
+
+
+def create_associations_batch(config: dict, from_object_name: str, to_object_name: str, inputs):
+    """
+    Create associations between two object types through the v4 batch endpoint.
+
+    Args:
+        config: Configuration dictionary with authentication details
+        from_object_name: Object type the associations start from (e.g., 'deals')
+        to_object_name: Object type the associations point to (e.g., 'contacts')
+        inputs: List of at most 100 {"from": {"id"}, "to": {"id"}, "types": [...]} inputs
+
+    Returns:
+        Response body, with the created pairs in "results" and failures in "errors"
+    """
+    url = f"https://api.hubapi.com/crm/v4/associations/{from_object_name}/{to_object_name}/batch/create"
+    response = request_push(config, url, {"inputs": inputs}, None, "POST")
+    raise_for_status(response)
+    return response.json()
+
+
 def search_call_by_id(config, id, properties=[]):
     params, headers = get_params_and_headers(config, None)
     url = f"https://api.hubapi.com/crm/v3/objects/calls/{id}"
     if properties:
         url += f"?properties={','.join(properties)}"
     req = requests.Request("GET", url, params=params, headers=headers).prepare()
-    response = SESSION.send(req)
+    response = send_request(req)
     if response.status_code == 200:
         return response.json()
     return None
@@ -262,12 +409,15 @@ def search_task_by_id(config, id, properties=[]):
     if properties:
         url += f"?properties={','.join(properties)}"
     req = requests.Request("GET", url, params=params, headers=headers).prepare()
-    response = SESSION.send(req)
+    response = send_request(req)
     if response.status_code == 200:
         return response.json()
     return None
 
 def search_company_by_name(config, name):
+    cached, results = LOOKUP_CACHE.get("companies", {"name": name})
+    if cached:
+        return results
     params, headers = get_params_and_headers(config, None)
     filters = {
         "filterGroups": [
@@ -286,10 +436,14 @@ def search_company_by_name(config, name):
     response = request_push(config, url, filters, params, "POST")
     if response.status_code == 200:
         res = response.json()
+        LOOKUP_CACHE.set("companies", {"name": name}, res['results'])
         return res['results']
     return None
 
 def search_deal_by_name(config, name):
+    cached, results = LOOKUP_CACHE.get("deals", {"dealname": name})
+    if cached:
+        return results
     params, headers = get_params_and_headers(config, None)
     filters = {
         "filterGroups": [
@@ -308,6 +462,7 @@ def search_deal_by_name(config, name):
     response = request_push(config, url, filters, params, "POST")
     if response.status_code == 200:
         res = response.json()
+        LOOKUP_CACHE.set("deals", {"dealname": name}, res['results'])
         return res['results']
     return None
 